@@ -1,4 +1,7 @@
 import os
+import sys
+import mmap
+import hashlib
 import struct
 from enum import Enum
 
@@ -109,119 +112,142 @@ class Dock_FWCT_SegmentInfo: # total: 8 bytes
 # | Dev N ...         |
 # +-------------------+
 
-def parser_fwct_info(imageFile) -> Dock_FWCT_Info:
-    # https://docs.python.org/3/library/struct.html
-    struct_fwctInfo_fmt = ('<') +( # Little-endian, 40Bytes
-        '4s'    # identify, 'F','W','C','T'
-        'H'     # Table size
-        'B'     # Checksum
-        'B'     # FWCT Version
-        'B'     # Digital signalture algorithm
-        'B'     # CDTT Version
-        'H'     # Vendor ID
-        'H'     # Product ID
-        'H'     # Device ID
-        '16s'   # Reserved, 16 bytes
-        'I'     # Composite FW Version
-        'B'     # count of images
-        '3s'    # Padding, 3 bytes
-    )
-    
-    struct_len = struct.calcsize(struct_fwctInfo_fmt)
-    struct_unpack = struct.Struct(struct_fwctInfo_fmt).unpack_from
+# https://docs.python.org/3/library/struct.html
+FWCT_INFO_STRUCT=struct.Struct(('<') +( # Little-endian, 40Bytes
+    '4s'    # identify, 'F','W','C','T'
+    'H'     # Table size
+    'B'     # Checksum
+    'B'     # FWCT Version
+    'B'     # Digital signalture algorithm
+    'B'     # CDTT Version
+    'H'     # Vendor ID
+    'H'     # Product ID
+    'H'     # Device ID
+    '16s'   # Reserved, 16 bytes
+    'I'     # Composite FW Version
+    'B'     # count of images
+    '3s'    # Padding, 3 bytes
+))
+
+FWCT_IMAGE_INFO_STRUCT=struct.Struct(('<') +( # Little-endian, 60Bytes
+    'B'     # Device Type
+    'B'     # Device Image Type
+    'B'     # Component ID
+    'B'     # Row Size indicator
+    '4s'    # Rserved, 4 bytes
+    'I'     # FW Version
+    'I'     # APP Version
+    'I'     # Image fffset
+    'I'     # Image size
+    '32s'   # Image Digest, 32 bytes
+    'B'     # Number of image segments
+    '3s'    # Padding, 3 bytes
+))
+
+FWCT_SEGMENT_INFO_STRUCT=struct.Struct(('<') +( # Little-endian, 8Bytes
+    'B'     # Image ID
+    'B'     # Segment Type
+    'H'     # Segment Start Row
+    'H'     # Segment size, number of row
+    '2s'    # Rserved, 2 bytes
+))
+
+FWCT_SIGNATURE_SIZE_STRUCT=struct.Struct(('<') +( # Little-endian, 2Bytes
+    'H'     # Sigature Size, 2 bytes
+))
+
+FWCT_ROW_UNIT_SIZE=64 # segment size = segment_size * row_size_ind * 64 bytes
+FWCT_STREAM_CHUNK_SIZE=FWCT_ROW_UNIT_SIZE*256 # default fwct_iter_segments() chunk size
+FWCT_CHECKSUM_OFFSET=6 # Dock_FWCT_Info.checksum
+FWCT_HASH_BLOCK_SIZE=1024*1024 # image_digest verification read size
+
+def fwct_table_checksum(table) -> int:
+    """8-bit two's complement checksum of the FWCT table (header..table_size).
+
+    The checksum byte itself is excluded, so a valid table sums to 0 (mod 256).
+    """
+    total=sum(table)-table[FWCT_CHECKSUM_OFFSET]
+    return((-total)&0xFF)
+
+def fwct_decode_fwct_info(data, offset:int=0) -> Dock_FWCT_Info:
+    """Decode Dock_FWCT_Info from a bytes-like object, None when too short or not FWCT."""
+    if len(data)-offset < FWCT_INFO_STRUCT.size: return(None)
+    s = FWCT_INFO_STRUCT.unpack_from(data,offset)
     fw_fwctInfo=Dock_FWCT_Info()
-    
-    with open(imageFile, "rb") as f:
-        data = f.read(struct_len)
-        if not data: return(None)
-        
-        s = struct_unpack(data)
-        # Mapping list to class object
-        fw_fwctInfo.identify     = s[0]
-        fw_fwctInfo.table_size   = s[1]
-        fw_fwctInfo.checksum     = s[2]
-        fw_fwctInfo.fwct_version = s[3]
-        fw_fwctInfo.digSignAlg   = s[4]
-        fw_fwctInfo.cdtt_version = s[5]
-        fw_fwctInfo.vendor_id    = s[6]
-        fw_fwctInfo.product_id   = s[7]
-        fw_fwctInfo.device_id    = s[8]
-        fw_fwctInfo.reserved     = s[9]
-        fw_fwctInfo.composite_version = s[10]
-        fw_fwctInfo.image_count  = s[11]
-        fw_fwctInfo.padding      = s[12]
-    if(fw_fwctInfo.identify.decode('ascii') == FWCT_IDENTIFY_STR):
+    # Mapping list to class object
+    fw_fwctInfo.identify     = s[0]
+    fw_fwctInfo.table_size   = s[1]
+    fw_fwctInfo.checksum     = s[2]
+    fw_fwctInfo.fwct_version = s[3]
+    fw_fwctInfo.digSignAlg   = s[4]
+    fw_fwctInfo.cdtt_version = s[5]
+    fw_fwctInfo.vendor_id    = s[6]
+    fw_fwctInfo.product_id   = s[7]
+    fw_fwctInfo.device_id    = s[8]
+    fw_fwctInfo.reserved     = s[9]
+    fw_fwctInfo.composite_version = s[10]
+    fw_fwctInfo.image_count  = s[11]
+    fw_fwctInfo.padding      = s[12]
+    if(fw_fwctInfo.identify == FWCT_IDENTIFY_STR.encode('ascii')):
         return(fw_fwctInfo)
     else:
         return(None)
+
+def fwct_decode_image_info(data, offset:int=0) -> Dock_FWCT_ImageInfo:
+    """Decode Dock_FWCT_ImageInfo from a bytes-like object, None when too short."""
+    if len(data)-offset < FWCT_IMAGE_INFO_STRUCT.size: return(None)
+    s = FWCT_IMAGE_INFO_STRUCT.unpack_from(data,offset)
+    fw_imageInfo=Dock_FWCT_ImageInfo()
+    # Mapping list to class object
+    fw_imageInfo.device_type  = s[0]
+    fw_imageInfo.image_type   = s[1]
+    fw_imageInfo.component_id = s[2]
+    fw_imageInfo.row_size_ind = s[3]
+    fw_imageInfo.reserv0      = s[4]
+    fw_imageInfo.fw_version   = s[5]
+    fw_imageInfo.app_version  = s[6]
+    fw_imageInfo.image_offset = s[7]
+    fw_imageInfo.image_size   = s[8]
+    fw_imageInfo.image_digest = s[9]
+    fw_imageInfo.num_image_segments = s[10]
+    fw_imageInfo.reserv1      = s[11]
+    return(fw_imageInfo)
+
+def fwct_decode_segment_info(data, offset:int=0) -> Dock_FWCT_SegmentInfo:
+    """Decode Dock_FWCT_SegmentInfo from a bytes-like object, None when too short."""
+    if len(data)-offset < FWCT_SEGMENT_INFO_STRUCT.size: return(None)
+    s = FWCT_SEGMENT_INFO_STRUCT.unpack_from(data,offset)
+    fw_segmentInfo=Dock_FWCT_SegmentInfo()
+    # Mapping list to class object
+    fw_segmentInfo.image_id     = s[0]
+    fw_segmentInfo.image_type   = s[1]
+    fw_segmentInfo.segment_start_row = s[2]
+    fw_segmentInfo.segment_size = s[3]
+    fw_segmentInfo.reserv1      = s[4]
+    return(fw_segmentInfo)
+
+def fwct_segment_bin_size(imageInfo:Dock_FWCT_ImageInfo, segInfo:Dock_FWCT_SegmentInfo) -> int:
+    return(segInfo.segment_size * imageInfo.row_size_ind * FWCT_ROW_UNIT_SIZE)
+
+def parser_fwct_info(imageFile) -> Dock_FWCT_Info:
+    with open(imageFile, "rb") as f:
+        data = f.read(FWCT_INFO_STRUCT.size)
+        if not data: return(None)
+    return(fwct_decode_fwct_info(data))
         
 def parser_image_info(imageFile, offset) -> Dock_FWCT_ImageInfo: 
-    struct_fwctImageInfo_fmt = ('<') +( # Little-endian, 60Bytes
-        'B'     # Device Type
-        'B'     # Device Image Type
-        'B'     # Component ID
-        'B'     # Row Size indicator
-        '4s'    # Rserved, 4 bytes
-        'I'     # FW Version
-        'I'     # APP Version
-        'I'     # Image fffset
-        'I'     # Image size
-        '32s'   # Image Digest, 32 bytes
-        'B'     # Number of image segments
-        '3s'    # Padding, 3 bytes
-    )
-    
-    struct_len = struct.calcsize(struct_fwctImageInfo_fmt)
-    struct_unpack = struct.Struct(struct_fwctImageInfo_fmt).unpack_from
-    fw_imageInfo=Dock_FWCT_ImageInfo()  
-    
     with open(imageFile, "rb") as f:
         f.seek(offset)
-        data = f.read(struct_len)
+        data = f.read(FWCT_IMAGE_INFO_STRUCT.size)
         if not data: return(None)
-        
-        s = struct_unpack(data)
-        # Mapping list to class object
-        fw_imageInfo.device_type  = s[0]
-        fw_imageInfo.image_type   = s[1]
-        fw_imageInfo.component_id = s[2]
-        fw_imageInfo.row_size_ind = s[3]
-        fw_imageInfo.reserv0      = s[4]
-        fw_imageInfo.fw_version   = s[5]
-        fw_imageInfo.app_version  = s[6]
-        fw_imageInfo.image_offset = s[7]
-        fw_imageInfo.image_size   = s[8]
-        fw_imageInfo.image_digest = s[9]
-        fw_imageInfo.num_image_segments = s[10]
-        fw_imageInfo.reserv1      = s[11]
-    return(fw_imageInfo)
+    return(fwct_decode_image_info(data))
    
 def parser_segment_info(imageFile, offset) -> Dock_FWCT_SegmentInfo: 
-    struct_fwctSegmentInfo_fmt = ('<') +( # Little-endian, 8Bytes
-        'B'     # Image ID
-        'B'     # Segment Type
-        'H'     # Segment Start Row
-        'H'     # Segment size, number of row
-        '2s'    # Rserved, 2 bytes
-    )
-    
-    struct_len = struct.calcsize(struct_fwctSegmentInfo_fmt)
-    struct_unpack = struct.Struct(struct_fwctSegmentInfo_fmt).unpack_from
-    fw_segmentInfo=Dock_FWCT_SegmentInfo()  
-    
     with open(imageFile, "rb") as f:
         f.seek(offset)
-        data = f.read(struct_len)
+        data = f.read(FWCT_SEGMENT_INFO_STRUCT.size)
         if not data: return(None)
-        
-        s = struct_unpack(data)
-        # Mapping list to class object
-        fw_segmentInfo.image_id     = s[0]
-        fw_segmentInfo.image_type   = s[1]
-        fw_segmentInfo.segment_start_row = s[2]
-        fw_segmentInfo.segment_size = s[3]
-        fw_segmentInfo.reserv1      = s[4]
-    return(fw_segmentInfo)
+    return(fwct_decode_segment_info(data))
             
         
 def load_fwct_image(imageFile):
@@ -245,18 +271,11 @@ def load_fwct_image(imageFile):
     print("composite_version:",hex(devInfo.composite_version))
     print("Image count:",devInfo.image_count)
     
-    struct_signature_size_fmt = ('<') +( # Little-endian, 2Bytes
-        'H'     # Sigature Size, 2 bytes
-    )
-    
-    struct_len = struct.calcsize(struct_signature_size_fmt)
-    struct_unpack = struct.Struct(struct_signature_size_fmt).unpack_from
-    
     with open(imageFile, "rb") as f:
         f.seek(devInfo.table_size)
-        data = f.read(struct_len)
-        if not data: return(None)
-        s = struct_unpack(data)
+        data = f.read(FWCT_SIGNATURE_SIZE_STRUCT.size)
+        if len(data) < FWCT_SIGNATURE_SIZE_STRUCT.size: return(None)
+        s = FWCT_SIGNATURE_SIZE_STRUCT.unpack_from(data)
 
         Signature_size=s[0]
     
@@ -294,9 +313,10 @@ def load_fwct_image(imageFile):
                     # load bin code
                     with open(imageFile, "rb") as f:
                         f.seek(bincode_offset)
-                        binCodeSize=segInfo.segment_size * imageInfo.row_size_ind * 64
+                        binCodeSize=fwct_segment_bin_size(imageInfo,segInfo)
                         binCode = f.read(binCodeSize)
                         composite_image.append(binCode)
+                        bincode_offset +=binCodeSize
                 else:
                     return(None)    
             
@@ -304,9 +324,284 @@ def load_fwct_image(imageFile):
             return(None) 
         
     return(composite_image)
-    
 
-        
+class FwctImageMap:
+    """Memory-mapped FWCT image parser.
+
+    The file is opened and mapped once, headers are decoded with unpack_from on
+    the mapping and segment payloads are memoryview slices of it, no copies.
+    `composite` has the same layout as the load_fwct_image() list. Views are
+    released by close(), don't use them afterwards.
+
+        with FwctImageMap(imageFile) as fwct:
+            for imageInfo,segments in fwct_get_image_list(fwct.composite): ...
+    """
+
+    def __init__(self, imageFile):
+        self.imageFile=imageFile
+        self.f=None
+        self.mm=None
+        self.views=[]
+        self.composite=None
+
+    def open(self):
+        self.f=open(self.imageFile, "rb")
+        try:
+            self.mm=mmap.mmap(self.f.fileno(),0,access=mmap.ACCESS_READ)
+        except ValueError: # empty file can't be mapped
+            self.close()
+            return(self)
+        except OSError:
+            self.close()
+            raise
+        self.composite=self.parse()
+        return(self)
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        self.views=[]
+        self.composite=None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm=None
+        if self.f is not None:
+            self.f.close()
+            self.f=None
+
+    def __enter__(self):
+        return(self.open())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return(False)
+
+    def view(self, offset:int, size:int) -> memoryview:
+        view=memoryview(self.mm)[offset:offset+size]
+        self.views.append(view)
+        return(view)
+
+    def parse(self) -> list:
+        mm=self.mm
+        devInfo=fwct_decode_fwct_info(mm)
+        if devInfo is None:
+            return(None)
+        composite_image=[devInfo]
+
+        if len(mm)-devInfo.table_size < FWCT_SIGNATURE_SIZE_STRUCT.size:
+            return(None)
+        Signature_size=FWCT_SIGNATURE_SIZE_STRUCT.unpack_from(mm,devInfo.table_size)[0]
+        bincode_offset=devInfo.table_size +  Signature_size + 2
+
+        image_offset=FWCT_DEVICE_INFO_SZIE
+        for imgNum in range(0,devInfo.image_count):
+            imageInfo=fwct_decode_image_info(mm,image_offset)
+            if imageInfo is None:
+                return(None)
+            composite_image.append(imageInfo)
+            image_offset +=FWCT_IMAGE_INFO_SZIE
+            for segNum in range(0,imageInfo.num_image_segments):
+                segInfo=fwct_decode_segment_info(mm,image_offset)
+                if segInfo is None:
+                    return(None)
+                composite_image.append(segInfo)
+                image_offset +=FWCT_SEGMENT_INFO_SZIE
+                binCodeSize=fwct_segment_bin_size(imageInfo,segInfo)
+                if bincode_offset+binCodeSize > len(mm):
+                    return(None) # truncated file
+                composite_image.append(self.view(bincode_offset,binCodeSize))
+                bincode_offset +=binCodeSize
+        return(composite_image)
+
+def load_fwct_image_mmap(imageFile) -> FwctImageMap:
+    """Open imageFile as FwctImageMap, None when it isn't a valid FWCT image.
+
+    Returns:
+        FwctImageMap: opened map, call close() (or use `with`) when done
+    """
+    fwct=FwctImageMap(imageFile).open()
+    if fwct.composite is None:
+        fwct.close()
+        return(None)
+    return(fwct)
+
+def fwct_read_exact(stream, size:int) -> bytes:
+    """Read exactly size bytes from a (possibly non-seekable) stream, None at early EOF."""
+    data=b''
+    while len(data) < size:
+        block=stream.read(size-len(data))
+        if not block:
+            return(None)
+        data +=block
+    return(data)
+
+def fwct_open_stream(source:str, member:str=None):
+    """Open a FWCT image source as a readable binary stream.
+
+    Args:
+        source (str): image path, '-' for stdin, a .gz file or a .zip release archive
+        member (str, optional): member name inside a .zip archive. Defaults to the first *.fwct/*.bin member.
+
+    Returns:
+        readable binary stream, None when no image member found
+
+    Raises:
+        OSError: source can't be opened
+    """
+    import gzip,zipfile # only needed for compressed sources
+    if source == '-':
+        return(sys.stdin.buffer)
+    if source.lower().endswith('.gz'):
+        return(gzip.open(source, "rb"))
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as z: # the member keeps the archive file open
+            if member is None:
+                names=[n for n in z.namelist() if n.lower().endswith(('.fwct','.bin'))]
+                if not names: return(None)
+                member=names[0]
+            try:
+                return(z.open(member))
+            except KeyError: # no such member
+                return(None)
+    return(open(source, "rb"))
+
+def fwct_iter_segments(stream, chunk_size:int=FWCT_STREAM_CHUNK_SIZE):
+    """Yield (image_info, segment_info, chunk) from a FWCT stream.
+
+    The stream is read strictly forward (seek is never used), so an open file,
+    a zip/gzip member or stdin all work. Segment payloads are yielded in chunks
+    of at most chunk_size bytes as soon as they are read; keep chunk_size a
+    multiple of the row size to get row-aligned chunks.
+
+    Args:
+        stream: readable binary stream positioned at the FWCT header
+        chunk_size (int, optional): maximum chunk size. Defaults to FWCT_STREAM_CHUNK_SIZE.
+
+    Yields:
+        tuple: (Dock_FWCT_ImageInfo, Dock_FWCT_SegmentInfo, bytes)
+
+    Raises:
+        ValueError: invalid FWCT header or truncated stream
+    """
+    data=fwct_read_exact(stream,FWCT_INFO_STRUCT.size)
+    devInfo=None if data is None else fwct_decode_fwct_info(data)
+    if devInfo is None:
+        raise ValueError("Invalid FWCT header")
+    if devInfo.table_size < FWCT_DEVICE_INFO_SZIE:
+        raise ValueError("Invalid FWCT table size")
+
+    tables=fwct_read_exact(stream,devInfo.table_size-FWCT_DEVICE_INFO_SZIE+FWCT_SIGNATURE_SIZE_STRUCT.size)
+    if tables is None:
+        raise ValueError("Truncated FWCT table")
+    Signature_size=FWCT_SIGNATURE_SIZE_STRUCT.unpack_from(tables,len(tables)-FWCT_SIGNATURE_SIZE_STRUCT.size)[0]
+
+    layout=[]
+    offset=0
+    for imgNum in range(0,devInfo.image_count):
+        imageInfo=fwct_decode_image_info(tables,offset)
+        if imageInfo is None:
+            raise ValueError("Truncated FWCT image table")
+        offset +=FWCT_IMAGE_INFO_SZIE
+        for segNum in range(0,imageInfo.num_image_segments):
+            segInfo=fwct_decode_segment_info(tables,offset)
+            if segInfo is None:
+                raise ValueError("Truncated FWCT segment table")
+            offset +=FWCT_SEGMENT_INFO_SZIE
+            layout.append((imageInfo,segInfo))
+
+    if fwct_read_exact(stream,Signature_size) is None:
+        raise ValueError("Truncated FWCT signature")
+
+    for imageInfo,segInfo in layout:
+        remain=fwct_segment_bin_size(imageInfo,segInfo)
+        while remain > 0:
+            chunk=stream.read(min(chunk_size,remain))
+            if not chunk:
+                raise ValueError("Truncated FWCT segment")
+            remain -=len(chunk)
+            yield (imageInfo,segInfo,chunk)
+
+def fwct_hash_image(imageFile, imageInfo:Dock_FWCT_ImageInfo, block_size:int=FWCT_HASH_BLOCK_SIZE) -> bytes:
+    """SHA-256 of the image byte range [image_offset, image_offset+image_size).
+
+    The range is read incrementally into one reused buffer, never as a whole.
+    Each call opens its own file handle so calls can run on parallel threads.
+
+    Returns:
+        bytes: 32 bytes digest, None when the file is shorter than the image
+    """
+    sha=hashlib.sha256()
+    buf=bytearray(block_size)
+    view=memoryview(buf)
+    remain=imageInfo.image_size
+    with open(imageFile, "rb") as f:
+        f.seek(imageInfo.image_offset)
+        while remain > 0:
+            n=f.readinto(view[:min(block_size,remain)])
+            if not n:
+                return(None)
+            sha.update(view[:n]) # hashlib releases the GIL for large updates
+            remain -=n
+    return(sha.digest())
+
+def fwct_check_image_digest(imageFile, imageInfo:Dock_FWCT_ImageInfo) -> bool:
+    return(fwct_hash_image(imageFile,imageInfo) == bytes(imageInfo.image_digest))
+
+def fwct_submit_digest_checks(executor, imageFile, images:list) -> dict:
+    """Start image_digest checks on an executor, results can be awaited later.
+
+    Args:
+        executor (concurrent.futures.Executor): thread pool
+        imageFile (str): FWCT image path
+        images (list): Dock_FWCT_ImageInfo list
+
+    Returns:
+        dict: {Dock_FWCT_ImageInfo: Future[bool]}
+    """
+    return({imageInfo:executor.submit(fwct_check_image_digest,imageFile,imageInfo) for imageInfo in images})
+
+def fwct_verify_image_digests(imageFile, images:list=None, max_workers:int=None) -> list:
+    """Verify image_digest of every image on a thread pool.
+
+    Args:
+        imageFile (str): FWCT image path
+        images (list, optional): Dock_FWCT_ImageInfo list. Defaults to the image table of imageFile.
+        max_workers (int, optional): thread count. Defaults to ThreadPoolExecutor default.
+
+    Returns:
+        list: [(Dock_FWCT_ImageInfo, bool), ...], None when imageFile isn't a valid FWCT image
+    """
+    if images is None:
+        fwct=load_fwct_image_mmap(imageFile)
+        if fwct is None:
+            return(None)
+        with fwct:
+            images=[imageInfo for imageInfo,segments in fwct_get_image_list(fwct.composite)]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        checks=fwct_submit_digest_checks(executor,imageFile,images)
+        return([(imageInfo,checks[imageInfo].result()) for imageInfo in images])
+
+def fwct_get_image_list(composite:list)->list:
+    """Group the flat load_fwct_image() list per image.
+
+    Args:
+        composite (list): [Dock_FWCT_Info, Dock_FWCT_ImageInfo, Dock_FWCT_SegmentInfo, binCode, ...]
+
+    Returns:
+        list: [(Dock_FWCT_ImageInfo, [(Dock_FWCT_SegmentInfo, binCode), ...]), ...]
+    """
+    image_list=[]
+    index=1
+    while index < len(composite):
+        imageInfo=composite[index]
+        index +=1
+        segments=[]
+        for segNum in range(0,imageInfo.num_image_segments):
+            segments.append((composite[index],composite[index+1]))
+            index +=2
+        image_list.append((imageInfo,segments))
+    return(image_list)
     
 if __name__ == "__main__":
     import sys
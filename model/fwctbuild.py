@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from model.fwct import *
+
+FWCT_BUILD_COPY_SIZE=1024*1024 # payload copy / hash block size
+FWCT_BUILD_PAD_BYTE=0xFF        # fills a segment up to the next row boundary
+FWCT_BUILD_VERSION=1            # fwct_version written by the builder
+
+class FwctImageSource:
+    """One component image to put into a composite.
+
+    Args:
+        device_type (int): DMC_DEV_TYPE value
+        image_type (int): IMAGE_TYPE value
+        component_id (int): dock component ID
+        row_size_ind (int): row size in FWCT_ROW_UNIT_SIZE units
+        fw_version (int): firmware version
+        app_version (int): application version
+        segments (list): segment binaries, file paths or bytes-like; each becomes one
+            segment, padded with FWCT_BUILD_PAD_BYTE to a whole number of rows
+        start_row (int, optional): row of the first segment, the others follow. Defaults to 0.
+
+    Raises:
+        ValueError: row_size_ind, start_row or a segment size doesn't fit the FWCT fields
+        OSError: a segment file can't be accessed
+    """
+
+    def __init__(self, device_type:int, image_type:int, component_id:int, row_size_ind:int,
+                 fw_version:int, app_version:int, segments:list, start_row:int=0):
+        self.device_type=device_type
+        self.image_type=image_type
+        self.component_id=component_id
+        self.row_size_ind=row_size_ind
+        self.fw_version=fw_version
+        self.app_version=app_version
+        self.segments=list(segments)
+        self.start_row=start_row
+        name="Component %d image_type %d" % (component_id,image_type)
+        if not 1 <= row_size_ind <= 0xFF:
+            raise ValueError("%s: row_size_ind %d not in 1..255" % (name,row_size_ind))
+        if not 0 <= start_row <= 0xFFFF:
+            raise ValueError("%s: start_row %d not in 0..65535" % (name,start_row))
+        for index,(size,padded_size) in enumerate(self.segment_sizes()):
+            if not 0 < padded_size//self.row_size() <= 0xFFFF:
+                raise ValueError("%s: segment %d size %d bytes is not 1..65535 rows" % (name,index,size))
+
+    def row_size(self)->int:
+        return(self.row_size_ind*FWCT_ROW_UNIT_SIZE)
+
+    def segment_sizes(self)->list:
+        """(data size, padded size) of every segment."""
+        sizes=[]
+        for segment in self.segments:
+            n=os.path.getsize(segment) if isinstance(segment,(str,os.PathLike)) else len(segment)
+            row_size=self.row_size()
+            sizes.append((n,(n+row_size-1)//row_size*row_size))
+        return(sizes)
+
+def fwct_iter_segment_blocks(segment, size:int, padded_size:int, block_size:int=FWCT_BUILD_COPY_SIZE):
+    """Yield the padded segment content block by block, files are never read whole."""
+    if isinstance(segment,(str,os.PathLike)):
+        with open(segment, "rb") as f:
+            remain=size
+            while remain > 0:
+                block=f.read(min(block_size,remain))
+                if not block:
+                    raise ValueError("Segment file shrank: %s" % segment)
+                remain -=len(block)
+                yield block
+    else:
+        view=memoryview(segment).cast('B') if isinstance(segment,memoryview) else memoryview(bytes(segment))
+        for pos in range(0,size,block_size):
+            yield view[pos:pos+block_size]
+    if padded_size > size:
+        yield bytes([FWCT_BUILD_PAD_BYTE])*(padded_size-size)
+
+def fwct_digest_image(source:FwctImageSource, block_size:int=FWCT_BUILD_COPY_SIZE)->bytes:
+    """SHA-256 of the padded payload of one image, as stored in image_digest."""
+    sha=hashlib.sha256()
+    for segment,(size,padded_size) in zip(source.segments,source.segment_sizes()):
+        for block in fwct_iter_segment_blocks(segment,size,padded_size,block_size):
+            sha.update(block)
+    return(sha.digest())
+
+class FwctBuilder:
+    """Write FWCT composite images.
+
+    Layout: Dock_FWCT_Info, then per image its Dock_FWCT_ImageInfo followed
+    by its Dock_FWCT_SegmentInfo entries, the signature size and signature,
+    then every segment payload in table order. image_offset is the absolute
+    file offset of the image's first segment.
+
+    Image digests are computed on a thread pool from the sources while the
+    payloads are streamed to the output in FWCT_BUILD_COPY_SIZE blocks. On a
+    seekable output the tables are written last (over a placeholder), so
+    hashing and copying overlap; otherwise the digests are awaited first.
+
+        builder=FwctBuilder(vendor_id=0x2BEF, product_id=0x0415, composite_version=0x01020304)
+        builder.add_image(FwctImageSource(DMC_DEV_TYPE.DMC_DEV_TYPE_AT32F415.value,
+                                          IMAGE_TYPE.IMAGE_TYPE_IMAGE1.value, 0, 2,
+                                          0x00010200, 0x00010200, ["mcu.bin"]))
+        builder.build("dock.fwct")
+
+    Args:
+        vendor_id (int, optional): Defaults to 0.
+        product_id (int, optional): Defaults to 0.
+        device_id (int, optional): Defaults to 0.
+        composite_version (int, optional): Defaults to 0.
+        cdtt_version (int, optional): Defaults to 0.
+        signature (bytes, optional): digital signature data. Defaults to b''.
+        digSignAlg (int, optional): signature algorithm. Defaults to 0.
+        max_workers (int, optional): digest threads. Defaults to ThreadPoolExecutor default.
+    """
+
+    def __init__(self, vendor_id:int=0, product_id:int=0, device_id:int=0, composite_version:int=0,
+                 cdtt_version:int=0, signature:bytes=b'', digSignAlg:int=0, max_workers:int=None):
+        self.vendor_id=vendor_id
+        self.product_id=product_id
+        self.device_id=device_id
+        self.composite_version=composite_version
+        self.cdtt_version=cdtt_version
+        self.signature=bytes(signature)
+        self.digSignAlg=digSignAlg
+        self.max_workers=max_workers
+        self.images=[]
+
+    def add_image(self, source:FwctImageSource):
+        self.images.append(source)
+        return(self)
+
+    def table_size(self)->int:
+        return(FWCT_INFO_STRUCT.size+FWCT_IMAGE_INFO_STRUCT.size*len(self.images)+
+               FWCT_SEGMENT_INFO_STRUCT.size*sum(len(source.segments) for source in self.images))
+
+    def layout(self)->list:
+        """[(source, segment sizes, image_offset, image_size), ...], raise ValueError when invalid."""
+        if not 0 < len(self.images) <= 0xFF:
+            raise ValueError("FWCT needs 1..255 images")
+        if self.table_size() > 0xFFFF:
+            raise ValueError("FWCT table exceeds 65535 bytes")
+        offset=self.table_size()+FWCT_SIGNATURE_SIZE_STRUCT.size+len(self.signature)
+        layout=[]
+        for source in self.images:
+            if not source.segments or len(source.segments) > 0xFF:
+                raise ValueError("Component %d needs 1..255 segments" % source.component_id)
+            sizes=source.segment_sizes()
+            row=source.start_row
+            for size,padded_size in sizes:
+                row +=padded_size//source.row_size()
+            if row > 0xFFFF:
+                raise ValueError("Component %d exceeds 65535 rows" % source.component_id)
+            image_size=sum(padded_size for size,padded_size in sizes)
+            layout.append((source,sizes,offset,image_size))
+            offset +=image_size
+        if offset > 0xFFFFFFFF:
+            raise ValueError("FWCT image exceeds 4 GiB")
+        return(layout)
+
+    def encode_tables(self, layout:list, digests:list)->bytearray:
+        table=bytearray(self.table_size())
+        FWCT_INFO_STRUCT.pack_into(table,0,FWCT_IDENTIFY_STR.encode('ascii'),len(table),0,FWCT_BUILD_VERSION,
+                                   self.digSignAlg,self.cdtt_version,self.vendor_id,self.product_id,self.device_id,
+                                   bytes(16),self.composite_version,len(layout),bytes(3))
+        pos=FWCT_INFO_STRUCT.size
+        for (source,sizes,image_offset,image_size),digest in zip(layout,digests):
+            FWCT_IMAGE_INFO_STRUCT.pack_into(table,pos,source.device_type,source.image_type,source.component_id,
+                                             source.row_size_ind,bytes(4),source.fw_version,source.app_version,
+                                             image_offset,image_size,digest,len(sizes),bytes(3))
+            pos +=FWCT_IMAGE_INFO_STRUCT.size
+            row=source.start_row
+            for size,padded_size in sizes:
+                rows=padded_size//source.row_size()
+                FWCT_SEGMENT_INFO_STRUCT.pack_into(table,pos,source.component_id,source.image_type,row,rows,bytes(2))
+                pos +=FWCT_SEGMENT_INFO_STRUCT.size
+                row +=rows
+        table[FWCT_CHECKSUM_OFFSET]=fwct_table_checksum(table)
+        return(table)
+
+    def write(self, f)->int:
+        """Write the composite to a binary stream.
+
+        Returns:
+            int: bytes written
+        """
+        layout=self.layout()
+        try:
+            seekable=f.seekable()
+        except AttributeError:
+            seekable=False
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures=[executor.submit(fwct_digest_image,source) for source,sizes,image_offset,image_size in layout]
+            if seekable:
+                start=f.tell()
+                f.write(bytes(self.table_size()))
+            else:
+                f.write(self.encode_tables(layout,[future.result() for future in futures]))
+            total=self.table_size()
+            f.write(FWCT_SIGNATURE_SIZE_STRUCT.pack(len(self.signature)))
+            f.write(self.signature)
+            total +=FWCT_SIGNATURE_SIZE_STRUCT.size+len(self.signature)
+            for source,sizes,image_offset,image_size in layout:
+                for segment,(size,padded_size) in zip(source.segments,sizes):
+                    for block in fwct_iter_segment_blocks(segment,size,padded_size):
+                        f.write(block)
+                total +=image_size
+            if seekable:
+                end=f.tell()
+                f.seek(start)
+                f.write(self.encode_tables(layout,[future.result() for future in futures]))
+                f.seek(end)
+        return(total)
+
+    def build(self, output:str)->int:
+        """Write the composite to a file ('-' for stdout); a partial file is removed on failure.
+
+        Returns:
+            int: bytes written, -1 when failed
+        """
+        if output == '-':
+            try:
+                n=self.write(sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+                return(n)
+            except (OSError,ValueError) as ex:
+                print(ex,file=sys.stderr)
+                return(-1)
+        tmp=output+".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                n=self.write(f)
+            os.replace(tmp,output)
+            return(n)
+        except (OSError,ValueError) as ex:
+            print(ex)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return(-1)
+
+def fwct_build_number(value, enum_type=None)->int:
+    """Manifest value: int, "0x.." string or enum_type member name."""
+    if isinstance(value,int):
+        return(value)
+    if enum_type is not None and value in enum_type.__members__:
+        return(enum_type[value].value)
+    return(int(value,0))
+
+def fwct_builder_from_manifest(manifest_file:str)->FwctBuilder:
+    """FwctBuilder of a JSON manifest, segment paths are relative to the manifest.
+
+    {"vendor_id": "0x2BEF", "product_id": "0x0415", "composite_version": "0x01020304",
+     "images": [{"device_type": "DMC_DEV_TYPE_AT32F415", "image_type": "IMAGE_TYPE_IMAGE1",
+                 "component_id": 0, "row_size_ind": 2, "fw_version": "0x00010200",
+                 "app_version": "0x00010200", "segments": ["mcu.bin"]}]}
+    """
+    with open(manifest_file) as f:
+        manifest=json.load(f)
+    base=os.path.dirname(os.path.abspath(manifest_file))
+    header=lambda key: fwct_build_number(manifest.get(key,0))
+    builder=FwctBuilder(header('vendor_id'),header('product_id'),header('device_id'),
+                        header('composite_version'),header('cdtt_version'))
+    for image in manifest['images']:
+        field=lambda key: fwct_build_number(image.get(key,0))
+        builder.add_image(FwctImageSource(fwct_build_number(image['device_type'],DMC_DEV_TYPE),
+                                          fwct_build_number(image['image_type'],IMAGE_TYPE),
+                                          field('component_id'),field('row_size_ind'),
+                                          field('fw_version'),field('app_version'),
+                                          [os.path.join(base,path) for path in image['segments']],
+                                          field('start_row')))
+    return(builder)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        try:
+            builder=fwct_builder_from_manifest(sys.argv[1])
+        except (OSError,ValueError,KeyError) as ex:
+            print("<ERROR> Invalid manifest:",ex)
+            sys.exit(2)
+        n=builder.build(sys.argv[2])
+        if n < 0:
+            sys.exit(1)
+        if sys.argv[2] != '-':
+            print("[INFO] FWCT image:",sys.argv[2],n,"bytes")
+        sys.exit(0)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.fwctbuild <manifest.json> <output.fwct|->")
+        sys.exit(1)
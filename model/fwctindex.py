@@ -0,0 +1,232 @@
+import os
+import sys
+import sqlite3
+from model.fwct import *
+
+FWCT_INDEX_EXTENSIONS=('.fwct','.bin')
+FWCT_INDEX_SCHEMA_VERSION=1
+
+FWCT_INDEX_SCHEMA='''
+CREATE TABLE IF NOT EXISTS files(
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    valid INTEGER NOT NULL,         -- 0: not a FWCT image, kept so it isn't parsed again
+    vendor_id INTEGER,
+    product_id INTEGER,
+    device_id INTEGER,
+    composite_version INTEGER,
+    fwct_version INTEGER,
+    image_count INTEGER,
+    checksum_ok INTEGER
+);
+CREATE TABLE IF NOT EXISTS images(
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    image_index INTEGER NOT NULL,
+    device_type INTEGER NOT NULL,
+    image_type INTEGER NOT NULL,
+    component_id INTEGER NOT NULL,
+    row_size_ind INTEGER NOT NULL,
+    fw_version INTEGER NOT NULL,
+    app_version INTEGER NOT NULL,
+    image_offset INTEGER NOT NULL,
+    image_size INTEGER NOT NULL,
+    image_digest BLOB NOT NULL,
+    num_image_segments INTEGER NOT NULL,
+    PRIMARY KEY(file_id, image_index)
+);
+CREATE INDEX IF NOT EXISTS files_product ON files(vendor_id, product_id, composite_version);
+CREATE INDEX IF NOT EXISTS images_device ON images(device_type, fw_version);
+CREATE INDEX IF NOT EXISTS images_digest ON images(image_digest);
+'''
+
+def fwct_read_tables(imageFile) -> tuple:
+    """Read only the FWCT table region of a file, without printing.
+
+    Returns:
+        tuple: (Dock_FWCT_Info, [Dock_FWCT_ImageInfo, ...], checksum_ok), None when not a FWCT image
+    """
+    with open(imageFile, "rb") as f:
+        head=f.read(FWCT_INFO_STRUCT.size)
+        fwctInfo=fwct_decode_fwct_info(head)
+        if fwctInfo is None or fwctInfo.table_size < FWCT_INFO_STRUCT.size:
+            return(None)
+        table=head+f.read(fwctInfo.table_size-len(head))
+    if len(table) < fwctInfo.table_size:
+        return(None)
+    images=[]
+    offset=FWCT_INFO_STRUCT.size
+    for imgNum in range(0,fwctInfo.image_count):
+        imageInfo=fwct_decode_image_info(table,offset)
+        if imageInfo is None:
+            return(None)
+        images.append(imageInfo)
+        offset +=FWCT_IMAGE_INFO_STRUCT.size+FWCT_SEGMENT_INFO_STRUCT.size*imageInfo.num_image_segments
+    if offset > len(table):
+        return(None)
+    return((fwctInfo,images,fwct_table_checksum(table)==fwctInfo.checksum))
+
+class FwctIndex:
+    """SQLite index of the FWCT images below one or more directories.
+
+    scan() only parses files whose size or mtime changed since the last scan,
+    and only their table region. Lookups are indexed queries:
+
+        with FwctIndex("fwct.db") as index:
+            index.scan("/mnt/release")
+            path=index.find_latest(0x2BEF, 0x0415, DMC_DEV_TYPE.DMC_DEV_TYPE_AT32F415.value)
+
+    Args:
+        db_file (str): SQLite database path, ':memory:' for a throwaway index
+    """
+
+    def __init__(self, db_file:str):
+        self.db_file=db_file
+        self.db=None
+
+    def open(self):
+        if self.db is None:
+            self.db=sqlite3.connect(self.db_file)
+            self.db.row_factory=sqlite3.Row
+            self.db.execute("PRAGMA foreign_keys=ON")
+            self.db.execute("PRAGMA journal_mode=WAL")
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != FWCT_INDEX_SCHEMA_VERSION:
+                self.db.executescript("DROP TABLE IF EXISTS images; DROP TABLE IF EXISTS files;")
+                self.db.execute("PRAGMA user_version=%d" % FWCT_INDEX_SCHEMA_VERSION)
+            self.db.executescript(FWCT_INDEX_SCHEMA)
+        return(self)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db=None
+
+    def __enter__(self):
+        return(self.open())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return(False)
+
+    def iter_files(self, root:str, extensions:tuple):
+        """Yield (path, stat) of candidate files below root."""
+        stack=[root]
+        while stack:
+            try:
+                entries=list(os.scandir(stack.pop()))
+            except OSError as ex:
+                print(ex)
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    try:
+                        yield (os.path.abspath(entry.path),entry.stat())
+                    except OSError:
+                        continue
+
+    def add_file(self, path:str, st):
+        tables=None
+        try:
+            tables=fwct_read_tables(path)
+        except OSError as ex:
+            print(ex)
+        self.db.execute("DELETE FROM files WHERE path=?",(path,))
+        if tables is None:
+            self.db.execute("INSERT INTO files(path,size,mtime_ns,valid) VALUES(?,?,?,0)",(path,st.st_size,st.st_mtime_ns))
+            return(False)
+        fwctInfo,images,checksum_ok=tables
+        cur=self.db.execute("INSERT INTO files(path,size,mtime_ns,valid,vendor_id,product_id,device_id,"
+                            "composite_version,fwct_version,image_count,checksum_ok) VALUES(?,?,?,1,?,?,?,?,?,?,?)",
+                            (path,st.st_size,st.st_mtime_ns,fwctInfo.vendor_id,fwctInfo.product_id,fwctInfo.device_id,
+                             fwctInfo.composite_version,fwctInfo.fwct_version,fwctInfo.image_count,int(checksum_ok)))
+        self.db.executemany("INSERT INTO images VALUES(?,?,?,?,?,?,?,?,?,?,?,?)",
+                            [(cur.lastrowid,index,i.device_type,i.image_type,i.component_id,i.row_size_ind,
+                              i.fw_version,i.app_version,i.image_offset,i.image_size,bytes(i.image_digest),
+                              i.num_image_segments) for index,i in enumerate(images)])
+        return(True)
+
+    def scan(self, root:str, extensions:tuple=FWCT_INDEX_EXTENSIONS)->dict:
+        """Bring the index of root up to date.
+
+        Returns:
+            dict: {'added','updated','removed','unchanged','invalid'} file counts, every file is counted once
+        """
+        self.open()
+        stats={'added':0,'updated':0,'removed':0,'unchanged':0,'invalid':0}
+        prefix=os.path.join(os.path.abspath(root),'')
+        known={row['path']:(row['size'],row['mtime_ns']) for row in
+               self.db.execute("SELECT path,size,mtime_ns FROM files WHERE substr(path,1,?)=?",(len(prefix),prefix))}
+        with self.db:
+            for path,st in self.iter_files(root,tuple(extensions)):
+                old=known.pop(path,None)
+                if old == (st.st_size,st.st_mtime_ns):
+                    stats['unchanged'] +=1
+                    continue
+                if self.add_file(path,st):
+                    stats['added' if old is None else 'updated'] +=1
+                else:
+                    stats['invalid'] +=1
+            self.db.executemany("DELETE FROM files WHERE path=?",[(path,) for path in known])
+            stats['removed']=len(known)
+        return(stats)
+
+    def find(self, vendor_id:int=None, product_id:int=None, device_type:int=None, component_id:int=None,
+             fw_version:int=None, limit:int=None, include_corrupt:bool=False)->list:
+        """Images matching every given field, newest composite first.
+
+        Args:
+            include_corrupt (bool, optional): also return composites whose table checksum
+                doesn't match. Defaults to False.
+
+        Returns:
+            list: sqlite3.Row with the files and images columns
+        """
+        where=["f.valid=1"]
+        if not include_corrupt:
+            where.append("f.checksum_ok=1")
+        args=[]
+        for column,value in (("f.vendor_id",vendor_id),("f.product_id",product_id),("i.device_type",device_type),
+                             ("i.component_id",component_id),("i.fw_version",fw_version)):
+            if value is not None:
+                where.append(column+"=?")
+                args.append(value)
+        sql=("SELECT f.*,i.* FROM files f JOIN images i ON i.file_id=f.id WHERE "+" AND ".join(where)+
+             " ORDER BY f.composite_version DESC, f.mtime_ns DESC, i.image_index")
+        if limit is not None:
+            sql +=" LIMIT %d" % int(limit)
+        return(self.db.execute(sql,args).fetchall())
+
+    def find_latest(self, vendor_id:int, product_id:int, device_type:int=None, include_corrupt:bool=False)->str:
+        """Path of the newest intact composite (composite_version) for vendor/product containing device_type."""
+        rows=self.find(vendor_id,product_id,device_type,limit=1,include_corrupt=include_corrupt)
+        return(rows[0]['path'] if rows else None)
+
+    def find_digest(self, image_digest:bytes)->list:
+        """Paths of the composites containing an image with this digest."""
+        return([row[0] for row in self.db.execute(
+            "SELECT DISTINCT f.path FROM files f JOIN images i ON i.file_id=f.id WHERE i.image_digest=?",
+            (bytes(image_digest),))])
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "scan":
+        with FwctIndex(sys.argv[2]) as index:
+            print(index.scan(sys.argv[3]))
+    elif len(sys.argv) in (5,6) and sys.argv[1] == "latest":
+        with FwctIndex(sys.argv[2]) as index:
+            device_type=None
+            if len(sys.argv) == 6:
+                name=sys.argv[5]
+                device_type=DMC_DEV_TYPE[name].value if name in DMC_DEV_TYPE.__members__ else int(name,0)
+            path=index.find_latest(int(sys.argv[3],0),int(sys.argv[4],0),device_type)
+        if path is None:
+            print("<ERROR> No matching FWCT image.")
+            sys.exit(1)
+        print(path)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.fwctindex scan <index.db> <dir>")
+        print("\t python -m model.fwctindex latest <index.db> <vid> <pid> [device_type]")
+        sys.exit(1)
@@ -0,0 +1,149 @@
+# pip install numpy
+import numpy as np
+from model.fwct import *
+
+# NumPy structured dtypes, same layouts as FWCT_*_STRUCT (packed, little-endian)
+FWCT_INFO_DTYPE=np.dtype([          # 40 bytes
+    ('identify',    'S4'),
+    ('table_size',  '<u2'),
+    ('checksum',    'u1'),
+    ('fwct_version','u1'),
+    ('digSignAlg',  'u1'),
+    ('cdtt_version','u1'),
+    ('vendor_id',   '<u2'),
+    ('product_id',  '<u2'),
+    ('device_id',   '<u2'),
+    ('reserved',    'V16'),
+    ('composite_version','<u4'),
+    ('image_count', 'u1'),
+    ('padding',     'V3'),
+])
+
+FWCT_IMAGE_INFO_DTYPE=np.dtype([    # 60 bytes
+    ('device_type', 'u1'),
+    ('image_type',  'u1'),
+    ('component_id','u1'),
+    ('row_size_ind','u1'),
+    ('reserv0',     'V4'),
+    ('fw_version',  '<u4'),
+    ('app_version', '<u4'),
+    ('image_offset','<u4'),
+    ('image_size',  '<u4'),
+    ('image_digest','V32'),
+    ('num_image_segments','u1'),
+    ('reserv1',     'V3'),
+])
+
+FWCT_SEGMENT_INFO_DTYPE=np.dtype([  # 8 bytes
+    ('image_id',    'u1'),
+    ('image_type',  'u1'),
+    ('segment_start_row','<u2'),
+    ('segment_size','<u2'),
+    ('reserv1',     'V2'),
+])
+
+FWCT_NSEG_OFFSET=56 # Dock_FWCT_ImageInfo.num_image_segments
+
+def fwctnp_checksum(table:np.ndarray) -> int:
+    """Vectorized fwct_table_checksum() over a uint8 table array."""
+    total=int(table.sum(dtype=np.uint64))-int(table[FWCT_CHECKSUM_OFFSET])
+    return((-total)&0xFF)
+
+def fwctnp_decode_tables(data) -> dict:
+    """Decode the whole FWCT table region into NumPy structured arrays.
+
+    Image records are gathered with one fancy-indexing operation and viewed as
+    FWCT_IMAGE_INFO_DTYPE, segments likewise; fields are column arrays, e.g.
+    tables['images']['fw_version']. Only the image record offsets are walked in
+    Python (they depend on the previous image's segment count).
+
+    Args:
+        data: bytes-like object starting at the FWCT header, at least table_size bytes
+
+    Returns:
+        dict: {'header': record, 'images': array, 'segments': array,
+               'segment_image': image index per segment, 'checksum': computed checksum,
+               'checksum_ok': bool}, None when not a valid FWCT table
+    """
+    raw=np.frombuffer(data,dtype=np.uint8)
+    if raw.size < FWCT_DEVICE_INFO_SZIE:
+        return(None)
+    header=raw[:FWCT_DEVICE_INFO_SZIE].view(FWCT_INFO_DTYPE)[0]
+    if header['identify'] != FWCT_IDENTIFY_STR.encode('ascii'):
+        return(None)
+    table_size=int(header['table_size'])
+    if raw.size < table_size:
+        return(None)
+    table=raw[:table_size]
+
+    image_count=int(header['image_count'])
+    image_offsets=np.empty(image_count,dtype=np.int64)
+    offset=FWCT_DEVICE_INFO_SZIE
+    for index in range(0,image_count):
+        if offset+FWCT_IMAGE_INFO_SZIE > table_size:
+            return(None)
+        image_offsets[index]=offset
+        offset +=FWCT_IMAGE_INFO_SZIE+FWCT_SEGMENT_INFO_SZIE*int(table[offset+FWCT_NSEG_OFFSET])
+    if offset > table_size:
+        return(None)
+
+    image_index=image_offsets[:,None]+np.arange(FWCT_IMAGE_INFO_SZIE)
+    images=table[image_index].reshape(-1).view(FWCT_IMAGE_INFO_DTYPE)
+
+    nseg=images['num_image_segments'].astype(np.int64)
+    segment_image=np.repeat(np.arange(image_count),nseg)
+    # k-th segment of its image: position minus the first position of that image
+    first=np.repeat(np.cumsum(nseg)-nseg,nseg)
+    seg_k=np.arange(segment_image.size)-first
+    segment_offsets=image_offsets[segment_image]+FWCT_IMAGE_INFO_SZIE+FWCT_SEGMENT_INFO_SZIE*seg_k
+    segment_index=segment_offsets[:,None]+np.arange(FWCT_SEGMENT_INFO_SZIE)
+    segments=table[segment_index].reshape(-1).view(FWCT_SEGMENT_INFO_DTYPE)
+
+    checksum=fwctnp_checksum(table)
+    return({'header':header,
+            'images':images,
+            'segments':segments,
+            'segment_image':segment_image,
+            'checksum':checksum,
+            'checksum_ok':checksum==int(header['checksum'])})
+
+def fwctnp_load_tables(imageFile) -> dict:
+    """fwctnp_decode_tables() on an image file, reads only the table region."""
+    with open(imageFile, "rb") as f:
+        data=f.read(FWCT_DEVICE_INFO_SZIE)
+        if len(data) < FWCT_DEVICE_INFO_SZIE:
+            return(None)
+        table_size=FWCT_INFO_STRUCT.unpack_from(data)[1]
+        data +=f.read(max(0,table_size-FWCT_DEVICE_INFO_SZIE))
+    return(fwctnp_decode_tables(data))
+
+def fwctnp_audit(imageFiles:list) -> dict:
+    """Image tables of many FWCT files as one set of column arrays.
+
+    Returns:
+        dict: column name -> array over all images of all files, plus 'file_index'
+              and per-file 'checksum_ok'; invalid files are listed in 'invalid'
+    """
+    image_arrays=[]
+    file_index=[]
+    checksum_ok=np.zeros(len(imageFiles),dtype=bool)
+    invalid=[]
+    for index,imageFile in enumerate(imageFiles):
+        tables=fwctnp_load_tables(imageFile)
+        if tables is None:
+            invalid.append(imageFile)
+            continue
+        image_arrays.append(tables['images'])
+        file_index.append(np.full(tables['images'].size,index,dtype=np.int32))
+        checksum_ok[index]=tables['checksum_ok']
+    if image_arrays:
+        images=np.concatenate(image_arrays)
+        files=np.concatenate(file_index)
+    else:
+        images=np.zeros(0,dtype=FWCT_IMAGE_INFO_DTYPE)
+        files=np.zeros(0,dtype=np.int32)
+    columns={name:images[name] for name in FWCT_IMAGE_INFO_DTYPE.names if not name.startswith('reserv')}
+    columns['file_index']=files
+    columns['checksum_ok']=checksum_ok
+    columns['invalid']=invalid
+    return(columns)
@@ -1,127 +1,119 @@
 # pip install pyusb,libusb,libusb-package
 # pip install pyocd
 # brew install hidapi
-import usb.core
-import libusb_package
-from usb.backend import libusb1
-import hid
 from enum import Enum,unique,auto
 import time
+import collections
+from model.qhiddef import *
+from model.qhidcodec import *
 
-HID_PACKET_SIZE_MAX=64
-HID_PACKET_PADLOAD_SIZE=HID_PACKET_SIZE_MAX-4
-HID_RID_OFFSET=0
-HID_CMD_OFFSET=1
-HID_ACT_OFFSET=2
-HID_RSP_OFFSET=3
-HID_DATA_OFFSET=4
-
-HID_READ_TIMEOUT=500 # unit:ms
-
-# Format:
-# HID[0]: Report ID
-# HID[1]: Command Code
-# HID[2]: Action Code
-# HID[3]: Response Code
-# HID[4...63]: Payload data
-# 
-
-@unique
-class HID_REPORID_TYPE(Enum):
-    RID_UNKNOWN=0
-    RID_SYS    =1
-    RID_FW     =2
-    RID_BUSIO  =3
-
-@unique
-class HID_SYSCMD_TYPE(Enum):
-    SYS_CMD_UNKNOWN                 =0
-    SYS_CMD_PING                    =1
-    SYS_CMD_GET_COMPONENT_ID_LIST   =2
-    SYS_CMD_GET_COMPONENT_FWVER     =3
-    SYS_CMD_GET_SN                  =4
-    SYS_CMD_SET_SN                  =5
-    SYS_CMD_GET_UID                 =6
-    SYS_CMD_RESET                   =7
-    SYS_CMD_RESET_TO_ROM            =8
-    SYS_CMD_RESET_TO_BOOTLOAD       =9
-    SYS_CMD_MAX                     =10
-
-@unique
-class HID_FWCMD_TYPE(Enum):
-    FW_CMD_UNKNOWN      =0
-    FW_CMD_HW_CFG       =1
-    FW_CMD_PROJECT_CFG  =2
-    FW_CMD_FW_UPDATE    =3
-    FW_CMD_MAX          =4
-    
-@unique
-class HID_IOBUSCMD_TYPE(Enum):
-    IOBUS_CMD_UNKNOWN   =0
-    IOBUS_CMD_GPIO      =1
-    IOBUS_CMD_I2C       =2
-    IOBUS_CMD_SPI       =3 # included spi flash command access
-    IOBUS_CMD_SPI_FLASH =4 # for spi flash high level access, sector program, write
-    IOBUS_CMD_PWM       =5
-    IOBUS_CMD_ADC       =6
-    IOBUS_CMD_UART      =7
-    IOBUS_CMD_MAX       =9
-
-@unique
-class HID_FWACT_TYPE(Enum):
-    FW_ACT_UNKNOWN          =0
-    FW_ACT_RESET            =1 # reset state machine
-    FW_ACT_START_UPDATE     =2 # start FW update
-    FW_ACT_CHECK_FWCT       =3 # check fwtab
-    FW_ACT_INIT             =4 # Request FW update
-    FW_ACT_PREPARE_UPDATE   =5 # Request FW update
-    FW_ACT_READ             =6 # Read data from buffer
-    FW_ACT_WRITE            =7 # write buffer to component
-    FW_ACT_RBUF             =8 # Read data from compoent to buffer
-    FW_ACT_WBUF             =9 # Write data to buffer
-    FW_ACT_UPDATE_FINISH    =10 # completed update
-    FW_ACT_STATUS           =11 # Get status
-    FW_ACT_INFO             =12        
-    FW_ACT_MAX              =13  
-
-@unique
-class HID_IOBUSACT_TYPE(Enum):
-    IOBUS_ACT_UNKNOWN       =0
-    IOBUS_ACT_INIT          =1
-    IOBUS_ACT_DEINIT        =2
-    IOBUS_ACT_READ          =3
-    IOBUS_ACT_WRITE         =4
-    IOBUS_ACT_TOGGLE        =5
-    IOBUS_ACT_MEM_READ      =6 # for I2C device memory read mode
-    IOBUS_ACT_MEM_WRITE     =7 # for I2C device memory write mode
-    IOBUS_ACT_PROBE         =8 # for I2C device probe
-    IOBUS_ACT_DUTY          =9 # for configure pwm dutycycle
-    IOBUS_ACT_FREQ          =10 # for configure pwm frequency
-    IOBUS_ACT_FLASH         =11 # for SPI FLASH access through IOBUS_SPI
-    IOBUS_ACT_FLASH_BWRITE  =12 # flash write from buffer (buffer -> flash)
-    IOBUS_ACT_FLASH_BREAD   =13 # flash read from flash to buffer (flash -> buffer)
-    IOBUS_ACT_FLASH_WBUF    =14 # flash data write to buffer (host -> buffer)
-    IOBUS_ACT_FLASH_RBUF    =15 # flash data read to buffer (flash -> buffer)   
-    IOBUS_ACT_MAX           =16 
-    
-@unique
-class HID_APIRESPONE_TYPE(Enum):
-    HIDAPI_UNKNOWN=0
-    HIDAPI_INIT=0x55
-    # Response code
-    HIDAPI_ACK=0xAA     # completed
-    HIDAPI_NACK=0x5A    # failed
-    HIDAPI_WAIT=0xBB    #   
-    HIDAPI_DEFER=0xDF   # indicate API call defer need to check it later.
-    HIDAPI_REENUM=0xF0  # indicate host need to check dock reenum    
+# USB backends are loaded by hidapi_load() on first device access, so importing
+# this module (and the tools built on it) doesn't load hidapi or libusb.
+hid=None                # hid module
+HID_USB_BACKEND=None    # pyusb libusb1 backend, resolved once per process
+
+def hidapi_load_usb_backend():
+    """Resolve the pyusb libusb1 backend, once per process.
+
+    Returns:
+        usb.backend.libusb1._LibUSB: backend, None when libusb isn't found
+    """
+    global HID_USB_BACKEND
+    if HID_USB_BACKEND is None:
+        import libusb_package
+        from usb.backend import libusb1
+        HID_USB_BACKEND=libusb1.get_backend(find_library=libusb_package.find_library)
+    return(HID_USB_BACKEND)
+
+def hidapi_load():
+    """Import hid and resolve the libusb backend, once per process.
+
+    Returns:
+        module: the hid module (hid.device, hid.enumerate)
+    """
+    global hid
+    if hid is None:
+        hidapi_load_usb_backend()
+        import hid as hid_module
+        hid=hid_module
+    return(hid)
+
+# Transports: objects with the `hid` module interface, device() returning a
+# hid.device compatible handle and enumerate(vendor_id, product_id). Sessions
+# and registries name their transport; None is HID_TRANSPORT_DEFAULT.
+#   hidapi: hid.device, one synchronous report at a time (qhidapi.hid, also the simulator)
+#   libusb: HID interface claimed through pyusb/libusb1, several interrupt
+#           transfers queued in each direction (model.qhidusb)
+HID_TRANSPORT_HIDAPI="hidapi"
+HID_TRANSPORT_LIBUSB="libusb"
+HID_TRANSPORT_DEFAULT=HID_TRANSPORT_HIDAPI
+
+def hidapi_load_libusb_transport():
+    from model.qhidusb import hidusb_load
+    return(hidusb_load())
+
+HID_TRANSPORTS={
+    HID_TRANSPORT_HIDAPI: hidapi_load,
+    HID_TRANSPORT_LIBUSB: hidapi_load_libusb_transport,
+}
+
+def hidapi_add_transport(name:str, loader):
+    """Register a transport, loader() returns the transport object."""
+    HID_TRANSPORTS[name]=loader
+
+def hidapi_set_default_transport(name:str):
+    global HID_TRANSPORT_DEFAULT
+    if name not in HID_TRANSPORTS:
+        raise ValueError("unknown transport: %s" % name)
+    HID_TRANSPORT_DEFAULT=name
+
+def hidapi_get_transport(name:str=None):
+    """Transport object of name, loaded on first use; raise IOError when unknown."""
+    loader=HID_TRANSPORTS.get(name or HID_TRANSPORT_DEFAULT)
+    if loader is None:
+        raise IOError("unknown transport: %s" % name)
+    return(loader())
+
+# Response hooks, hook(session, cmd, act, hid_data) is called after every command
+# sent by HidSession/AsyncHidDevice. hid_data is None on IO error or timeout.
+HID_RESPONSE_HOOKS=[]
+
+def hidapi_add_response_hook(hook):
+    if hook not in HID_RESPONSE_HOOKS:
+        HID_RESPONSE_HOOKS.append(hook)
+
+def hidapi_remove_response_hook(hook):
+    if hook in HID_RESPONSE_HOOKS:
+        HID_RESPONSE_HOOKS.remove(hook)
+
+def hidapi_call_response_hooks(session, cmd:Enum, act:Enum, hid_data:list):
+    for hook in HID_RESPONSE_HOOKS:
+        hook(session,cmd,act,hid_data)
+
+# Transaction hooks, hook(session, hid_pkt, hid_data, seconds) is called for every
+# report written by HidSession/AsyncHidDevice once its response arrived (or not):
+# hid_data is [] on timeout and None on IO error, seconds is write-to-response time.
+# Nothing is timed while the list is empty.
+HID_TRANSACTION_HOOKS=[]
+
+def hidapi_add_transaction_hook(hook):
+    if hook not in HID_TRANSACTION_HOOKS:
+        HID_TRANSACTION_HOOKS.append(hook)
+
+def hidapi_remove_transaction_hook(hook):
+    if hook in HID_TRANSACTION_HOOKS:
+        HID_TRANSACTION_HOOKS.remove(hook)
+
+def hidapi_call_transaction_hooks(session, hid_pkt:list, hid_data:list, seconds:float):
+    for hook in HID_TRANSACTION_HOOKS:
+        hook(session,hid_pkt,hid_data,seconds)
 
 def hidapi_find_device(vid:int =0, pid:int =0)->list:
     dev_list=[]
     try:
-        backend =libusb1.get_backend(find_library=libusb_package.find_library)
         #dev_list=hid.enumerate(vendor_id=vid,product_id=pid)
         
-        for device_dict in hid.enumerate(vendor_id=vid,product_id=pid):
+        for device_dict in hidapi_load().enumerate(vendor_id=vid,product_id=pid):
             if device_dict['bus_type']==1: # 1: USB
                 dev_list.append(device_dict)
                 keys = list(device_dict.keys())
@@ -141,6 +133,7 @@ def hidapi_get_device_information(vid:int, pid:int, serial_number=None)->list:
     Args:
         vid (int): _description_
         pid (int): _description_
+        serial_number (str, optional): open this dock instead of the first vid/pid match. Defaults to None.
 
     Returns:
         list: _description_
@@ -148,10 +141,8 @@ def hidapi_get_device_information(vid:int, pid:int, serial_number=None)->list:
     info=[]
     
     try:
-        backend =libusb1.get_backend(find_library=libusb_package.find_library)
-        
-        h = hid.device()
-        h.open(vid, pid)
+        h = hidapi_load().device()
+        h.open(vid, pid, serial_number)
         print("Manufacturer: %s" % h.get_manufacturer_string())
         print("Product: %s" % h.get_product_string())
         print("Serial No: %s" % h.get_serial_number_string())
@@ -168,48 +159,387 @@ def hidapi_get_device_information(vid:int, pid:int, serial_number=None)->list:
         print(ex)
         return(None)
 
-def hidapi_send_raw_packet(vid:int, pid:int, packet:list=None)->list:
-    """_summary_
+def hidapi_build_packet(rid:int, cmd:int, act:int=0, payload:list=None)->list:
+    """Build one HID report, payload is truncated or zero padded to HID_PACKET_PADLOAD_SIZE.
 
     Args:
-        vid (int): _description_
-        pid (int): _description_
-        packet (list, optional): _description_. Defaults to None.
+        rid (int): report id (HID_REPORID_TYPE value)
+        cmd (int): command code
+        act (int, optional): action code. Defaults to 0.
+        payload (list, optional): payload data. Defaults to None.
 
     Returns:
-        list: _description_
+        list: HID report, HID_PACKET_SIZE_MAX bytes
     """
-    try:
+    hid_pkt=[rid,cmd,act,0]
+    if payload==None:
+        hid_pkt +=[0]*HID_PACKET_PADLOAD_SIZE
+    else:
+        if len(payload)>HID_PACKET_PADLOAD_SIZE:
+            hid_pkt += payload[0:HID_PACKET_PADLOAD_SIZE]
+        elif len(payload)<HID_PACKET_PADLOAD_SIZE:
+            padding_len=HID_PACKET_PADLOAD_SIZE-len(payload)
+            hid_pkt +=payload
+            hid_pkt +=[0]*padding_len
+        else:
+            hid_pkt += payload
+    return(hid_pkt)
+
+class HidSession:
+    """Keep one dock HID device open across many commands.
+
+    The hid.device handle is opened in open() and reused by every send_* call
+    until close(); the USB backends are loaded on the first open() of the
+    process. transport selects the handle type (HID_TRANSPORTS), every
+    command runs unchanged on each. Use it as a context manager:
+
+        with HidSession(vid, pid) as s:
+            s.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_PING)
+    """
+
+    def __init__(self, vid:int=0, pid:int=0, serial_number:str=None, path:bytes=None, response_wait:bool=True,
+                 transport:str=None):
+        self.vid=vid
+        self.pid=pid
+        self.serial_number=serial_number
+        self.path=path
+        self.transport=transport # None: HID_TRANSPORT_DEFAULT
+        self.response_wait=response_wait # False: fixed delay then one read (legacy)
+        self.h=None
+        self.inflight={} # (rid, cmd, act) -> deque of (hid_pkt, write time), only while traced
+        self.encoder=HidPacketEncoder() # command reports of send_command()
+
+    def open(self):
+        """Open the device, raise IOError if it can't be opened."""
+        if self.h is not None:
+            return(self)
+        h = hidapi_get_transport(self.transport).device()
+        if self.path is not None:
+            h.open_path(self.path)
+        else:
+            h.open(self.vid, self.pid, self.serial_number)
+        h.set_nonblocking(1)
+        self.h=h
+        return(self)
+
+    def close(self):
+        if self.h is not None:
+            self.h.close()
+            self.h=None
+        self.trace_abort()
+
+    def is_open(self)->bool:
+        return(self.h is not None)
+
+    def __enter__(self):
+        return(self.open())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return(False)
+
+    def wait_response(self, rid:int, cmd:int, act:int, timeout:int=HID_READ_TIMEOUT)->list:
+        """Block until a response matching report ID, command and action code arrives.
+
+        Reports which don't match (late answers of an earlier command) are dropped.
+
+        Args:
+            rid (int): report id
+            cmd (int): command code
+            act (int): action code
+            timeout (int, optional): deadline, unit:ms. Defaults to HID_READ_TIMEOUT.
+
+        Returns:
+            list: response report, [] when timeout
+        """
+        deadline=time.monotonic()+timeout/1000.0
+        while True:
+            remain=int((deadline-time.monotonic())*1000)
+            if remain<=0:
+                if self.inflight:
+                    self.trace_response((rid,cmd,act),[])
+                return([])
+            try:
+                hid_data=self.h.read(HID_PACKET_SIZE_MAX,remain)
+            except IOError:
+                self.trace_abort()
+                raise
+            if not hid_data:
+                continue
+            if (hid_data[HID_RID_OFFSET]==rid and
+                hid_data[HID_CMD_OFFSET]==cmd and
+                hid_data[HID_ACT_OFFSET]==act):
+                if self.inflight:
+                    self.trace_response((rid,cmd,act),hid_data)
+                return(hid_data)
+
+    def write_packet(self, hid_pkt:list)->int:
+        """Write one report without waiting for its response, raise IOError on failure."""
+        n=self.h.write(hid_pkt)
+        if HID_TRANSACTION_HOOKS:
+            key=(hid_pkt[HID_RID_OFFSET],hid_pkt[HID_CMD_OFFSET],hid_pkt[HID_ACT_OFFSET])
+            if not isinstance(hid_pkt,list):
+                hid_pkt=bytes(hid_pkt) # encoder buffers are reused
+            self.inflight.setdefault(key,collections.deque()).append((hid_pkt,time.perf_counter()))
+        return(n)
+
+    def trace_response(self, key:tuple, hid_data:list):
+        """Pass the oldest traced report of key and its response to HID_TRANSACTION_HOOKS."""
+        queue=self.inflight.get(key)
+        if not queue:
+            return
+        hid_pkt,start=queue.popleft()
+        if not queue:
+            del self.inflight[key]
+        hidapi_call_transaction_hooks(self,hid_pkt,hid_data,time.perf_counter()-start)
+
+    def trace_abort(self):
+        """IO error: every traced report still waiting gets hid_data None."""
+        inflight=self.inflight
+        self.inflight={}
+        for queue in inflight.values():
+            for hid_pkt,start in queue:
+                hidapi_call_transaction_hooks(self,hid_pkt,None,time.perf_counter()-start)
+
+    def transfer(self, hid_pkt:list, timeout:int=HID_READ_TIMEOUT)->list:
+        """Write one report and read back the response.
+
+        Args:
+            hid_pkt (list): HID report
+            timeout (int, optional): response timeout, unit:ms. Defaults to HID_READ_TIMEOUT.
+
+        Returns:
+            list: response report, [] when timeout, None when IO error
+        """
+        try:
+            self.write_packet(hid_pkt)
+            if self.response_wait:
+                return(self.wait_response(hid_pkt[HID_RID_OFFSET],hid_pkt[HID_CMD_OFFSET],
+                                          hid_pkt[HID_ACT_OFFSET],timeout))
+            time.sleep(HID_LEGACY_RESPONSE_DELAY)
+            hid_data=self.h.read(HID_PACKET_SIZE_MAX,timeout)
+            if self.inflight:
+                self.trace_response((hid_pkt[HID_RID_OFFSET],hid_pkt[HID_CMD_OFFSET],hid_pkt[HID_ACT_OFFSET]),hid_data)
+            return(hid_data)
+
+        except IOError as ex:
+            print(ex)
+            return(None)
+
+    def transfer_pipelined(self, hid_pkts, window:int=HID_PIPELINE_WINDOW, timeout:int=HID_READ_TIMEOUT)->list:
+        """Write reports with up to window responses outstanding.
+
+        Responses are matched in order on report ID, command and action code.
+
+        Args:
+            hid_pkts: iterable of HID reports
+            window (int, optional): outstanding reports. Defaults to HID_PIPELINE_WINDOW.
+            timeout (int, optional): timeout per response, unit:ms. Defaults to HID_READ_TIMEOUT.
+
+        Returns:
+            list: responses in request order, None when IO error or timeout
+        """
+        responses=[]
+        pending=collections.deque()
+        try:
+            for hid_pkt in hid_pkts:
+                if len(pending) >= window:
+                    hid_data=self.wait_response(*pending.popleft(),timeout)
+                    if not hid_data:
+                        return(None)
+                    responses.append(hid_data)
+                self.write_packet(hid_pkt)
+                pending.append((hid_pkt[HID_RID_OFFSET],hid_pkt[HID_CMD_OFFSET],hid_pkt[HID_ACT_OFFSET]))
+            while pending:
+                hid_data=self.wait_response(*pending.popleft(),timeout)
+                if not hid_data:
+                    return(None)
+                responses.append(hid_data)
+            return(responses)
+
+        except IOError as ex:
+            print(ex)
+            return(None)
+
+    def send_raw_packet(self, packet:list=None, timeout:int=HID_READ_TIMEOUT)->list:
         if packet is None:
             return None
-        
-        backend =libusb1.get_backend(find_library=libusb_package.find_library)
-        h = hid.device()
-        h.open(vid, pid)
-        h.set_nonblocking(1)
+
         hid_pkt=[]
         if len(packet)>HID_PACKET_SIZE_MAX:
             hid_pkt = packet[0:HID_PACKET_SIZE_MAX]
-        elif len(packet)<HID_PACKET_PADLOAD_SIZE:
-            padding_len=HID_PACKET_PADLOAD_SIZE-len(packet)
+        elif len(packet)<HID_PACKET_SIZE_MAX:
+            padding_len=HID_PACKET_SIZE_MAX-len(packet)
             hid_pkt = packet + [0]*padding_len
         else:
             hid_pkt = packet
-            
-        h.write(hid_pkt)
-        time.sleep(0.05)
-        hid_data=h.read(HID_PACKET_SIZE_MAX,HID_READ_TIMEOUT)
+
+        hid_data=self.transfer(hid_pkt,timeout)
         print("hid_data:",hid_data)
-        
-        h.close()
         return(hid_data)
-    
+
+    def send_command(self, rid:HID_REPORID_TYPE, cmd:Enum, act:Enum=None, payload:list=None, timeout:int=None)->list:
+        """Send one command report and check the response code.
+
+        Args:
+            rid (HID_REPORID_TYPE): report id
+            cmd (Enum): HID_SYSCMD_TYPE / HID_FWCMD_TYPE / HID_IOBUSCMD_TYPE
+            act (Enum, optional): HID_FWACT_TYPE / HID_IOBUSACT_TYPE. Defaults to None.
+            payload (list, optional): payload data. Defaults to None.
+            timeout (int, optional): response timeout, unit:ms. Defaults to HID_CMD_TIMEOUT entry.
+
+        Returns:
+            list: response report, None when IO error or timeout
+        """
+        act_code=0 if act is None else act.value
+        if timeout is None:
+            timeout=hidapi_get_cmd_timeout(cmd,act)
+        hid_pkt=self.encoder.encode(rid.value,cmd.value,act_code,payload)
+        hid_data=self.transfer(hid_pkt,timeout)
+        if HID_RESPONSE_HOOKS:
+            hidapi_call_response_hooks(self,cmd,act,hid_data or None)
+        if not hid_data:
+            if hid_data is not None:
+                print("HID_CMD TIMEOUT:",cmd.name)
+            return(None)
+
+        if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+        return(hid_data)
+
+    def send_sys_command(self, cmd:HID_SYSCMD_TYPE, payload:list=None, timeout:int=None)->list:
+        return(self.send_command(HID_REPORID_TYPE.RID_SYS,cmd,None,payload,timeout))
+
+    def send_fw_command(self, cmd:HID_FWCMD_TYPE, act:HID_FWACT_TYPE, payload:list=None, timeout:int=None)->list:
+        return(self.send_command(HID_REPORID_TYPE.RID_FW,cmd,act,payload,timeout))
+
+    def send_iobus_command(self, cmd:HID_IOBUSCMD_TYPE, act:HID_IOBUSACT_TYPE, payload:list=None, timeout:int=None)->list:
+        return(self.send_command(HID_REPORID_TYPE.RID_BUSIO,cmd,act,payload,timeout))
+
+class HidDeviceRegistry:
+    """Cached hid.enumerate() results with hotplug diffing and open-by-serial.
+
+    Enumeration runs at most once per refresh_interval; lookups by serial number
+    are dict lookups on the cached scan. Each scan is diffed by device path
+    against the previous one.
+
+        registry=HidDeviceRegistry(vid, pid)
+        with registry.open("SN0001") as s:
+            s.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_PING)
+    """
+
+    def __init__(self, vid:int=0, pid:int=0, interface_number:int=None,
+                 refresh_interval:float=HID_REGISTRY_REFRESH_INTERVAL, transport:str=None):
+        self.vid=vid
+        self.pid=pid
+        self.transport=transport # paths are only valid on the transport which enumerated them
+        self.interface_number=interface_number # None: any interface
+        self.refresh_interval=refresh_interval
+        self.by_path={}
+        self.by_serial={}
+        self.scan_time=None
+
+    def scan(self)->tuple:
+        """Enumerate now.
+
+        Returns:
+            tuple: (added, removed) device dict lists compared with the previous scan
+        """
+        by_path={}
+        for device_dict in hidapi_get_transport(self.transport).enumerate(vendor_id=self.vid,product_id=self.pid):
+            if device_dict['bus_type']!=1: # 1: USB
+                continue
+            if self.interface_number is not None and device_dict['interface_number']!=self.interface_number:
+                continue
+            by_path[device_dict['path']]=device_dict
+        added=[d for path,d in by_path.items() if path not in self.by_path]
+        removed=[d for path,d in self.by_path.items() if path not in by_path]
+
+        by_serial={}
+        for device_dict in sorted(by_path.values(),key=lambda d: d['interface_number']):
+            by_serial.setdefault(device_dict['serial_number'],device_dict)
+        self.by_path=by_path
+        self.by_serial=by_serial
+        self.scan_time=time.monotonic()
+        return(added,removed)
+
+    def is_stale(self)->bool:
+        return(self.scan_time is None or time.monotonic()-self.scan_time >= self.refresh_interval)
+
+    def refresh(self, force:bool=False)->tuple:
+        """Scan when the cache is older than refresh_interval (or force).
+
+        Returns:
+            tuple: (added, removed), empty lists when the cache was still valid
+        """
+        if force or self.is_stale():
+            return(self.scan())
+        return([],[])
+
+    def devices(self)->list:
+        self.refresh()
+        return(list(self.by_path.values()))
+
+    def find(self, serial_number:str)->dict:
+        """Cached device dict of a dock serial number, None when not attached."""
+        scanned=self.is_stale()
+        self.refresh()
+        device_dict=self.by_serial.get(serial_number)
+        if device_dict is None and not scanned:
+            # maybe plugged since the last scan
+            self.scan()
+            device_dict=self.by_serial.get(serial_number)
+        return(device_dict)
+
+    def session(self, serial_number:str)->HidSession:
+        """Unopened HidSession for a dock serial number, None when not attached."""
+        device_dict=self.find(serial_number)
+        if device_dict is None:
+            return(None)
+        return(HidSession(self.vid, self.pid, serial_number, device_dict['path'], transport=self.transport))
+
+    def open(self, serial_number:str)->HidSession:
+        """Open a dock through its cached path, rescan once if the path is gone.
+
+        Raises:
+            IOError: dock not attached or can't be opened
+        """
+        session=self.session(serial_number)
+        if session is None:
+            raise IOError("device not found: %s" % serial_number)
+        try:
+            return(session.open())
+        except IOError:
+            self.scan()
+            session=self.session(serial_number)
+            if session is None:
+                raise
+            return(session.open())
+
+def hidapi_send_raw_packet(vid:int, pid:int, packet:list=None)->list:
+    """_summary_
+
+    Args:
+        vid (int): _description_
+        pid (int): _description_
+        packet (list, optional): _description_. Defaults to None.
+
+    Returns:
+        list: _description_
+    """
+    try:
+        if packet is None:
+            return None
+
+        with HidSession(vid, pid) as s:
+            return(s.send_raw_packet(packet))
+
     except IOError as ex:
         print(ex)
         return(None)
 
 
-def hidapi_send_sys_command(vid:int, pid:int, cmd:HID_SYSCMD_TYPE, payload:list=None)->list:
+def hidapi_send_sys_command(vid:int, pid:int, cmd:HID_SYSCMD_TYPE, payload:list=None, timeout:int=None)->list:
     """_summary_
 
     Args:
@@ -217,40 +547,33 @@ def hidapi_send_sys_command(vid:int, pid:int, cmd:HID_SYSCMD_TYPE, payload:list=
         pid (int): _description_
         cmd (HID_SYSCMD_TYPE): _description_
         payload (list, optional): _description_. Defaults to None.
+        timeout (int, optional): response timeout, unit:ms. Defaults to HID_CMD_TIMEOUT entry.
 
     Returns:
         list: _description_
     """
     try:
-        backend =libusb1.get_backend(find_library=libusb_package.find_library)
-        h = hid.device()
-        h.open(vid, pid)
-        h.set_nonblocking(1)
-        
-        hid_pkt=[HID_REPORID_TYPE.RID_SYS.value,cmd.value,0,0]
-        if payload==None:
-            hid_pkt +=[0]*HID_PACKET_PADLOAD_SIZE
-        else:
-            if len(payload)>HID_PACKET_PADLOAD_SIZE:
-                hid_pkt += payload[0:HID_PACKET_PADLOAD_SIZE]
-            elif len(payload)<HID_PACKET_PADLOAD_SIZE:
-                padding_len=HID_PACKET_PADLOAD_SIZE-len(payload)
-                hid_pkt +=payload
-                hid_pkt +=[0]*padding_len
-            else:
-                hid_pkt += payload
-            
-        h.write(hid_pkt)
-        time.sleep(0.05)
-        hid_data=h.read(HID_PACKET_SIZE_MAX)
-        #print("hid_data:",hid_data)
-        
-        if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
-            print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
-        
-        h.close()
-        return(hid_data)
-    
+        with HidSession(vid, pid) as s:
+            return(s.send_sys_command(cmd,payload,timeout))
+
+    except IOError as ex:
+        print(ex)
+        return(None)
+
+def hidapi_send_fw_command(vid:int, pid:int, cmd:HID_FWCMD_TYPE, act:HID_FWACT_TYPE, payload:list=None, timeout:int=None)->list:
+    try:
+        with HidSession(vid, pid) as s:
+            return(s.send_fw_command(cmd,act,payload,timeout))
+
+    except IOError as ex:
+        print(ex)
+        return(None)
+
+def hidapi_send_iobus_command(vid:int, pid:int, cmd:HID_IOBUSCMD_TYPE, act:HID_IOBUSACT_TYPE, payload:list=None, timeout:int=None)->list:
+    try:
+        with HidSession(vid, pid) as s:
+            return(s.send_iobus_command(cmd,act,payload,timeout))
+
     except IOError as ex:
         print(ex)
         return(None)
@@ -0,0 +1,180 @@
+import asyncio
+import collections
+from model.qhidapi import *
+
+HID_ASYNC_POLL_INTERVAL=0.001 # unit:s, reader sleep when no report is pending in the device
+HID_ASYNC_POLL_MAX_INTERVAL=0.02 # unit:s, the sleep doubles up to this while a long command runs
+
+class AsyncHidDevice:
+    """asyncio front end of one dock HID device.
+
+    Commands are written directly and the coroutine awaits a future keyed by
+    (report ID, command code, action code). One reader task per device drains
+    the non-blocking hid handle and resolves the oldest future of the matching
+    key; it sleeps on an event while nothing is in flight, so idle devices cost
+    nothing and no thread is needed per device. While a request is in flight
+    the poll interval doubles after every empty read, from poll_interval up to
+    max_poll_interval, and drops back when a report arrives or a new request
+    is written, so a long command (erase) doesn't wake the loop every 1 ms.
+    Several requests, also with the same key, can be in flight at once;
+    responses are matched in order.
+
+        async with AsyncHidDevice(vid, pid) as dev:
+            rsp=await dev.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_PING)
+    """
+
+    def __init__(self, vid:int=0, pid:int=0, serial_number:str=None, path:bytes=None,
+                 poll_interval:float=HID_ASYNC_POLL_INTERVAL, transport:str=None,
+                 max_poll_interval:float=HID_ASYNC_POLL_MAX_INTERVAL):
+        self.session=HidSession(vid, pid, serial_number, path, transport=transport)
+        self.poll_interval=poll_interval
+        self.max_poll_interval=max(poll_interval,max_poll_interval)
+        self.pending={} # (rid, cmd, act) -> deque of futures
+        self.pending_count=0
+        self.encoder=HidPacketEncoder() # written by transfer() before its first await
+        self.wakeup=None
+        self.reader=None
+
+    async def open(self):
+        """Open the device and start the reader task, raise IOError if it can't be opened."""
+        if self.reader is not None:
+            return(self)
+        self.session.open()
+        self.pending={}
+        self.pending_count=0
+        self.wakeup=asyncio.Event()
+        self.reader=asyncio.get_running_loop().create_task(self.read_loop())
+        return(self)
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            try:
+                await self.reader
+            except asyncio.CancelledError:
+                pass
+            self.reader=None
+        self.fail_pending(IOError("device closed"))
+        self.session.close()
+
+    async def __aenter__(self):
+        return(await self.open())
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return(False)
+
+    def fail_pending(self, ex:Exception):
+        for queue in self.pending.values():
+            for future in queue:
+                if not future.done():
+                    future.set_exception(ex)
+            queue.clear() # transfer() must not count its future again
+        self.pending={}
+        self.pending_count=0
+
+    def dispatch(self, hid_data:list):
+        key=(hid_data[HID_RID_OFFSET],hid_data[HID_CMD_OFFSET],hid_data[HID_ACT_OFFSET])
+        queue=self.pending.get(key)
+        while queue:
+            future=queue.popleft()
+            self.pending_count -=1
+            if not future.done(): # skip futures given up by timeout
+                future.set_result(hid_data)
+                return
+        # no waiter: late answer of a timed out request, drop it
+
+    async def read_loop(self):
+        delay=self.poll_interval
+        while True:
+            if self.pending_count == 0:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                delay=self.poll_interval
+                continue
+            try:
+                hid_data=self.session.h.read(HID_PACKET_SIZE_MAX)
+            except Exception as ex: # also a read on a closed handle; never leave futures waiting
+                self.fail_pending(ex if isinstance(ex,IOError) else IOError(str(ex)))
+                continue
+            if hid_data:
+                self.dispatch(hid_data)
+                delay=self.poll_interval
+                continue
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(),delay)
+                delay=self.poll_interval # new request written
+            except asyncio.TimeoutError:
+                delay=min(delay*2,self.max_poll_interval)
+
+    async def transfer(self, hid_pkt:list, timeout:int=HID_READ_TIMEOUT)->list:
+        """Write one report and await its response.
+
+        Returns:
+            list: response report, [] when timeout, None when IO error
+        """
+        key=(hid_pkt[HID_RID_OFFSET],hid_pkt[HID_CMD_OFFSET],hid_pkt[HID_ACT_OFFSET])
+        future=asyncio.get_running_loop().create_future()
+        queue=self.pending.setdefault(key,collections.deque())
+        queue.append(future)
+        self.pending_count +=1
+        written=False
+        try:
+            self.session.write_packet(hid_pkt)
+            written=True
+            self.wakeup.set()
+            hid_data=await asyncio.wait_for(future,timeout/1000.0)
+
+        except asyncio.TimeoutError:
+            hid_data=[]
+
+        except IOError as ex:
+            print(ex)
+            hid_data=None
+
+        finally:
+            if self.pending.get(key) is queue and future in queue: # not dispatched: timeout, write error or cancelled
+                queue.remove(future)
+                self.pending_count -=1
+        if written and self.session.inflight:
+            self.session.trace_response(key,hid_data)
+        return(hid_data)
+
+    async def send_command(self, rid:HID_REPORID_TYPE, cmd:Enum, act:Enum=None, payload:list=None, timeout:int=None)->list:
+        """Coroutine version of HidSession.send_command()."""
+        act_code=0 if act is None else act.value
+        if timeout is None:
+            timeout=hidapi_get_cmd_timeout(cmd,act)
+        hid_pkt=self.encoder.encode(rid.value,cmd.value,act_code,payload)
+        hid_data=await self.transfer(hid_pkt,timeout)
+        if HID_RESPONSE_HOOKS:
+            hidapi_call_response_hooks(self.session,cmd,act,hid_data or None)
+        if not hid_data:
+            if hid_data is not None:
+                print("HID_CMD TIMEOUT:",cmd.name)
+            return(None)
+
+        if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+        return(hid_data)
+
+    async def send_sys_command(self, cmd:HID_SYSCMD_TYPE, payload:list=None, timeout:int=None)->list:
+        return(await self.send_command(HID_REPORID_TYPE.RID_SYS,cmd,None,payload,timeout))
+
+    async def send_fw_command(self, cmd:HID_FWCMD_TYPE, act:HID_FWACT_TYPE, payload:list=None, timeout:int=None)->list:
+        return(await self.send_command(HID_REPORID_TYPE.RID_FW,cmd,act,payload,timeout))
+
+    async def send_iobus_command(self, cmd:HID_IOBUSCMD_TYPE, act:HID_IOBUSACT_TYPE, payload:list=None, timeout:int=None)->list:
+        return(await self.send_command(HID_REPORID_TYPE.RID_BUSIO,cmd,act,payload,timeout))
+
+if __name__ == "__main__":
+
+    async def main():
+        vid=0x2BEF
+        pid=0x0415
+        async with AsyncHidDevice(vid, pid) as dev:
+            d=await dev.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_ID_LIST)
+            print(d)
+
+    asyncio.run(main())
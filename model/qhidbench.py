@@ -0,0 +1,163 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+from model.qhidapi import *
+from model.fwct import *
+from model.qhidmgr import hidmgr_get_device_firmware_info, HidFwInfoCache
+from model.qhidfwup import FwUpdateEngine
+from model.qhidsim import *
+
+BENCH_LATENCIES=[0.0,0.0005,0.002]  # unit:s, simulated per report latency
+BENCH_COMMAND_COUNT=500
+BENCH_FIRMWARE_SIZE=64*1024
+BENCH_FWINFO_ROUNDS=20
+BENCH_REGRESSION_TOLERANCE=0.20     # allowed relative slowdown against the baseline
+
+# Result keys: "<name>@<latency us>us". Keys ending in _per_sec are better when
+# higher, keys ending in _ms are better when lower.
+
+def bench_key(name:str, latency:float)->str:
+    return("%s@%dus" % (name,round(latency*1e6)))
+
+def bench_composite(size:int, row_size_ind:int=2, segments:int=2)->list:
+    """Synthetic single image load_fwct_image() composite of about size bytes."""
+    fwctInfo=Dock_FWCT_Info()
+    fwctInfo.image_count=1
+    imageInfo=Dock_FWCT_ImageInfo()
+    imageInfo.device_type=DMC_DEV_TYPE.DMC_DEV_TYPE_AT32F415.value
+    imageInfo.image_type=IMAGE_TYPE.IMAGE_TYPE_IMAGE1.value
+    imageInfo.component_id=0
+    imageInfo.row_size_ind=row_size_ind
+    imageInfo.fw_version=0
+    imageInfo.app_version=0
+    imageInfo.num_image_segments=segments
+    row_size=row_size_ind*FWCT_ROW_UNIT_SIZE
+    rows=max(1,size//row_size//segments)
+    composite=[fwctInfo,imageInfo]
+    for index in range(0,segments):
+        segInfo=Dock_FWCT_SegmentInfo()
+        segInfo.image_id=0
+        segInfo.image_type=imageInfo.image_type
+        segInfo.segment_start_row=index*rows
+        segInfo.segment_size=rows
+        composite+=[segInfo,os.urandom(rows*row_size)]
+    imageInfo.image_size=rows*row_size*segments
+    return(composite)
+
+def bench_commands(latency:float, count:int=BENCH_COMMAND_COUNT, window:int=HID_PIPELINE_WINDOW)->dict:
+    """SYS_CMD_PING rate, one at a time and pipelined."""
+    dock=SimDock("BENCH0",latency=latency)
+    with SimHidModule([dock]), HidSession(dock.vid,dock.pid) as s:
+        start=time.perf_counter()
+        for index in range(0,count):
+            if s.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_PING) is None:
+                return(None)
+        serial=count/(time.perf_counter()-start)
+        hid_pkts=HidPacketEncoder().encode_each(HID_REPORID_TYPE.RID_SYS.value,HID_SYSCMD_TYPE.SYS_CMD_PING.value,0,
+                                                [None]*count)
+        start=time.perf_counter()
+        if s.transfer_pipelined(hid_pkts,window) is None:
+            return(None)
+        pipelined=count/(time.perf_counter()-start)
+    return({bench_key('commands_per_sec',latency):serial,
+            bench_key('pipelined_commands_per_sec',latency):pipelined})
+
+def bench_firmware(latency:float, size:int=BENCH_FIRMWARE_SIZE, window:int=HID_PIPELINE_WINDOW)->dict:
+    """FwUpdateEngine.update_composite() throughput on a synthetic image."""
+    dock=SimDock("BENCH0",latency=latency)
+    composite=bench_composite(size)
+    with SimHidModule([dock]), HidSession(dock.vid,dock.pid) as s, contextlib.redirect_stdout(io.StringIO()):
+        stats=FwUpdateEngine(s,window).update_composite(composite)
+    if stats is None:
+        return(None)
+    return({bench_key('firmware_bytes_per_sec',latency):stats['bytes_per_sec']})
+
+def bench_fwinfo(latency:float, rounds:int=BENCH_FWINFO_ROUNDS)->dict:
+    """hidmgr_get_device_firmware_info() latency: uncached, and cached after the first call."""
+    dock=SimDock("BENCH0",latency=latency)
+    cache=HidFwInfoCache()
+    results={}
+    with SimHidModule([dock]), contextlib.redirect_stdout(io.StringIO()):
+        for name,cache_arg in (('fwinfo_ms',None),('fwinfo_cached_ms',cache)):
+            hidmgr_get_device_firmware_info(dock.vid,dock.pid,None,cache_arg) # warm up / fill cache
+            start=time.perf_counter()
+            for index in range(0,rounds):
+                if hidmgr_get_device_firmware_info(dock.vid,dock.pid,None,cache_arg) is None:
+                    return(None)
+            results[bench_key(name,latency)]=(time.perf_counter()-start)*1000.0/rounds
+    return(results)
+
+def bench_run(latencies:list=BENCH_LATENCIES)->dict:
+    """Run every benchmark at every latency.
+
+    Returns:
+        dict: {'time','python','platform','results':{key: value}}, results of failed benchmarks are missing
+    """
+    results={}
+    for latency in latencies:
+        for bench in (bench_commands,bench_firmware,bench_fwinfo):
+            result=bench(latency)
+            if result is None:
+                print("[ERROR] %s fail, latency: %g s" % (bench.__name__,latency))
+                continue
+            results.update(result)
+    return({'time':time.strftime('%Y-%m-%dT%H:%M:%S'),'python':platform.python_version(),
+            'platform':platform.platform(),'results':results})
+
+def bench_compare(record:dict, baseline:dict, tolerance:float=BENCH_REGRESSION_TOLERANCE)->list:
+    """Regressed keys of record against baseline.
+
+    Returns:
+        list: [(key, baseline_value, value), ...]
+    """
+    regressions=[]
+    for key,base in baseline['results'].items():
+        value=record['results'].get(key)
+        if value is None or base <= 0:
+            continue
+        name=key.split('@')[0]
+        if name.endswith('_per_sec') and value < base*(1.0-tolerance):
+            regressions.append((key,base,value))
+        elif name.endswith('_ms') and value > base*(1.0+tolerance):
+            regressions.append((key,base,value))
+    return(regressions)
+
+def bench_record(record:dict, results_file:str):
+    """Append record as one JSON line."""
+    with open(results_file,'a') as f:
+        f.write(json.dumps(record,sort_keys=True)+'\n')
+
+def bench_load_baseline(baseline_file:str)->dict:
+    """Last record of a bench_record() file, None when missing."""
+    try:
+        with open(baseline_file) as f:
+            lines=[line for line in f if line.strip()]
+        return(json.loads(lines[-1]) if lines else None)
+    except (OSError,ValueError) as ex:
+        print(ex)
+        return(None)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.qhidbench [results.jsonl [baseline.jsonl]]")
+        sys.exit(1)
+    record=bench_run()
+    for key,value in sorted(record['results'].items()):
+        print("%-40s %14.3f" % (key,value))
+    regressions=[]
+    if len(sys.argv) == 3:
+        baseline=bench_load_baseline(sys.argv[2])
+        if baseline is None:
+            print("[INFO] No baseline in:",sys.argv[2])
+        else:
+            regressions=bench_compare(record,baseline)
+        for key,base,value in regressions:
+            print("[ERROR] Regression %s: %.3f -> %.3f" % (key,base,value))
+    if len(sys.argv) >= 2:
+        bench_record(record,sys.argv[1])
+    sys.exit(1 if regressions else 0)
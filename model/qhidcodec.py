@@ -0,0 +1,151 @@
+import struct
+from model.qhiddef import HID_PACKET_SIZE_MAX
+
+HIDCODEC_PACKET_SIZE=HID_PACKET_SIZE_MAX
+HIDCODEC_HEADER_STRUCT=struct.Struct('<BBBB') # [0] RID [1] CMD [2] ACT [3] RSP
+HIDCODEC_HEADER_SIZE=HIDCODEC_HEADER_STRUCT.size
+HIDCODEC_PAYLOAD_SIZE=HIDCODEC_PACKET_SIZE-HIDCODEC_HEADER_SIZE
+
+class HidPacketEncoder:
+    """Encode reports into one reusable 64-byte buffer.
+
+    encode() returns the same bytearray every call, so the report must be
+    written before the next encode(). Only the bytes left over from a longer
+    previous payload are cleared.
+    """
+
+    def __init__(self):
+        self.buf=bytearray(HIDCODEC_PACKET_SIZE)
+        self.payload_len=0 # payload bytes of the previous report
+
+    def encode(self, rid:int, cmd:int, act:int=0, payload=None)->bytearray:
+        """Encode one report, payload is truncated or zero padded to HIDCODEC_PAYLOAD_SIZE.
+
+        Args:
+            rid (int): report id
+            cmd (int): command code
+            act (int, optional): action code. Defaults to 0.
+            payload (optional): list of ints or bytes-like. Defaults to None.
+
+        Returns:
+            bytearray: the encoder buffer, HIDCODEC_PACKET_SIZE bytes
+        """
+        buf=self.buf
+        HIDCODEC_HEADER_STRUCT.pack_into(buf,0,rid,cmd,act,0)
+        n=0
+        if payload is not None:
+            n=min(len(payload),HIDCODEC_PAYLOAD_SIZE)
+            buf[HIDCODEC_HEADER_SIZE:HIDCODEC_HEADER_SIZE+n]=payload[0:n]
+        if n < self.payload_len:
+            buf[HIDCODEC_HEADER_SIZE+n:HIDCODEC_HEADER_SIZE+self.payload_len]=bytes(self.payload_len-n)
+        self.payload_len=n
+        return(buf)
+
+    def encode_each(self, rid:int, cmd:int, act:int, payloads):
+        """Yield one report per payload, all in the encoder buffer.
+
+        Each report has to be written before the next one is taken, as
+        HidSession.transfer_pipelined() does.
+        """
+        for payload in payloads:
+            yield self.encode(rid,cmd,act,payload)
+
+class HidResponse:
+    """Typed, read-only view of one response report.
+
+    hidapi returns a list of ints, which is converted once; bytes-like
+    reports are wrapped without copying. payload is a memoryview slice.
+    """
+
+    __slots__=('view',)
+
+    def __init__(self, hid_data):
+        if isinstance(hid_data,list):
+            hid_data=bytes(hid_data)
+        self.view=memoryview(hid_data)
+
+    def __len__(self)->int:
+        return(len(self.view))
+
+    @property
+    def rid(self)->int:
+        return(self.view[0])
+
+    @property
+    def cmd(self)->int:
+        return(self.view[1])
+
+    @property
+    def act(self)->int:
+        return(self.view[2])
+
+    @property
+    def rsp(self)->int:
+        return(self.view[3])
+
+    @property
+    def header(self)->tuple:
+        """(rid, cmd, act, rsp)"""
+        return(HIDCODEC_HEADER_STRUCT.unpack_from(self.view,0))
+
+    @property
+    def payload(self)->memoryview:
+        return(self.view[HIDCODEC_HEADER_SIZE:])
+
+    def matches(self, rid:int, cmd:int, act:int)->bool:
+        view=self.view
+        return(len(view) >= HIDCODEC_HEADER_SIZE and view[0]==rid and view[1]==cmd and view[2]==act)
+
+def hidcodec_decode(hid_data)->HidResponse:
+    """HidResponse of a report, None when hid_data is empty or None (timeout / IO error)."""
+    if not hid_data:
+        return(None)
+    return(HidResponse(hid_data))
+
+class HidFrameBatch:
+    """Data split into back to back reports of one command/action in a single buffer.
+
+    Frame i carries data[i*HIDCODEC_PAYLOAD_SIZE:(i+1)*HIDCODEC_PAYLOAD_SIZE],
+    the last one zero padded. Frames are memoryview slices of the buffer and
+    can be written directly or passed to HidSession.transfer_pipelined().
+
+        for frame in HidFrameBatch(rid, cmd, act, binCode):
+            session.write_packet(frame)
+
+    Args:
+        rid (int): report id
+        cmd (int): command code
+        act (int): action code
+        data: bytes-like (or list of ints) payload data
+    """
+
+    def __init__(self, rid:int, cmd:int, act:int, data):
+        n=len(data)
+        self.count=(n+HIDCODEC_PAYLOAD_SIZE-1)//HIDCODEC_PAYLOAD_SIZE
+        size=self.count*HIDCODEC_PACKET_SIZE
+        self.buffer=bytearray(size)
+        buf=self.buffer
+        buf[0:size:HIDCODEC_PACKET_SIZE]=bytes((rid,))*self.count
+        buf[1:size:HIDCODEC_PACKET_SIZE]=bytes((cmd,))*self.count
+        buf[2:size:HIDCODEC_PACKET_SIZE]=bytes((act,))*self.count
+        if not isinstance(data,(bytes,bytearray,memoryview)):
+            data=bytes(data)
+        src=memoryview(data).cast('B') if isinstance(data,memoryview) else data
+        pos=0
+        for offset in range(HIDCODEC_HEADER_SIZE,size,HIDCODEC_PACKET_SIZE):
+            chunk=src[pos:pos+HIDCODEC_PAYLOAD_SIZE]
+            buf[offset:offset+len(chunk)]=chunk
+            pos +=HIDCODEC_PAYLOAD_SIZE
+        self.view=memoryview(buf)
+
+    def __len__(self)->int:
+        return(self.count)
+
+    def frame(self, index:int)->memoryview:
+        offset=index*HIDCODEC_PACKET_SIZE
+        return(self.view[offset:offset+HIDCODEC_PACKET_SIZE])
+
+    def __iter__(self):
+        view=self.view
+        for offset in range(0,len(view),HIDCODEC_PACKET_SIZE):
+            yield view[offset:offset+HIDCODEC_PACKET_SIZE]
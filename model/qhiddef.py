@@ -0,0 +1,135 @@
+# HID report layout, protocol enums and timeouts shared by every dock module.
+# No USB dependencies: offline tools (FWCT parsing, simulation) import this
+# without loading hidapi or libusb.
+from enum import Enum,unique,auto
+
+HID_PACKET_SIZE_MAX=64
+HID_PACKET_PADLOAD_SIZE=HID_PACKET_SIZE_MAX-4
+HID_RID_OFFSET=0
+HID_CMD_OFFSET=1
+HID_ACT_OFFSET=2
+HID_RSP_OFFSET=3
+HID_DATA_OFFSET=4
+
+HID_READ_TIMEOUT=500 # unit:ms
+HID_LEGACY_RESPONSE_DELAY=0.05 # unit:s, fixed delay used when response wait is disabled
+HID_REGISTRY_REFRESH_INTERVAL=2.0 # unit:s, HidDeviceRegistry enumeration cache lifetime
+HID_PIPELINE_WINDOW=8 # default outstanding reports of HidSession.transfer_pipelined()
+
+# Format:
+# HID[0]: Report ID
+# HID[1]: Command Code
+# HID[2]: Action Code
+# HID[3]: Response Code
+# HID[4...63]: Payload data
+# 
+
+@unique
+class HID_REPORID_TYPE(Enum):
+    RID_UNKNOWN=0
+    RID_SYS    =1
+    RID_FW     =2
+    RID_BUSIO  =3
+
+@unique
+class HID_SYSCMD_TYPE(Enum):
+    SYS_CMD_UNKNOWN                 =0
+    SYS_CMD_PING                    =1
+    SYS_CMD_GET_COMPONENT_ID_LIST   =2
+    SYS_CMD_GET_COMPONENT_FWVER     =3
+    SYS_CMD_GET_SN                  =4
+    SYS_CMD_SET_SN                  =5
+    SYS_CMD_GET_UID                 =6
+    SYS_CMD_RESET                   =7
+    SYS_CMD_RESET_TO_ROM            =8
+    SYS_CMD_RESET_TO_BOOTLOAD       =9
+    SYS_CMD_MAX                     =10
+
+@unique
+class HID_FWCMD_TYPE(Enum):
+    FW_CMD_UNKNOWN      =0
+    FW_CMD_HW_CFG       =1
+    FW_CMD_PROJECT_CFG  =2
+    FW_CMD_FW_UPDATE    =3
+    FW_CMD_MAX          =4
+    
+@unique
+class HID_IOBUSCMD_TYPE(Enum):
+    IOBUS_CMD_UNKNOWN   =0
+    IOBUS_CMD_GPIO      =1
+    IOBUS_CMD_I2C       =2
+    IOBUS_CMD_SPI       =3 # included spi flash command access
+    IOBUS_CMD_SPI_FLASH =4 # for spi flash high level access, sector program, write
+    IOBUS_CMD_PWM       =5
+    IOBUS_CMD_ADC       =6
+    IOBUS_CMD_UART      =7
+    IOBUS_CMD_MAX       =9
+
+@unique
+class HID_FWACT_TYPE(Enum):
+    FW_ACT_UNKNOWN          =0
+    FW_ACT_RESET            =1 # reset state machine
+    FW_ACT_START_UPDATE     =2 # start FW update
+    FW_ACT_CHECK_FWCT       =3 # check fwtab
+    FW_ACT_INIT             =4 # Request FW update
+    FW_ACT_PREPARE_UPDATE   =5 # Request FW update
+    FW_ACT_READ             =6 # Read data from buffer
+    FW_ACT_WRITE            =7 # write buffer to component
+    FW_ACT_RBUF             =8 # Read data from compoent to buffer
+    FW_ACT_WBUF             =9 # Write data to buffer
+    FW_ACT_UPDATE_FINISH    =10 # completed update
+    FW_ACT_STATUS           =11 # Get status
+    FW_ACT_INFO             =12        
+    FW_ACT_MAX              =13  
+
+@unique
+class HID_IOBUSACT_TYPE(Enum):
+    IOBUS_ACT_UNKNOWN       =0
+    IOBUS_ACT_INIT          =1
+    IOBUS_ACT_DEINIT        =2
+    IOBUS_ACT_READ          =3
+    IOBUS_ACT_WRITE         =4
+    IOBUS_ACT_TOGGLE        =5
+    IOBUS_ACT_MEM_READ      =6 # for I2C device memory read mode
+    IOBUS_ACT_MEM_WRITE     =7 # for I2C device memory write mode
+    IOBUS_ACT_PROBE         =8 # for I2C device probe
+    IOBUS_ACT_DUTY          =9 # for configure pwm dutycycle
+    IOBUS_ACT_FREQ          =10 # for configure pwm frequency
+    IOBUS_ACT_FLASH         =11 # for SPI FLASH access through IOBUS_SPI
+    IOBUS_ACT_FLASH_BWRITE  =12 # flash write from buffer (buffer -> flash)
+    IOBUS_ACT_FLASH_BREAD   =13 # flash read from flash to buffer (flash -> buffer)
+    IOBUS_ACT_FLASH_WBUF    =14 # flash data write to buffer (host -> buffer)
+    IOBUS_ACT_FLASH_RBUF    =15 # flash data read to buffer (flash -> buffer)   
+    IOBUS_ACT_MAX           =16 
+    
+@unique
+class HID_APIRESPONE_TYPE(Enum):
+    HIDAPI_UNKNOWN=0
+    HIDAPI_INIT=0x55
+    # Response code
+    HIDAPI_ACK=0xAA     # completed
+    HIDAPI_NACK=0x5A    # failed
+    HIDAPI_WAIT=0xBB    #   
+    HIDAPI_DEFER=0xDF   # indicate API call defer need to check it later.
+    HIDAPI_REENUM=0xF0  # indicate host need to check dock reenum    
+
+# Response timeout per command or action, unit:ms. Lookup order: action, command,
+# then HID_READ_TIMEOUT. The timeout only bounds the wait, a matching response
+# returns as soon as it arrives.
+HID_CMD_TIMEOUT={
+    HID_SYSCMD_TYPE.SYS_CMD_PING                : 100,
+    HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_ID_LIST: 200,
+    HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_FWVER : 200,
+    HID_SYSCMD_TYPE.SYS_CMD_RESET               : 2000,
+    HID_SYSCMD_TYPE.SYS_CMD_RESET_TO_ROM        : 2000,
+    HID_SYSCMD_TYPE.SYS_CMD_RESET_TO_BOOTLOAD   : 2000,
+    HID_FWACT_TYPE.FW_ACT_PREPARE_UPDATE        : 5000, # may erase the component
+    HID_FWACT_TYPE.FW_ACT_WRITE                 : 2000,
+    HID_FWACT_TYPE.FW_ACT_UPDATE_FINISH         : 5000,
+    HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_BWRITE    : 2000,
+}
+
+def hidapi_get_cmd_timeout(cmd:Enum, act:Enum=None)->int:
+    if act is not None and act in HID_CMD_TIMEOUT:
+        return(HID_CMD_TIMEOUT[act])
+    return(HID_CMD_TIMEOUT.get(cmd,HID_READ_TIMEOUT))
@@ -0,0 +1,145 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from model.qhidapi import *
+from model.fwct import *
+from model.qhidfwup import *
+
+FLEET_DEFAULT_VID=0x2BEF
+FLEET_DEFAULT_WORKERS=8
+
+def fleet_find_docks(vid:int=FLEET_DEFAULT_VID, pid:int=0)->list:
+    """Enumerate every USB HID dock matching vid/pid, without printing.
+
+    Returns:
+        list: hid.enumerate() dicts, one per device path
+    """
+    try:
+        return(HidDeviceRegistry(vid,pid).devices())
+
+    except IOError as ex:
+        print(ex)
+        return([])
+
+def fleet_dock_name(device_dict:dict)->str:
+    serial_number=device_dict.get('serial_number')
+    if serial_number:
+        return(serial_number)
+    return(device_dict['path'].decode('ascii','replace'))
+
+def fleet_unique_docks(devices:list)->list:
+    """One device dict per dock: the lowest interface of each serial number, like HidDeviceRegistry.find()."""
+    docks={}
+    for device_dict in sorted(devices,key=lambda d: d.get('interface_number',0)):
+        docks.setdefault(fleet_dock_name(device_dict),device_dict)
+    return(list(docks.values()))
+
+class FleetUpdater:
+    """Flash one FWCT composite to many docks in parallel worker threads.
+
+    The image is mapped and its digests are checked once, all workers share the
+    read-only segment views. Each dock is opened by its hid path so identical
+    VID/PIDs are addressed individually. hidapi releases the GIL during
+    transfers, so threads scale with the number of docks.
+
+    Args:
+        imageFile (str): FWCT image path
+        max_workers (int, optional): docks flashed at the same time. Defaults to FLEET_DEFAULT_WORKERS.
+        window (int, optional): outstanding FW_ACT_WBUF reports per dock. Defaults to FWUP_DEFAULT_WINDOW.
+        verify (bool, optional): check image_digest before finishing each image. Defaults to True.
+        progress (callable, optional): progress(dock, done_bytes, total_bytes, bytes_per_sec)
+    """
+
+    def __init__(self, imageFile:str, max_workers:int=FLEET_DEFAULT_WORKERS, window:int=FWUP_DEFAULT_WINDOW,
+                 verify:bool=True, progress=None):
+        self.imageFile=imageFile
+        self.max_workers=max(1,max_workers)
+        self.window=window
+        self.verify=verify
+        self.progress=progress
+        self.lock=threading.Lock()
+        self.dock_bytes={}
+        self.start_time=0.0
+
+    def aggregate_throughput(self)->float:
+        elapsed=time.monotonic()-self.start_time
+        if elapsed <= 0:
+            return(0.0)
+        with self.lock:
+            return(sum(self.dock_bytes.values())/elapsed)
+
+    def update_dock(self, device_dict:dict, composite:list, digest_checks:dict)->dict:
+        dock=fleet_dock_name(device_dict)
+
+        def dock_progress(done_bytes, total_bytes, bytes_per_sec):
+            with self.lock:
+                self.dock_bytes[dock]=done_bytes
+            if self.progress is not None:
+                self.progress(dock,done_bytes,total_bytes,bytes_per_sec)
+
+        try:
+            with HidSession(path=device_dict['path']) as s:
+                engine=FwUpdateEngine(s,self.window,progress=dock_progress,digest_checks=digest_checks)
+                return(engine.update_composite(composite))
+
+        except IOError as ex:
+            print("[ERROR]",dock,ex)
+            return(None)
+
+    def run(self, devices:list)->dict:
+        """Update every device.
+
+        Args:
+            devices (list): hid.enumerate() dicts, e.g. from fleet_find_docks(); several
+                interfaces of one dock are flashed once, see fleet_unique_docks()
+
+        Returns:
+            dict: {'docks': {dock: stats or None}, 'failed': [dock, ...],
+                   'bytes', 'seconds', 'bytes_per_sec'}, None when the image is invalid
+        """
+        fwct=load_fwct_image_mmap(self.imageFile)
+        if fwct is None:
+            print("<ERROR> Invalid FWCT image:",self.imageFile)
+            return(None)
+
+        devices=fleet_unique_docks(devices)
+        self.dock_bytes={fleet_dock_name(d):0 for d in devices}
+        self.start_time=time.monotonic()
+        with fwct, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            digest_checks=None
+            if self.verify:
+                images=[imageInfo for imageInfo,segments in fwct_get_image_list(fwct.composite)]
+                digest_checks=fwct_submit_digest_checks(executor,self.imageFile,images)
+            futures={fleet_dock_name(d):executor.submit(self.update_dock,d,fwct.composite,digest_checks)
+                     for d in devices}
+            docks={dock:future.result() for dock,future in futures.items()}
+
+        seconds=time.monotonic()-self.start_time
+        total_bytes=sum(self.dock_bytes.values())
+        result={'docks':docks,
+                'failed':[dock for dock,stats in docks.items() if stats is None],
+                'bytes':total_bytes,
+                'seconds':seconds,
+                'bytes_per_sec':total_bytes/seconds if seconds > 0 else 0.0}
+        print("[INFO] Fleet update: %d docks, %d failed, %d bytes, %.2f s, %.0f bytes/s" %
+              (len(docks),len(result['failed']),total_bytes,seconds,result['bytes_per_sec']))
+        return(result)
+
+def fleet_update_all(imageFile:str, vid:int=FLEET_DEFAULT_VID, pid:int=0,
+                     max_workers:int=FLEET_DEFAULT_WORKERS, window:int=FWUP_DEFAULT_WINDOW)->dict:
+    devices=fleet_find_docks(vid,pid)
+    if not devices:
+        print("Not found device: vid=",hex(vid)," pid=",hex(pid))
+        return(None)
+    return(FleetUpdater(imageFile,max_workers,window).run(devices))
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) in (2,3):
+        max_workers=int(sys.argv[2]) if len(sys.argv)==3 else FLEET_DEFAULT_WORKERS
+        result=fleet_update_all(sys.argv[1],max_workers=max_workers)
+        sys.exit(0 if result is not None and not result['failed'] else 1)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.qhidfleet <image> [max_workers]")
+        sys.exit(1)
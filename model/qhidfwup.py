@@ -0,0 +1,617 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from model.qhidapi import *
+from model.fwct import *
+from model.qhidmgr import *
+from model.qhidpoll import HidCompletionManager
+from model.qhidjournal import *
+
+FWUP_ROW_UNIT_SIZE=64       # row size = row_size_ind * 64 bytes
+FWUP_DEFAULT_WINDOW=8       # outstanding FW_ACT_WBUF reports before waiting an ACK
+FWUP_DEFAULT_ROWS_PER_WRITE=1
+
+FWUP_MODE_FULL=0            # component is erased by PREPARE_UPDATE, every row is written
+FWUP_MODE_DIFFERENTIAL=1    # rows which aren't written keep their content, see rows_kept()
+
+# FW_CMD_FW_UPDATE state machine, payload layout per action:
+# FW_ACT_INIT           [0] Component ID [1] Device Type [2] Image Type
+# FW_ACT_PREPARE_UPDATE [0] Component ID [1] Image Type [2] Row Size indicator
+#                       [3] Number of segments [4-7] Image size (little-endian)
+#                       [8] Update mode, FWUP_MODE_*; firmware which doesn't know
+#                       the byte erases the component, so after a FWUP_MODE_DIFFERENTIAL
+#                       prepare one skipped row is read back and every row is
+#                       written when it is gone (resume and read-back update)
+# FW_ACT_WBUF           [0-59] Row data, appended to device buffer
+# FW_ACT_WRITE          [0] Component ID [1] Segment Type
+#                       [2-3] Start row [4-5] Row count (little-endian), buffer -> component
+# FW_ACT_RBUF           [0] Component ID [1] Segment Type
+#                       [2-3] Start row [4-5] Row count (little-endian), component -> buffer
+# FW_ACT_READ           [0-1] Buffer offset (little-endian) [2] Length
+#                       response [4-63] buffer data
+# FW_ACT_STATUS         [0] Component ID
+# FW_ACT_CHECK_FWCT     [0] Component ID [1] Image Type, ACK when the component holds
+#                       the update started by an earlier INIT/PREPARE (resume)
+# FW_ACT_UPDATE_FINISH  [0] Component ID
+#
+# FW_ACT_WBUF reports are pipelined: up to `window` reports are written before
+# the first ACK is collected. All outstanding ACKs are drained at every
+# buffer boundary, before FW_ACT_WRITE is issued.
+#
+# Differential update skips whole images whose fw_version already matches and,
+# with a journal, the rows an interrupted update already wrote. Row read-back
+# (readback=True) is opt-in: the dock has no row/segment digest, so every row
+# is read through FW_ACT_RBUF + FW_ACT_READ, about as many round trips as
+# writing it. It only pays off where programming a row is much slower than
+# reading it, or to spare flash wear.
+
+def fwup_u16(value:int)->list:
+    return([value&0xFF,(value>>8)&0xFF])
+
+def fwup_u32(value:int)->list:
+    return([value&0xFF,(value>>8)&0xFF,(value>>16)&0xFF,(value>>24)&0xFF])
+
+class FwUpdateEngine:
+    """Drive the HID_FWACT_TYPE state machine for FWCT images over one HidSession.
+
+    Args:
+        session (HidSession): opened dock session
+        window (int, optional): outstanding FW_ACT_WBUF reports. Defaults to FWUP_DEFAULT_WINDOW.
+        rows_per_write (int, optional): rows buffered per FW_ACT_WRITE. Defaults to FWUP_DEFAULT_ROWS_PER_WRITE.
+        progress (callable, optional): progress(done_bytes, total_bytes, bytes_per_sec)
+        digest_checks (dict, optional): {Dock_FWCT_ImageInfo: Future[bool]} from
+            fwct_submit_digest_checks(), awaited before UPDATE_FINISH of each image
+        differential (bool, optional): update_composite() skips images already at the
+            target version. Defaults to False.
+        readback (bool, optional): with differential, read every row of the other images back
+            and only rewrite the differing ones; costs about the round trips of a full write,
+            see the note above. Defaults to False.
+        completion (HidCompletionManager, optional): runs the state machine commands through
+            WAIT/DEFER/REENUM. Defaults to a manager of session.
+        journal (FwUpdateJournal, optional): update_composite() checkpoints every acknowledged
+            FW_ACT_WRITE and resumes an interrupted update of the same dock and composite. Defaults to None.
+    """
+
+    def __init__(self, session:HidSession, window:int=FWUP_DEFAULT_WINDOW,
+                 rows_per_write:int=FWUP_DEFAULT_ROWS_PER_WRITE, progress=None, digest_checks:dict=None,
+                 differential:bool=False, completion:HidCompletionManager=None, journal:FwUpdateJournal=None,
+                 readback:bool=False):
+        self.session=session
+        self.completion=completion or HidCompletionManager(session)
+        self.journal=journal
+        self.image_index=None   # position in update_composite(), for journal checkpoints
+        self.segment_index=None
+        self.window=max(1,window)
+        self.rows_per_write=max(1,rows_per_write)
+        self.progress=progress
+        self.digest_checks=digest_checks
+        self.differential=differential
+        self.readback=readback
+        self.skipped_bytes=0
+        self.outstanding=0
+        self.encoder=HidPacketEncoder() # FW_ACT_READ requests
+        HIDMGR_FWINFO_CACHE.attach() # PREPARE/FINISH drop the dock's cached versions,
+        HIDMGR_FWINFO_FILE_CACHE.attach() # on disk too for the other processes
+        self.total_bytes=0
+        self.done_bytes=0
+        self.start_time=0.0
+
+    def fw_command(self, act:HID_FWACT_TYPE, payload:list=None)->bool:
+        hid_data=self.completion.send_fw_command(HID_FWCMD_TYPE.FW_CMD_FW_UPDATE,act,payload)
+        if hid_data is None:
+            return(False)
+        return(hid_data[HID_RSP_OFFSET]==HID_APIRESPONE_TYPE.HIDAPI_ACK.value)
+
+    def collect_ack(self)->bool:
+        """Collect one outstanding FW_ACT_WBUF response."""
+        hid_data=self.session.wait_response(HID_REPORID_TYPE.RID_FW.value,
+                                            HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value,
+                                            HID_FWACT_TYPE.FW_ACT_WBUF.value,
+                                            hidapi_get_cmd_timeout(HID_FWCMD_TYPE.FW_CMD_FW_UPDATE,HID_FWACT_TYPE.FW_ACT_WBUF))
+        self.outstanding -=1
+        if not hid_data:
+            print("HID_CMD TIMEOUT: FW_ACT_WBUF")
+            return(False)
+        if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+            return(False)
+        return(True)
+
+    def drain(self)->bool:
+        result=True
+        while self.outstanding > 0:
+            result=self.collect_ack() and result
+        return(result)
+
+    def write_buffer(self, data)->bool:
+        """Stream data to the device buffer in HID_PACKET_PADLOAD_SIZE chunks."""
+        frames=HidFrameBatch(HID_REPORID_TYPE.RID_FW.value,HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value,
+                             HID_FWACT_TYPE.FW_ACT_WBUF.value,data)
+        for hid_pkt in frames:
+            if self.outstanding >= self.window:
+                if not self.collect_ack():
+                    return(False)
+            self.session.write_packet(hid_pkt)
+            self.outstanding +=1
+        return(True)
+
+    def report_progress(self, nbytes:int, skipped:bool=False):
+        if skipped:
+            self.skipped_bytes +=nbytes
+        else:
+            self.done_bytes +=nbytes
+        if self.progress is not None:
+            self.progress(self.done_bytes+self.skipped_bytes,self.total_bytes,self.throughput())
+
+    def throughput(self)->float:
+        elapsed=time.monotonic()-self.start_time
+        if elapsed <= 0:
+            return(0.0)
+        return(self.done_bytes/elapsed)
+
+    def write_rows(self, imageInfo:Dock_FWCT_ImageInfo, segInfo:Dock_FWCT_SegmentInfo, row:int, data)->int:
+        """Write data to the component starting at row, one FW_ACT_WRITE per buffer.
+
+        Returns:
+            int: next row, -1 when failed
+        """
+        row_size=imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE
+        buf_size=row_size*self.rows_per_write
+        view=memoryview(data)
+        for pos in range(0,len(view),buf_size):
+            buf=view[pos:pos+buf_size]
+            row_count=(len(buf)+row_size-1)//row_size
+            if not self.write_buffer(buf):
+                return(-1)
+            if not self.drain():
+                return(-1)
+            payload=[imageInfo.component_id,segInfo.image_type]+fwup_u16(row)+fwup_u16(row_count)
+            if not self.fw_command(HID_FWACT_TYPE.FW_ACT_WRITE,payload):
+                print("[ERROR] FW_ACT_WRITE fail, row:",row)
+                return(-1)
+            row +=row_count
+            if self.journal is not None and self.image_index is not None:
+                self.journal.checkpoint(self.image_index,imageInfo,self.segment_index,row)
+            self.report_progress(len(buf))
+        return(row)
+
+    def update_segment(self, imageInfo:Dock_FWCT_ImageInfo, segInfo:Dock_FWCT_SegmentInfo, binCode)->bool:
+        return(self.write_rows(imageInfo,segInfo,segInfo.segment_start_row,binCode) >= 0)
+
+    def collect_read(self, data:bytearray)->bool:
+        """Collect one outstanding FW_ACT_READ response into data."""
+        hid_data=self.session.wait_response(HID_REPORID_TYPE.RID_FW.value,
+                                            HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value,
+                                            HID_FWACT_TYPE.FW_ACT_READ.value,
+                                            hidapi_get_cmd_timeout(HID_FWCMD_TYPE.FW_CMD_FW_UPDATE,HID_FWACT_TYPE.FW_ACT_READ))
+        self.outstanding -=1
+        if not hid_data or hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            print("HID_CMD FAIL: FW_ACT_READ")
+            return(False)
+        data.extend(hid_data[HID_DATA_OFFSET:HID_PACKET_SIZE_MAX])
+        return(True)
+
+    def read_rows(self, imageInfo:Dock_FWCT_ImageInfo, segInfo:Dock_FWCT_SegmentInfo, row:int, row_count:int)->bytes:
+        """Read rows back from the component: FW_ACT_RBUF, then pipelined FW_ACT_READ.
+
+        Returns:
+            bytes: row data, None when failed
+        """
+        if not self.drain():
+            return(None)
+        payload=[imageInfo.component_id,segInfo.image_type]+fwup_u16(row)+fwup_u16(row_count)
+        if not self.fw_command(HID_FWACT_TYPE.FW_ACT_RBUF,payload):
+            return(None)
+        size=row_count*imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE
+        data=bytearray()
+        for offset in range(0,size,HID_PACKET_PADLOAD_SIZE):
+            if self.outstanding >= self.window:
+                if not self.collect_read(data):
+                    self.drain_reads()
+                    return(None)
+            length=min(HID_PACKET_PADLOAD_SIZE,size-offset)
+            hid_pkt=self.encoder.encode(HID_REPORID_TYPE.RID_FW.value,HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value,
+                                        HID_FWACT_TYPE.FW_ACT_READ.value,fwup_u16(offset)+[length])
+            self.session.write_packet(hid_pkt)
+            self.outstanding +=1
+        while self.outstanding > 0:
+            if not self.collect_read(data):
+                self.drain_reads()
+                return(None)
+        return(bytes(data[:size]))
+
+    def drain_reads(self):
+        scratch=bytearray()
+        while self.outstanding > 0:
+            self.collect_read(scratch)
+
+    def diff_segment(self, imageInfo:Dock_FWCT_ImageInfo, segInfo:Dock_FWCT_SegmentInfo, binCode)->list:
+        """Buffers of a segment whose rows differ from the component.
+
+        Returns:
+            list: [(row, memoryview), ...] to write, None when read back failed
+        """
+        row_size=imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE
+        buf_size=row_size*self.rows_per_write
+        view=memoryview(binCode)
+        changed=[]
+        row=segInfo.segment_start_row
+        for pos in range(0,len(view),buf_size):
+            buf=view[pos:pos+buf_size]
+            row_count=(len(buf)+row_size-1)//row_size
+            current=self.read_rows(imageInfo,segInfo,row,row_count)
+            if current is None:
+                return(None)
+            if current[:len(buf)] != buf:
+                changed.append((row,buf))
+            row +=row_count
+        return(changed)
+
+    def rows_kept(self, imageInfo:Dock_FWCT_ImageInfo, segInfo:Dock_FWCT_SegmentInfo, row:int, data)->bool:
+        """True when row still holds data after a FWUP_MODE_DIFFERENTIAL PREPARE_UPDATE."""
+        current=self.read_rows(imageInfo,segInfo,row,1)
+        return(current is not None and current[:len(data)]==bytes(data))
+
+    def last_written_row(self, imageInfo:Dock_FWCT_ImageInfo, segments:list, segment_index:int, row:int)->tuple:
+        """(segInfo, row, data) of the last row before segment_index/row, None when there is none."""
+        row_size=imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE
+        for index in range(min(segment_index,len(segments)-1),-1,-1):
+            segInfo,binCode=segments[index]
+            end=segInfo.segment_start_row+(len(binCode)+row_size-1)//row_size
+            last=(min(row,end) if index == segment_index else end)-1
+            if last >= segInfo.segment_start_row:
+                offset=(last-segInfo.segment_start_row)*row_size
+                return((segInfo,last,memoryview(binCode)[offset:offset+row_size]))
+        return(None)
+
+    def init_image(self, imageInfo:Dock_FWCT_ImageInfo)->bool:
+        component_id=imageInfo.component_id
+        if not self.drain():
+            return(False)
+        if not self.fw_command(HID_FWACT_TYPE.FW_ACT_INIT,
+                               [component_id,imageInfo.device_type,imageInfo.image_type]):
+            print("[ERROR] FW_ACT_INIT fail, component:",component_id)
+            return(False)
+        return(True)
+
+    def prepare_image(self, imageInfo:Dock_FWCT_ImageInfo, num_segments:int, mode:int=FWUP_MODE_FULL)->bool:
+        component_id=imageInfo.component_id
+        payload=[component_id,imageInfo.image_type,imageInfo.row_size_ind,num_segments]
+        payload+=fwup_u32(imageInfo.image_size)+[mode]
+        if not self.fw_command(HID_FWACT_TYPE.FW_ACT_PREPARE_UPDATE,payload):
+            print("[ERROR] FW_ACT_PREPARE_UPDATE fail, component:",component_id)
+            return(False)
+        return(True)
+
+    def begin_image(self, imageInfo:Dock_FWCT_ImageInfo, num_segments:int)->bool:
+        return(self.init_image(imageInfo) and self.prepare_image(imageInfo,num_segments))
+
+    def end_image(self, imageInfo:Dock_FWCT_ImageInfo)->bool:
+        component_id=imageInfo.component_id
+        if self.digest_checks is not None and imageInfo in self.digest_checks:
+            if not self.digest_checks[imageInfo].result():
+                print("[ERROR] image_digest mismatch, component:",component_id)
+                self.abort_image(imageInfo)
+                return(False)
+        if not self.fw_command(HID_FWACT_TYPE.FW_ACT_STATUS,[component_id]):
+            print("[ERROR] FW_ACT_STATUS fail, component:",component_id)
+            return(False)
+        if not self.fw_command(HID_FWACT_TYPE.FW_ACT_UPDATE_FINISH,[component_id]):
+            return(False)
+        if self.journal is not None and self.image_index is not None:
+            self.journal.image_done(self.image_index,imageInfo)
+        return(True)
+
+    def abort_image(self, imageInfo:Dock_FWCT_ImageInfo):
+        self.drain()
+        self.fw_command(HID_FWACT_TYPE.FW_ACT_RESET,[imageInfo.component_id])
+
+    def update_image(self, imageInfo:Dock_FWCT_ImageInfo, segments:list)->bool:
+        """Update one component image.
+
+        Args:
+            imageInfo (Dock_FWCT_ImageInfo): image table entry
+            segments (list): [(Dock_FWCT_SegmentInfo, binCode), ...]
+
+        Returns:
+            bool: True when the component acknowledged UPDATE_FINISH
+        """
+        try:
+            if self.differential and self.readback:
+                return(self.update_image_differential(imageInfo,segments))
+            if not self.begin_image(imageInfo,len(segments)):
+                return(False)
+            for self.segment_index,(segInfo,binCode) in enumerate(segments):
+                if not self.update_segment(imageInfo,segInfo,binCode):
+                    self.abort_image(imageInfo)
+                    return(False)
+            return(self.end_image(imageInfo))
+
+        except IOError as ex:
+            print(ex)
+            return(False)
+
+    def resume_image(self, imageInfo:Dock_FWCT_ImageInfo, segments:list, segment_index:int, row:int)->bool:
+        """Continue an interrupted update of one image at segment_index / row.
+
+        The dock has to report the component idle (FW_ACT_STATUS) and still
+        holding the update (FW_ACT_CHECK_FWCT); rows already written are kept
+        by preparing in FWUP_MODE_DIFFERENTIAL. Otherwise the image is updated
+        from the start.
+        """
+        component_id=imageInfo.component_id
+        try:
+            if not self.init_image(imageInfo):
+                return(False)
+            if not (self.fw_command(HID_FWACT_TYPE.FW_ACT_STATUS,[component_id]) and
+                    self.fw_command(HID_FWACT_TYPE.FW_ACT_CHECK_FWCT,[component_id,imageInfo.image_type])):
+                print("[INFO] Resume rejected, full update, component:",component_id)
+                self.fw_command(HID_FWACT_TYPE.FW_ACT_RESET,[component_id])
+                return(self.update_image(imageInfo,segments))
+            if not self.prepare_image(imageInfo,len(segments),FWUP_MODE_DIFFERENTIAL):
+                return(False)
+            written=self.last_written_row(imageInfo,segments,segment_index,row)
+            if written is not None and not self.rows_kept(imageInfo,*written):
+                print("[INFO] Written rows not kept, full write, component:",component_id)
+                segment_index,row=0,segments[0][0].segment_start_row
+            print("[INFO] Resume component:",component_id,"segment:",segment_index,"row:",row)
+            row_size=imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE
+            for self.segment_index,(segInfo,binCode) in enumerate(segments):
+                if self.segment_index < segment_index:
+                    self.report_progress(len(binCode),skipped=True)
+                    continue
+                start=row if self.segment_index == segment_index else segInfo.segment_start_row
+                offset=min(len(binCode),max(0,start-segInfo.segment_start_row)*row_size)
+                if offset:
+                    self.report_progress(offset,skipped=True)
+                if offset < len(binCode) and self.write_rows(imageInfo,segInfo,start,memoryview(binCode)[offset:]) < 0:
+                    self.abort_image(imageInfo)
+                    return(False)
+            return(self.end_image(imageInfo))
+
+        except IOError as ex:
+            print(ex)
+            return(False)
+
+    def update_image_differential(self, imageInfo:Dock_FWCT_ImageInfo, segments:list)->bool:
+        """Read the component back before PREPARE_UPDATE and rewrite only differing buffers."""
+        if not self.init_image(imageInfo):
+            return(False)
+        changes=[]
+        for segInfo,binCode in segments:
+            changed=self.diff_segment(imageInfo,segInfo,binCode)
+            if changed is None:
+                print("[ERROR] Read back fail, component:",imageInfo.component_id)
+                self.abort_image(imageInfo)
+                return(False)
+            changes.append((segInfo,changed))
+            changed_bytes=sum(len(buf) for row,buf in changed)
+            self.report_progress(len(binCode)-changed_bytes,skipped=True)
+        if not self.prepare_image(imageInfo,len(segments),FWUP_MODE_DIFFERENTIAL):
+            return(False)
+        unchanged=self.first_unchanged_row(imageInfo,segments,changes)
+        if unchanged is not None and not self.rows_kept(imageInfo,*unchanged):
+            print("[INFO] Unchanged rows not kept, full write, component:",imageInfo.component_id)
+            self.skipped_bytes -=sum(len(binCode) for segInfo,binCode in segments)-sum(
+                len(buf) for segInfo,changed in changes for row,buf in changed)
+            changes=[(segInfo,[(segInfo.segment_start_row,binCode)]) for segInfo,binCode in segments]
+        for self.segment_index,(segInfo,changed) in enumerate(changes):
+            for row,buf in changed:
+                if self.write_rows(imageInfo,segInfo,row,buf) < 0:
+                    self.abort_image(imageInfo)
+                    return(False)
+        return(self.end_image(imageInfo))
+
+    def first_unchanged_row(self, imageInfo:Dock_FWCT_ImageInfo, segments:list, changes:list)->tuple:
+        """(segInfo, row, data) of the first row diff_segment() found equal, None when every row changed."""
+        row_size=imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE
+        buf_size=row_size*self.rows_per_write
+        for (segInfo,binCode),(changeInfo,changed) in zip(segments,changes):
+            changed_rows={row for row,buf in changed}
+            for pos in range(0,len(binCode),buf_size):
+                row=segInfo.segment_start_row+pos//row_size
+                if row not in changed_rows:
+                    return((segInfo,row,memoryview(binCode)[pos:pos+row_size]))
+        return(None)
+
+    def update_stream(self, segment_iter)->dict:
+        """Update components while the image is still being read.
+
+        Args:
+            segment_iter: fwct_iter_segments() generator, (image_info, segment_info, chunk)
+
+        Returns:
+            dict: {'bytes','seconds','bytes_per_sec'}, None when failed
+        """
+        self.total_bytes=0 # unknown up front
+        self.done_bytes=0
+        self.start_time=time.monotonic()
+        imageInfo=None
+        segInfo=None
+        row=0
+        carry=b''
+        try:
+            for chunk_image,chunk_seg,chunk in segment_iter:
+                if chunk_seg is not segInfo:
+                    if carry and self.write_rows(imageInfo,segInfo,row,carry) < 0:
+                        self.abort_image(imageInfo)
+                        return(None)
+                    carry=b''
+                    if chunk_image is not imageInfo:
+                        if imageInfo is not None and not self.end_image(imageInfo):
+                            return(None)
+                        imageInfo=chunk_image
+                        print("[INFO] Update component:",imageInfo.component_id,"device_type:",imageInfo.device_type)
+                        if not self.begin_image(imageInfo,imageInfo.num_image_segments):
+                            return(None)
+                    segInfo=chunk_seg
+                    row=segInfo.segment_start_row
+                # only whole buffers are written, the rest waits for the next chunk
+                data=carry+chunk if carry else chunk
+                buf_size=imageInfo.row_size_ind*FWUP_ROW_UNIT_SIZE*self.rows_per_write
+                aligned=len(data)-len(data)%buf_size
+                row=self.write_rows(imageInfo,segInfo,row,data[:aligned])
+                if row < 0:
+                    self.abort_image(imageInfo)
+                    return(None)
+                carry=data[aligned:]
+            if imageInfo is not None:
+                if carry and self.write_rows(imageInfo,segInfo,row,carry) < 0:
+                    self.abort_image(imageInfo)
+                    return(None)
+                if not self.end_image(imageInfo):
+                    return(None)
+
+        except (IOError,ValueError) as ex:
+            print(ex)
+            return(None)
+        return(self.finish_stats())
+
+    def update_composite(self, composite:list, dev_fw_info:list=None)->dict:
+        """Update every image of a load_fwct_image() composite.
+
+        Args:
+            composite (list): load_fwct_image() list
+            dev_fw_info (list, optional): hidmgr_get_device_firmware_info() result; in
+                differential mode images already at their version are skipped. Defaults to None.
+
+        Returns:
+            dict: {'bytes','skipped_bytes','seconds','bytes_per_sec'}, None when any image failed
+        """
+        image_list=fwct_get_image_list(composite)
+        self.total_bytes=sum(len(binCode) for imageInfo,segments in image_list for segInfo,binCode in segments)
+        self.done_bytes=0
+        self.skipped_bytes=0
+        self.start_time=time.monotonic()
+        resume=None
+        if self.journal is not None:
+            serial_number=self.completion.dock_serial()
+            if serial_number:
+                self.journal.open(serial_number,fwjournal_composite_key(image_list))
+                resume=self.journal.resume_point(image_list)
+            else: # can't tell the journal's dock apart, keep it untouched
+                print("[WARN] No dock serial number, update isn't journaled")
+        try:
+            for self.image_index,(imageInfo,segments) in enumerate(image_list):
+                image_bytes=sum(len(binCode) for segInfo,binCode in segments)
+                if resume is not None and self.image_index <= resume[0]:
+                    if self.image_index < resume[0] or resume[2] is None:
+                        print("[INFO] Skip journaled component:",imageInfo.component_id)
+                        self.report_progress(image_bytes,skipped=True)
+                        continue
+                    result=self.resume_image(imageInfo,segments,resume[1],resume[2])
+                elif self.differential and hidmgr_is_image_up_to_date(dev_fw_info,imageInfo):
+                    print("[INFO] Skip up-to-date component:",imageInfo.component_id,"fw_version:",hex(imageInfo.fw_version))
+                    self.report_progress(image_bytes,skipped=True)
+                    continue
+                else:
+                    print("[INFO] Update component:",imageInfo.component_id,"device_type:",imageInfo.device_type)
+                    result=self.update_image(imageInfo,segments)
+                if not result:
+                    print("[ERROR] Update fail, component:",imageInfo.component_id)
+                    return(None)
+            if self.journal is not None:
+                self.journal.finish()
+            return(self.finish_stats())
+        finally:
+            self.image_index=None
+            self.segment_index=None
+            if self.journal is not None:
+                self.journal.close()
+
+    def finish_stats(self)->dict:
+        seconds=time.monotonic()-self.start_time
+        stats={'bytes':self.done_bytes,'skipped_bytes':self.skipped_bytes,'seconds':seconds,'bytes_per_sec':self.throughput()}
+        print("[INFO] Update done: %d bytes, %.2f s, %.0f bytes/s" % (stats['bytes'],seconds,stats['bytes_per_sec']))
+        return(stats)
+
+def fwup_update_device(vid:int, pid:int, imageFile:str, window:int=FWUP_DEFAULT_WINDOW, serial_number:str=None, verify:bool=True,
+                       differential:bool=False, journal_file:str=None, transport:str=None)->dict:
+    """Flash a FWCT composite image to one dock.
+
+    Args:
+        vid (int): vendor id
+        pid (int): product id
+        imageFile (str): FWCT image path
+        window (int, optional): outstanding FW_ACT_WBUF reports. Defaults to FWUP_DEFAULT_WINDOW.
+        serial_number (str, optional): dock serial number. Defaults to None.
+        verify (bool, optional): check image_digest on a thread pool while the
+            transfer runs, an image is only finished when its digest matches. Defaults to True.
+        differential (bool, optional): skip up-to-date images. Defaults to False.
+        journal_file (str, optional): checkpoint journal; an interrupted update of the same dock
+            and image resumes from it, it is removed when the update completed. Defaults to None.
+        transport (str, optional): HID_TRANSPORT_LIBUSB keeps several interrupt transfers
+            queued. Defaults to HID_TRANSPORT_DEFAULT.
+
+    Returns:
+        dict: transfer statistics, None when failed
+    """
+    fwct=None
+    try:
+        fwct=load_fwct_image_mmap(imageFile)
+        if fwct is None:
+            print("<ERROR> Invalid FWCT image:",imageFile)
+            return(None)
+        with fwct, ThreadPoolExecutor() as executor, HidSession(vid, pid, serial_number, transport=transport) as s:
+            digest_checks=None
+            if verify:
+                images=[imageInfo for imageInfo,segments in fwct_get_image_list(fwct.composite)]
+                digest_checks=fwct_submit_digest_checks(executor,imageFile,images)
+            journal=FwUpdateJournal(journal_file) if journal_file else None
+            engine=FwUpdateEngine(s,window,digest_checks=digest_checks,differential=differential,journal=journal)
+            dev_fw_info=None
+            if differential:
+                dev_fw_info=hidmgr_get_session_firmware_info(s,HIDMGR_FWINFO_CACHE)
+            return(engine.update_composite(fwct.composite,dev_fw_info))
+
+    except (IOError,ValueError) as ex:
+        print(ex)
+        return(None)
+    finally:
+        if fwct is not None:
+            fwct.close()
+
+def fwup_update_device_stream(vid:int, pid:int, source:str, member:str=None, window:int=FWUP_DEFAULT_WINDOW, serial_number:str=None,
+                              transport:str=None)->dict:
+    """Flash a FWCT image read from a stream: '-' (stdin), .gz file or .zip release archive.
+
+    Transfer starts with the first segment while the rest of the image is still being read.
+
+    Args:
+        vid (int): vendor id
+        pid (int): product id
+        source (str): see fwct_open_stream()
+        member (str, optional): member name inside a .zip archive. Defaults to None.
+        window (int, optional): outstanding FW_ACT_WBUF reports. Defaults to FWUP_DEFAULT_WINDOW.
+        serial_number (str, optional): dock serial number. Defaults to None.
+        transport (str, optional): see fwup_update_device(). Defaults to HID_TRANSPORT_DEFAULT.
+
+    Returns:
+        dict: transfer statistics, None when failed
+    """
+    try:
+        stream=fwct_open_stream(source,member)
+        if stream is None:
+            print("<ERROR> No FWCT image in:",source)
+            return(None)
+        with stream, HidSession(vid, pid, serial_number, transport=transport) as s:
+            return(FwUpdateEngine(s,window).update_stream(fwct_iter_segments(stream)))
+
+    except (IOError,ValueError) as ex:
+        print(ex)
+        return(None)
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) in (2,3):
+        vid=0x2BEF
+        pid=0x0415
+        imageFile=sys.argv[1]
+        if imageFile == '-' or imageFile.lower().endswith(('.gz','.zip')):
+            stats=fwup_update_device_stream(vid, pid, imageFile)
+        else:
+            stats=fwup_update_device(vid, pid, imageFile, journal_file=sys.argv[2] if len(sys.argv) == 3 else None)
+        sys.exit(0 if stats is not None else 1)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.qhidfwup <image> [journal]")
+        sys.exit(1)
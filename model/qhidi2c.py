@@ -0,0 +1,172 @@
+from model.qhidapi import *
+
+I2C_ADDR_FIRST=0x08 # 7-bit addresses, reserved ranges excluded
+I2C_ADDR_LAST=0x77
+I2C_SCAN_WINDOW=16  # outstanding IOBUS_ACT_PROBE reports during scan()
+I2C_MEM_HEADER_SIZE=5
+I2C_MEM_WRITE_MAX=HID_PACKET_PADLOAD_SIZE-I2C_MEM_HEADER_SIZE # data bytes per MEM_WRITE report
+I2C_MEM_READ_MAX=HID_PACKET_PADLOAD_SIZE                      # data bytes per MEM_READ response
+
+# IOBUS_CMD_I2C payload layout per action:
+# IOBUS_ACT_MEM_READ  [0] 7-bit address [1] Memory address size (1/2)
+#                     [2-3] Memory address (little-endian) [4] Length
+#                     response [4-63] data
+# IOBUS_ACT_MEM_WRITE [0-4] as MEM_READ [5-59] data
+# IOBUS_ACT_PROBE     [0] 7-bit address, response [4] 1: device acknowledged
+
+def i2c_mem_header(addr:int, mem_addr:int, mem_addr_size:int, length:int)->list:
+    return([addr&0x7F,mem_addr_size,mem_addr&0xFF,(mem_addr>>8)&0xFF,length])
+
+class I2cBus:
+    """Bulk memory access and bus scan over IOBUS_CMD_I2C.
+
+    Transfers of any length are split into per-report chunks (and page
+    boundaries for writes); the reports of one transfer are pipelined with
+    up to `window` outstanding.
+
+    Args:
+        session (HidSession): opened dock session
+        window (int, optional): outstanding reports. Defaults to HID_PIPELINE_WINDOW.
+    """
+
+    def __init__(self, session:HidSession, window:int=HID_PIPELINE_WINDOW):
+        self.session=session
+        self.window=window
+        self.encoder=HidPacketEncoder()
+
+    def pipelined(self, act:HID_IOBUSACT_TYPE, payloads, window:int=None)->list:
+        hid_pkts=self.encoder.encode_each(HID_REPORID_TYPE.RID_BUSIO.value,HID_IOBUSCMD_TYPE.IOBUS_CMD_I2C.value,
+                                          act.value,payloads)
+        return(self.session.transfer_pipelined(hid_pkts,window or self.window,
+                                               hidapi_get_cmd_timeout(HID_IOBUSCMD_TYPE.IOBUS_CMD_I2C,act)))
+
+    def mem_read(self, addr:int, mem_addr:int, length:int, mem_addr_size:int=1)->bytes:
+        """Read length bytes of device memory, None when failed (NACK or IO error)."""
+        payloads=(i2c_mem_header(addr,mem_addr+pos,mem_addr_size,min(I2C_MEM_READ_MAX,length-pos))
+                  for pos in range(0,length,I2C_MEM_READ_MAX))
+        responses=self.pipelined(HID_IOBUSACT_TYPE.IOBUS_ACT_MEM_READ,payloads)
+        if responses is None:
+            return(None)
+        data=bytearray()
+        for hid_data in responses:
+            if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+                print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+                return(None)
+            data.extend(hid_data[HID_DATA_OFFSET:HID_PACKET_SIZE_MAX])
+        return(bytes(data[:length]))
+
+    def mem_write(self, addr:int, mem_addr:int, data, mem_addr_size:int=1, page_size:int=None)->bool:
+        """Write device memory, chunks never cross a page_size boundary.
+
+        Args:
+            page_size (int, optional): EEPROM page size. Defaults to None (no paging).
+        """
+        data=bytes(data)
+        chunks=[]
+        pos=0
+        while pos < len(data):
+            size=min(I2C_MEM_WRITE_MAX,len(data)-pos)
+            if page_size:
+                size=min(size,page_size-(mem_addr+pos)%page_size)
+            chunks.append((pos,size))
+            pos +=size
+        payloads=(i2c_mem_header(addr,mem_addr+pos,mem_addr_size,size)+list(data[pos:pos+size])
+                  for pos,size in chunks)
+        responses=self.pipelined(HID_IOBUSACT_TYPE.IOBUS_ACT_MEM_WRITE,payloads)
+        if responses is None:
+            return(False)
+        for hid_data in responses:
+            if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+                print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+                return(False)
+        return(True)
+
+    def probe(self, addr:int)->bool:
+        hid_data=self.session.send_iobus_command(HID_IOBUSCMD_TYPE.IOBUS_CMD_I2C,
+                                                 HID_IOBUSACT_TYPE.IOBUS_ACT_PROBE,[addr&0x7F])
+        return(hid_data is not None and
+               hid_data[HID_RSP_OFFSET]==HID_APIRESPONE_TYPE.HIDAPI_ACK.value and
+               hid_data[HID_DATA_OFFSET]!=0)
+
+    def scan(self, first:int=I2C_ADDR_FIRST, last:int=I2C_ADDR_LAST, window:int=I2C_SCAN_WINDOW)->list:
+        """Probe every address in [first, last] with pipelined requests.
+
+        Returns:
+            list: addresses which acknowledged, None when IO error
+        """
+        addrs=list(range(first,last+1))
+        responses=self.pipelined(HID_IOBUSACT_TYPE.IOBUS_ACT_PROBE,([addr] for addr in addrs),window)
+        if responses is None:
+            return(None)
+        return([addr for addr,hid_data in zip(addrs,responses)
+                if hid_data[HID_RSP_OFFSET]==HID_APIRESPONE_TYPE.HIDAPI_ACK.value and hid_data[HID_DATA_OFFSET]!=0])
+
+    def device(self, addr:int, mem_addr_size:int=1, page_size:int=None, cache:bool=True):
+        return(I2cDevice(self,addr,mem_addr_size,page_size,cache))
+
+class I2cDevice:
+    """One I2C device memory with a write-through byte cache.
+
+    Reads are served from the cache when every requested byte is cached;
+    otherwise the range is read from the device and cached. Writes go to the
+    device first and update the cache on success. Pass use_cache=False (or
+    call invalidate()) for volatile status registers.
+
+    Args:
+        bus (I2cBus): bus of the device
+        addr (int): 7-bit address
+        mem_addr_size (int, optional): 1 or 2 byte memory address. Defaults to 1.
+        page_size (int, optional): EEPROM page size. Defaults to None.
+        cache (bool, optional): enable the cache. Defaults to True.
+    """
+
+    def __init__(self, bus:I2cBus, addr:int, mem_addr_size:int=1, page_size:int=None, cache:bool=True):
+        self.bus=bus
+        self.addr=addr
+        self.mem_addr_size=mem_addr_size
+        self.page_size=page_size
+        self.cache={} if cache else None # mem_addr -> byte
+
+    def read(self, mem_addr:int, length:int, use_cache:bool=True)->bytes:
+        if use_cache and self.cache is not None:
+            try:
+                return(bytes(self.cache[a] for a in range(mem_addr,mem_addr+length)))
+            except KeyError:
+                pass
+        data=self.bus.mem_read(self.addr,mem_addr,length,self.mem_addr_size)
+        if data is not None and self.cache is not None:
+            self.cache.update(zip(range(mem_addr,mem_addr+length),data))
+        return(data)
+
+    def write(self, mem_addr:int, data)->bool:
+        data=bytes(data)
+        if not self.bus.mem_write(self.addr,mem_addr,data,self.mem_addr_size,self.page_size):
+            self.invalidate(mem_addr,len(data)) # partially written
+            return(False)
+        if self.cache is not None:
+            self.cache.update(zip(range(mem_addr,mem_addr+len(data)),data))
+        return(True)
+
+    def read_reg(self, reg:int, use_cache:bool=True)->int:
+        data=self.read(reg,1,use_cache)
+        return(None if data is None else data[0])
+
+    def write_reg(self, reg:int, value:int)->bool:
+        return(self.write(reg,[value&0xFF]))
+
+    def invalidate(self, mem_addr:int=None, length:int=1):
+        """Drop cached bytes, all of them when mem_addr is None."""
+        if self.cache is None:
+            return
+        if mem_addr is None:
+            self.cache.clear()
+        else:
+            for a in range(mem_addr,mem_addr+length):
+                self.cache.pop(a,None)
+
+if __name__ == "__main__":
+    vid=0x2BEF
+    pid=0x0415
+    with HidSession(vid, pid) as s:
+        found=I2cBus(s).scan()
+        print("I2C devices:",None if found is None else [hex(addr) for addr in found])
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import hashlib
+
+FWJOURNAL_VERSION=1
+FWJOURNAL_SYNC_INTERVAL=1.0 # unit:s, fsync period of checkpoint records; image ends are always synced
+
+# Journal file, one JSON object per line:
+#   {"version":1,"serial":"SN0001","composite":"<sha256 hex>"}            header
+#   {"image":0,"component_id":0,"digest":"<hex>","segment":1,"row":96}    rows < row acknowledged
+#   {"image":0,"component_id":0,"digest":"<hex>","done":true}             UPDATE_FINISH acknowledged
+# A torn last line (power loss) is ignored and cut off by open() before the next
+# record is appended. Losing the unsynced tail only moves the resume point back; rows are rewritten in FWUP_MODE_DIFFERENTIAL, so
+# writing a row twice is harmless.
+
+def fwjournal_composite_key(image_list:list)->str:
+    """Identity of a composite: hash of the image table entries which define the payload."""
+    sha=hashlib.sha256()
+    for imageInfo,segments in image_list:
+        sha.update(bytes(imageInfo.image_digest))
+        sha.update(b"%d:%d:%d:%d:%d:" % (imageInfo.component_id,imageInfo.image_type,imageInfo.fw_version,
+                                         imageInfo.image_size,len(segments)))
+        for segInfo,binCode in segments:
+            sha.update(b"%d:%d;" % (segInfo.segment_start_row,segInfo.segment_size))
+    return(sha.hexdigest())
+
+class FwUpdateJournal:
+    """Append-only checkpoint journal of one dock firmware update.
+
+    FwUpdateEngine appends a record after every acknowledged FW_ACT_WRITE and
+    UPDATE_FINISH. open() keeps the records of an earlier, interrupted update
+    of the same dock serial number and composite, resume_point() tells where
+    it stopped; anything else starts a new journal. finish() removes the file.
+    Records and finish() are ignored while the journal isn't open.
+
+    Args:
+        journal_file (str): journal path
+        sync_interval (float, optional): fsync period, unit:s. Defaults to FWJOURNAL_SYNC_INTERVAL.
+    """
+
+    def __init__(self, journal_file:str, sync_interval:float=FWJOURNAL_SYNC_INTERVAL):
+        self.journal_file=journal_file
+        self.sync_interval=sync_interval
+        self.f=None
+        self.records=[]
+        self.sync_time=0.0
+        self.good_size=0 # file offset after the last complete record
+
+    def load(self)->list:
+        """Records of the journal file, header first; [] when missing."""
+        records=[]
+        self.good_size=0
+        try:
+            with open(self.journal_file, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # torn write
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                    self.good_size +=len(line)
+        except OSError:
+            return([])
+        return(records)
+
+    def open(self, serial_number:str, composite_key:str):
+        """Open for appending, keep the records only if they belong to this dock and composite."""
+        self.close()
+        header={'version':FWJOURNAL_VERSION,'serial':serial_number,'composite':composite_key}
+        records=self.load()
+        if records and records[0]==header:
+            self.records=records[1:]
+            os.truncate(self.journal_file,self.good_size) # drop a torn tail before appending
+            self.f=open(self.journal_file,"a")
+        else:
+            self.records=[]
+            self.f=open(self.journal_file,"w")
+            self.append(header,sync=True)
+        return(self)
+
+    def close(self):
+        if self.f is not None:
+            self.sync()
+            self.f.close()
+            self.f=None
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return(False)
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.sync_time=time.monotonic()
+
+    def append(self, record:dict, sync:bool=False):
+        self.f.write(json.dumps(record,separators=(',',':'))+"\n")
+        if sync or time.monotonic()-self.sync_time >= self.sync_interval:
+            self.sync()
+        else:
+            self.f.flush()
+
+    def checkpoint(self, image_index:int, imageInfo, segment_index:int, row:int):
+        """Rows of segment segment_index below row are written."""
+        if self.f is None:
+            return
+        self.append({'image':image_index,'component_id':imageInfo.component_id,
+                     'digest':bytes(imageInfo.image_digest).hex(),'segment':segment_index,'row':row})
+
+    def image_done(self, image_index:int, imageInfo):
+        if self.f is None:
+            return
+        self.append({'image':image_index,'component_id':imageInfo.component_id,
+                     'digest':bytes(imageInfo.image_digest).hex(),'done':True},sync=True)
+
+    def resume_point(self, image_list:list)->tuple:
+        """Where the journaled update stopped.
+
+        Returns:
+            tuple: (image index, segment index, row), row None when the image is done;
+                None when there is nothing to resume
+        """
+        for record in reversed(self.records):
+            image=record.get('image')
+            if not isinstance(image,int) or not 0 <= image < len(image_list):
+                continue
+            imageInfo,segments=image_list[image]
+            if (record.get('component_id')!=imageInfo.component_id or
+                record.get('digest')!=bytes(imageInfo.image_digest).hex()):
+                continue
+            if record.get('done'):
+                return((image,len(segments),None))
+            segment=record.get('segment')
+            if isinstance(segment,int) and 0 <= segment < len(segments) and isinstance(record.get('row'),int):
+                return((image,segment,record['row']))
+        return(None)
+
+    def finish(self):
+        """Update completed: drop the journal."""
+        if self.f is None:
+            return
+        self.close()
+        try:
+            os.remove(self.journal_file)
+        except OSError:
+            pass
+        self.records=[]
@@ -1,8 +1,169 @@
 #import qhidapi
-from model.hidapi_send_sys_command import hidapi_send_sys_command
-from qhidapi import *
-from qhidapi import HID_DATA_OFFSET
-from fwct import *
+import os
+import json
+import time
+import tempfile
+import threading
+from model.qhidapi import *
+from model.qhidapi import HID_DATA_OFFSET
+from model.fwct import *
+
+HIDMGR_FWINFO_CACHE_FILE=os.path.join(os.path.expanduser("~"),".cache","qhidmgr","fwinfo.json")
+HIDMGR_FWINFO_CACHE_MAX_AGE=600.0 # unit:s, on-disk entry lifetime; bounds staleness after power-cycles or other tools
+
+# Commands after which cached component versions are no longer valid
+HIDMGR_FWINFO_INVALIDATE_CMD=(
+    HID_SYSCMD_TYPE.SYS_CMD_SET_SN,
+    HID_SYSCMD_TYPE.SYS_CMD_RESET,
+    HID_SYSCMD_TYPE.SYS_CMD_RESET_TO_ROM,
+    HID_SYSCMD_TYPE.SYS_CMD_RESET_TO_BOOTLOAD,
+)
+HIDMGR_FWINFO_INVALIDATE_ACT=(
+    HID_FWACT_TYPE.FW_ACT_PREPARE_UPDATE,
+    HID_FWACT_TYPE.FW_ACT_UPDATE_FINISH,
+)
+
+class HidFwInfoCache:
+    """Decoded hidmgr_get_device_firmware_info() results keyed by dock serial/UID.
+
+    A cache holding entries registers response_hook() with qhidapi (attach(),
+    done by put()), which drops the dock's entry when a SYS_CMD_RESET* or
+    SYS_CMD_SET_SN is sent, a firmware update is prepared or finished, or the
+    dock answers HIDAPI_REENUM. With cache_file set, entries are also kept in
+    a JSON file so short-lived CLI runs can reuse them. The file is re-read
+    whenever its mtime changes, so an invalidation written by another process
+    (FwUpdateEngine attaches HIDMGR_FWINFO_FILE_CACHE) is seen by the next
+    get(). Changes no hook sees (power-cycle, vendor tools) are bounded by
+    max_age.
+
+    Args:
+        cache_file (str, optional): on-disk layer, e.g. HIDMGR_FWINFO_CACHE_FILE. Defaults to None (memory only).
+        max_age (float, optional): entry lifetime, unit:s. Defaults to None: until invalidated
+            in memory, HIDMGR_FWINFO_CACHE_MAX_AGE with cache_file.
+    """
+
+    def __init__(self, cache_file:str=None, max_age:float=None):
+        self.cache_file=cache_file
+        if max_age is None and cache_file is not None:
+            max_age=HIDMGR_FWINFO_CACHE_MAX_AGE
+        self.max_age=max_age
+        self.entries=None
+        self.mtime_ns=None
+        self.lock=threading.Lock()
+
+    def file_mtime(self)->int:
+        try:
+            return(os.stat(self.cache_file).st_mtime_ns)
+        except OSError:
+            return(None)
+
+    def load(self):
+        self.entries={}
+        self.mtime_ns=None
+        if self.cache_file is None:
+            return
+        self.mtime_ns=self.file_mtime()
+        if self.mtime_ns is None:
+            return
+        try:
+            with open(self.cache_file, "r") as f:
+                self.entries=json.load(f)
+        except (IOError,ValueError) as ex:
+            print("[WARN] Ignore firmware info cache:",ex)
+
+    def refresh(self):
+        """Load on first use, reload when another process rewrote the file."""
+        if self.entries is None or (self.cache_file is not None and self.file_mtime()!=self.mtime_ns):
+            self.load()
+
+    def save(self):
+        if self.cache_file is None:
+            return
+        try:
+            cache_dir=os.path.dirname(self.cache_file)
+            os.makedirs(cache_dir,exist_ok=True)
+            fd,tmp_file=tempfile.mkstemp(dir=cache_dir,suffix=".tmp") # private per writer
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.entries,f)
+                os.replace(tmp_file,self.cache_file)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+            self.mtime_ns=self.file_mtime()
+        except IOError as ex:
+            print("[WARN] Can't write firmware info cache:",ex)
+
+    def get(self, key:str)->list:
+        with self.lock:
+            self.refresh()
+            entry=self.entries.get(key)
+            if entry is None:
+                return(None)
+            if self.max_age is not None and time.time()-entry['time'] > self.max_age:
+                return(None)
+            return(entry['info'])
+
+    def put(self, key:str, info:list):
+        with self.lock:
+            self.refresh()
+            self.entries[key]={'time':time.time(),'info':info}
+            self.save()
+        self.attach()
+
+    def invalidate(self, key:str=None):
+        """Drop one dock, or every dock when key is None."""
+        with self.lock:
+            self.refresh()
+            if key is None:
+                changed=bool(self.entries)
+                self.entries={}
+            else:
+                changed=self.entries.pop(key,None) is not None
+            if changed:
+                self.save()
+
+    def attach(self):
+        """Register response_hook() with qhidapi, once."""
+        hidapi_add_response_hook(self.response_hook)
+
+    def detach(self):
+        hidapi_remove_response_hook(self.response_hook)
+
+    def response_hook(self, session, cmd, act, hid_data):
+        reenum=hid_data is not None and hid_data[HID_RSP_OFFSET]==HID_APIRESPONE_TYPE.HIDAPI_REENUM.value
+        if cmd in HIDMGR_FWINFO_INVALIDATE_CMD or act in HIDMGR_FWINFO_INVALIDATE_ACT or reenum:
+            # a dock without serial number whose UID wasn't asked yet can't be told apart: drop all
+            self.invalidate(hidmgr_session_dock_key(session))
+
+HIDMGR_FWINFO_CACHE=HidFwInfoCache()
+HIDMGR_FWINFO_FILE_CACHE=HidFwInfoCache(HIDMGR_FWINFO_CACHE_FILE) # shared by CLI runs, see HidFwInfoCache
+
+def hidmgr_session_dock_key(session:HidSession)->str:
+    """Cache key of the dock behind session without sending a command, None when it needs SYS_CMD_GET_UID."""
+    key=getattr(session,'dock_key',None)
+    if key is not None:
+        return(key)
+    serial_number=session.serial_number
+    if not serial_number and session.h is not None:
+        try:
+            serial_number=session.h.get_serial_number_string()
+        except IOError:
+            serial_number=None
+    if serial_number:
+        return("sn:"+serial_number)
+    return(None)
+
+def hidmgr_get_dock_key(session:HidSession)->str:
+    """Cache key of the dock behind session: USB serial number, else SYS_CMD_GET_UID."""
+    key=hidmgr_session_dock_key(session)
+    if key is None:
+        uid=session.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_GET_UID)
+        if uid is None:
+            return(None)
+        key="uid:"+bytes(uid[HID_DATA_OFFSET:]).rstrip(b'\0').hex()
+    session.dock_key=key
+    return(key)
 
 
 def hidmgr_show_mcu_firmware_info(fw_info:list):
@@ -90,13 +251,69 @@ def hidmgr_show_device_firmware_info(fw_info:list):
         print("-"*52)
     print("="*52)
 
-def hidmgr_get_device_firmware_info(vid:int=0, pid:int=0, sn:str=None)->list:
+HIDMGR_FWVER_BLOCK_OFFSET=7 # [7-14] Bootloader, [15-22] Image1, [23-30] Image2
+HIDMGR_FWVER_BLOCK_SIZE=8   # content depends on the component device type
+
+def hidmgr_decode_mcu_version(fw_info:list, image_type:int)->tuple:
+    """AT32F415: version little-endian in block [0-3], as hidmgr_show_mcu_firmware_info(); no app_version."""
+    offset=HIDMGR_FWVER_BLOCK_OFFSET+HIDMGR_FWVER_BLOCK_SIZE*image_type
+    return((int.from_bytes(bytes(fw_info[offset:offset+4]),'little'),None))
+
+def hidmgr_decode_ccg_version(fw_info:list, image_type:int)->tuple:
+    """CCG4: base version block [0-3], application version [4-7], little-endian;
+    [6] bit 6/7 flags FW1/FW2 invalid, as hidmgr_show_ccg4_firmware_info()."""
+    if image_type != IMAGE_TYPE.IMAGE_TYPE_BOOTLOADER.value and fw_info[6]&(0x20<<image_type):
+        return(None)
+    offset=HIDMGR_FWVER_BLOCK_OFFSET+HIDMGR_FWVER_BLOCK_SIZE*image_type
+    return((int.from_bytes(bytes(fw_info[offset:offset+4]),'little'),
+            int.from_bytes(bytes(fw_info[offset+4:offset+8]),'little')))
+
+# DMC_DEV_TYPE value -> decoder; other device types have no known version layout
+HIDMGR_FWVER_DECODERS={
+    DMC_DEV_TYPE.DMC_DEV_TYPE_AT32F415.value    : hidmgr_decode_mcu_version,
+    DMC_DEV_TYPE.DMC_DEV_TYPE_CCG4.value        : hidmgr_decode_ccg_version,
+}
+
+def hidmgr_get_component_version(fw_info:list, device_type:int, image_type:int)->tuple:
+    """(fw_version, app_version) of one image from a SYS_CMD_GET_COMPONENT_FWVER response.
+
+    Args:
+        fw_info (list): SYS_CMD_GET_COMPONENT_FWVER response
+        device_type (int): DMC_DEV_TYPE value, selects the version layout
+        image_type (int): IMAGE_TYPE value, selects the version block
+
+    Returns:
+        tuple: (fw_version, app_version) as in Dock_FWCT_ImageInfo, app_version None when the
+            device type doesn't report it; None when unknown (device type, image type or invalid image)
+    """
+    decoder=HIDMGR_FWVER_DECODERS.get(device_type)
+    if decoder is None or not 0 <= image_type <= IMAGE_TYPE.IMAGE_TYPE_IMAGE2.value:
+        return(None)
+    if HIDMGR_FWVER_BLOCK_OFFSET+HIDMGR_FWVER_BLOCK_SIZE*(image_type+1) > len(fw_info):
+        return(None)
+    return(decoder(fw_info,image_type))
+
+def hidmgr_is_image_up_to_date(dev_fw_info:list, imageInfo:Dock_FWCT_ImageInfo)->bool:
+    """True when the dock already runs imageInfo's fw_version/app_version, False when unknown."""
+    if dev_fw_info is None:
+        return(False)
+    for component_id,component_type,fw_info in dev_fw_info:
+        if component_id==imageInfo.component_id and component_type==imageInfo.device_type:
+            version=hidmgr_get_component_version(fw_info,component_type,imageInfo.image_type)
+            if version is None:
+                return(False)
+            fw_version,app_version=version
+            return(fw_version==imageInfo.fw_version and app_version in (None,imageInfo.app_version))
+    return(False)
+
+def hidmgr_get_device_firmware_info(vid:int=0, pid:int=0, sn:str=None, cache:HidFwInfoCache=HIDMGR_FWINFO_CACHE)->list:
     """_summary_
 
     Args:
         vid (int, optional): _description_. Defaults to 0.
         pid (int, optional): _description_. Defaults to 0.
         sn (str, optional): _description_. Defaults to None.
+        cache (HidFwInfoCache, optional): firmware info cache, None to always query. Defaults to HIDMGR_FWINFO_CACHE.
 
     Returns:
         list: _description_
@@ -105,8 +322,38 @@ def hidmgr_get_device_firmware_info(vid:int=0, pid:int=0, sn:str=None)->list:
         index 1: component type (DMC_DEV_TYPE)
         index 2: comoonent FW information (fw_version, app_version) total: 8 bytes
     """
+    try:
+        with HidSession(vid, pid, sn) as s:
+            return(hidmgr_get_session_firmware_info(s,cache))
+
+    except IOError as ex:
+        print(ex)
+        return(None)
+
+def hidmgr_get_session_firmware_info(session:HidSession, cache:HidFwInfoCache=None)->list:
+    """Same as hidmgr_get_device_firmware_info() on an already opened HidSession.
+
+    Args:
+        session (HidSession): opened dock session
+        cache (HidFwInfoCache, optional): firmware info cache. Defaults to None.
+
+    Returns:
+        list: see hidmgr_get_device_firmware_info()
+    """
+    if cache is not None:
+        key=hidmgr_get_dock_key(session)
+        if key is not None:
+            dev_fw_info=cache.get(key)
+            if dev_fw_info is None:
+                dev_fw_info=hidmgr_query_firmware_info(session)
+                if dev_fw_info is not None:
+                    cache.put(key,dev_fw_info)
+            return(dev_fw_info)
+    return(hidmgr_query_firmware_info(session))
+
+def hidmgr_query_firmware_info(session:HidSession)->list:
     dev_fw_info=[]
-    dev_comp_list=hidapi_send_sys_command(vid, pid,HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_ID_LIST)
+    dev_comp_list=session.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_ID_LIST)
     # SYS_CMD_GET_COMPONENT_ID_LIST:
     # HID format:
     # [0] RID_SYS
@@ -129,7 +376,7 @@ def hidmgr_get_device_firmware_info(vid:int=0, pid:int=0, sn:str=None)->list:
             component.append(dev_comp_list[5+2*index]) # component_id
             component.append(dev_comp_list[6+2*index]) # compoonent_type
             print(component)
-            fw_info=hidapi_send_sys_command(vid, pid,HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_FWVER,component)
+            fw_info=session.send_sys_command(HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_FWVER,component)
             # SYS_CMD_GET_COMPONENT_FWVER 
             # HID format:
             # [0] RID_SYS
@@ -160,7 +407,7 @@ if __name__ == "__main__":
     
     dev=hidapi_find_device(vid=vid,pid=pid)
     
-    info=hidmgr_get_device_firmware_info(vid, pid)
+    info=hidmgr_get_device_firmware_info(vid, pid, None, HIDMGR_FWINFO_FILE_CACHE) # reuse versions across CLI runs
     hidmgr_show_device_firmware_info(info)
     
     if(info is None):
@@ -0,0 +1,272 @@
+import time
+import threading
+from model.qhidapi import *
+
+HID_POLL_MIN_INTERVAL=0.001     # unit:s, shortest FW_ACT_STATUS poll / retry interval
+HID_POLL_MAX_INTERVAL=0.25      # unit:s, longest poll / retry interval
+HID_POLL_TIMEOUT=30.0           # unit:s, default completion deadline of one command
+HID_POLL_REENUM_TIMEOUT=10.0    # unit:s, dock re-enumeration deadline
+HID_POLL_EWMA_ALPHA=0.3         # weight of the newest completion time in the estimate
+HID_POLL_FIRST_POLL=0.8         # first poll at this fraction of the estimated completion time
+HID_POLL_STEP=0.1               # later polls every this fraction of the estimate ...
+HID_POLL_GROWTH=1.5             # ... growing by this factor after every busy answer
+
+class HidPollBackoff:
+    """Poll intervals of one wait, derived from the estimated completion time.
+
+    Without an estimate polling starts at min_interval and doubles. With one,
+    the first poll is at HID_POLL_FIRST_POLL of the estimate and the next ones
+    every HID_POLL_STEP of it, growing by HID_POLL_GROWTH, so a command that
+    completes as usual is seen within a few percent of its completion time.
+    """
+
+    def __init__(self, estimate:float=None, min_interval:float=HID_POLL_MIN_INTERVAL,
+                 max_interval:float=HID_POLL_MAX_INTERVAL):
+        self.min_interval=min_interval
+        self.max_interval=max_interval
+        if estimate is None:
+            self.first=min_interval
+            self.step=min_interval
+            self.growth=2.0
+        else:
+            self.first=estimate*HID_POLL_FIRST_POLL
+            self.step=estimate*HID_POLL_STEP
+            self.growth=HID_POLL_GROWTH
+        self.polls=0
+
+    def next_delay(self)->float:
+        if self.polls == 0:
+            delay=self.first
+        else:
+            delay=self.step*self.growth**(self.polls-1)
+        self.polls +=1
+        return(min(self.max_interval,max(self.min_interval,delay)))
+
+class HidCompletionManager:
+    """Run dock commands to completion through WAIT, DEFER and REENUM responses.
+
+    HIDAPI_WAIT: the dock is busy and didn't execute the command, it is sent
+    again after a backoff. HIDAPI_DEFER: the command runs in the background,
+    FW_ACT_STATUS of the component is polled until it stops answering WAIT.
+    HIDAPI_REENUM: the command was executed and the dock drops off the bus;
+    the same dock is found again by serial number through HidDeviceRegistry
+    and the session is reopened in place, so objects holding the session keep
+    working.
+
+    Poll intervals come from the completion times observed per (rid, cmd,
+    act) (exponentially weighted), so the call returns shortly after the
+    operation completes instead of after a worst-case fixed delay.
+
+        with HidSession(vid, pid) as s:
+            completion=HidCompletionManager(s)
+            completion.send_fw_command(HID_FWCMD_TYPE.FW_CMD_FW_UPDATE,HID_FWACT_TYPE.FW_ACT_PREPARE_UPDATE,payload)
+
+    Args:
+        session (HidSession): opened dock session
+        registry (HidDeviceRegistry, optional): used to find the dock after REENUM.
+            Defaults to a registry of the session vid/pid.
+        timeout (float, optional): completion deadline per command, unit:s. Defaults to HID_POLL_TIMEOUT.
+        reenum_timeout (float, optional): re-enumeration deadline, unit:s. Defaults to HID_POLL_REENUM_TIMEOUT.
+    """
+
+    def __init__(self, session:HidSession, registry:HidDeviceRegistry=None, timeout:float=HID_POLL_TIMEOUT,
+                 reenum_timeout:float=HID_POLL_REENUM_TIMEOUT, min_interval:float=HID_POLL_MIN_INTERVAL,
+                 max_interval:float=HID_POLL_MAX_INTERVAL):
+        self.session=session
+        self.registry=registry
+        self.timeout=timeout
+        self.reenum_timeout=reenum_timeout
+        self.min_interval=min_interval
+        self.max_interval=max_interval
+        self.lock=threading.Lock()
+        self.estimates={}   # (rid, cmd, act) -> estimated completion time, unit:s
+        self.component_id=0 # FW_ACT_STATUS target, from the last FW update command naming one
+        self.serial_number=session.serial_number
+        self.reenumerated=False # last execute() went through a dock re-enumeration
+        self.dock_serial() # the handle is gone once REENUM was read
+
+    def estimate(self, key:tuple)->float:
+        with self.lock:
+            return(self.estimates.get(key))
+
+    def observe(self, key:tuple, seconds:float):
+        """Fold one observed completion time into the estimate of key."""
+        with self.lock:
+            old=self.estimates.get(key)
+            self.estimates[key]=seconds if old is None else old+HID_POLL_EWMA_ALPHA*(seconds-old)
+
+    def backoff(self, key:tuple)->HidPollBackoff:
+        return(HidPollBackoff(self.estimate(key),self.min_interval,self.max_interval))
+
+    def track_component(self, rid:int, cmd:int, act:int, payload):
+        if (rid==HID_REPORID_TYPE.RID_FW.value and cmd==HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value and payload and
+            act not in (HID_FWACT_TYPE.FW_ACT_WBUF.value,HID_FWACT_TYPE.FW_ACT_READ.value)):
+            self.component_id=payload[0]
+
+    def dock_serial(self)->str:
+        """Serial number of the dock, read from the open handle if the session was opened by vid/pid."""
+        if not self.serial_number and self.session.is_open():
+            try:
+                self.serial_number=self.session.h.get_serial_number_string()
+            except IOError:
+                pass
+        return(self.serial_number)
+
+    def transfer(self, rid:int, cmd:int, act:int, payload, timeout:int)->list:
+        hid_pkt=self.session.encoder.encode(rid,cmd,act,payload)
+        return(self.session.transfer(hid_pkt,timeout))
+
+    def poll_status(self, deadline:float, backoff:HidPollBackoff)->list:
+        """Poll FW_ACT_STATUS until the dock stops answering WAIT.
+
+        Returns:
+            list: last FW_ACT_STATUS response, [] when deadline passed, None when IO error
+        """
+        timeout=hidapi_get_cmd_timeout(HID_FWCMD_TYPE.FW_CMD_FW_UPDATE,HID_FWACT_TYPE.FW_ACT_STATUS)
+        while True:
+            remain=deadline-time.monotonic()
+            if remain <= 0:
+                return([])
+            time.sleep(min(remain,backoff.next_delay()))
+            hid_data=self.transfer(HID_REPORID_TYPE.RID_FW.value,HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value,
+                                   HID_FWACT_TYPE.FW_ACT_STATUS.value,[self.component_id],timeout)
+            if not hid_data:
+                return(hid_data)
+            rsp=hid_data[HID_RSP_OFFSET]
+            if rsp not in (HID_APIRESPONE_TYPE.HIDAPI_WAIT.value,HID_APIRESPONE_TYPE.HIDAPI_DEFER.value):
+                return(hid_data)
+
+    def reopen(self, deadline:float)->bool:
+        """Reopen the session on the re-enumerated dock, found by serial number."""
+        serial_number=self.dock_serial()
+        self.session.close()
+        if not serial_number:
+            print("[ERROR] REENUM: dock serial number unknown")
+            return(False)
+        if self.registry is None:
+            self.registry=HidDeviceRegistry(self.session.vid,self.session.pid,transport=self.session.transport)
+        backoff=HidPollBackoff(self.estimate('reenum'),self.min_interval,self.max_interval)
+        start=time.monotonic()
+        while True:
+            remain=deadline-time.monotonic()
+            if remain <= 0:
+                print("[ERROR] REENUM: dock not back:",serial_number)
+                return(False)
+            time.sleep(min(remain,backoff.next_delay()))
+            self.registry.scan()
+            device_dict=self.registry.find(serial_number)
+            if device_dict is None:
+                continue
+            self.session.path=device_dict['path']
+            try:
+                self.session.open()
+            except IOError:
+                continue
+            self.observe('reenum',time.monotonic()-start)
+            return(True)
+
+    def execute(self, rid:int, cmd:int, act:int=0, payload:list=None, timeout:int=None, deadline:float=None)->list:
+        """Send one command and wait until the dock completed it.
+
+        Args:
+            rid (int): report id
+            cmd (int): command code
+            act (int, optional): action code. Defaults to 0.
+            payload (list, optional): payload data. Defaults to None.
+            timeout (int, optional): timeout per response, unit:ms. Defaults to HID_READ_TIMEOUT.
+            deadline (float, optional): time.monotonic() completion deadline. Defaults to now + self.timeout.
+
+        Returns:
+            list: command response, [] when timeout, None when IO error. A completed
+                DEFER or REENUM is reported as HIDAPI_ACK; NACK and other codes are kept.
+        """
+        key=(rid,cmd,act)
+        if timeout is None:
+            timeout=HID_READ_TIMEOUT
+        if deadline is None:
+            deadline=time.monotonic()+self.timeout
+        self.track_component(rid,cmd,act,payload)
+        self.reenumerated=False
+        start=time.monotonic()
+        backoff=self.backoff(key)
+        while True:
+            hid_data=self.transfer(rid,cmd,act,payload,timeout)
+            if not hid_data:
+                return(hid_data)
+            rsp=hid_data[HID_RSP_OFFSET]
+            if rsp==HID_APIRESPONE_TYPE.HIDAPI_WAIT.value:
+                remain=deadline-time.monotonic()
+                if remain <= 0:
+                    return([])
+                time.sleep(min(remain,backoff.next_delay())) # not executed, send it again
+                continue
+            break
+        hid_data=list(hid_data)
+        if rsp==HID_APIRESPONE_TYPE.HIDAPI_DEFER.value:
+            status=self.poll_status(deadline,backoff)
+            if not status:
+                return(status)
+            hid_data[HID_RSP_OFFSET]=status[HID_RSP_OFFSET]
+        elif rsp==HID_APIRESPONE_TYPE.HIDAPI_REENUM.value:
+            self.reenumerated=True
+            if not self.reopen(min(deadline,time.monotonic()+self.reenum_timeout)):
+                return(None)
+            hid_data[HID_RSP_OFFSET]=HID_APIRESPONE_TYPE.HIDAPI_ACK.value
+        elif backoff.polls == 0:
+            return(hid_data) # completed at once, nothing to learn
+        if hid_data[HID_RSP_OFFSET]==HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            self.observe(key,time.monotonic()-start)
+        return(hid_data)
+
+    def send_command(self, rid:HID_REPORID_TYPE, cmd:Enum, act:Enum=None, payload:list=None, timeout:int=None)->list:
+        """HidSession.send_command() which waits for completion.
+
+        Returns:
+            list: response report, None when IO error, timeout or not completed
+        """
+        if timeout is None:
+            timeout=hidapi_get_cmd_timeout(cmd,act)
+        hid_data=self.execute(rid.value,cmd.value,0 if act is None else act.value,payload,timeout)
+        if HID_RESPONSE_HOOKS:
+            hook_data=hid_data
+            if hid_data and self.reenumerated:
+                hook_data=list(hid_data)
+                hook_data[HID_RSP_OFFSET]=HID_APIRESPONE_TYPE.HIDAPI_REENUM.value # drop cached dock state
+            hidapi_call_response_hooks(self.session,cmd,act,hook_data or None)
+        if not hid_data:
+            if hid_data is not None:
+                print("HID_CMD TIMEOUT:",cmd.name)
+            return(None)
+        if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+        return(hid_data)
+
+    def send_sys_command(self, cmd:HID_SYSCMD_TYPE, payload:list=None, timeout:int=None)->list:
+        return(self.send_command(HID_REPORID_TYPE.RID_SYS,cmd,None,payload,timeout))
+
+    def send_fw_command(self, cmd:HID_FWCMD_TYPE, act:HID_FWACT_TYPE, payload:list=None, timeout:int=None)->list:
+        return(self.send_command(HID_REPORID_TYPE.RID_FW,cmd,act,payload,timeout))
+
+    def send_iobus_command(self, cmd:HID_IOBUSCMD_TYPE, act:HID_IOBUSACT_TYPE, payload:list=None, timeout:int=None)->list:
+        return(self.send_command(HID_REPORID_TYPE.RID_BUSIO,cmd,act,payload,timeout))
+
+if __name__ == "__main__":
+    import sys
+    from model.qhidsim import *
+    if len(sys.argv) == 1:
+        dock=SimDock("POLL0")
+        dock.defer_time=0.05
+        with SimHidModule([dock]), HidSession(dock.vid,dock.pid) as s:
+            completion=HidCompletionManager(s)
+            for rsp in (HID_APIRESPONE_TYPE.HIDAPI_WAIT,HID_APIRESPONE_TYPE.HIDAPI_DEFER,
+                        HID_APIRESPONE_TYPE.HIDAPI_DEFER,HID_APIRESPONE_TYPE.HIDAPI_REENUM):
+                dock.inject(rsp)
+                start=time.monotonic()
+                hid_data=completion.send_fw_command(HID_FWCMD_TYPE.FW_CMD_FW_UPDATE,HID_FWACT_TYPE.FW_ACT_INIT,
+                                                    [0,DMC_DEV_TYPE.DMC_DEV_TYPE_AT32F415.value,1])
+                print("[INFO] %s: %s, %.3f s" % (rsp.name,"done" if hid_data else "fail",time.monotonic()-start))
+        sys.exit(0)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.qhidpoll")
+        sys.exit(1)
@@ -0,0 +1,161 @@
+# pip install numpy
+import time
+import threading
+import numpy as np
+from model.qhidapi import *
+
+SAMPLER_DEFAULT_RATE=100.0      # unit:Hz
+SAMPLER_DEFAULT_CAPACITY=65536  # samples kept in the ring buffer
+
+# IOBUS_ACT_READ payload layout:
+# IOBUS_CMD_ADC  [0] Channel count N [1..N] Channel IDs, response [4..4+2N] raw values (16-bit little-endian)
+# IOBUS_CMD_GPIO [0] Pin count N [1..N] Pin IDs, response [4..4+N] levels (0/1)
+# IOBUS_ACT_INIT uses the same request layout and configures the channels/pins as inputs.
+
+class DockSampler:
+    """Poll ADC channels or GPIO inputs on a background thread into a NumPy ring buffer.
+
+    The device stays open for the whole run and every channel is read with a
+    single IOBUS_ACT_READ report per sample. Samples are stored with a
+    monotonic timestamp and sequence number in a preallocated structured
+    array which is never grown or reallocated. While running, the sampler owns
+    the session, don't send other commands on it from another thread.
+
+        with HidSession(vid, pid) as s, DockSampler(s, HID_IOBUSCMD_TYPE.IOBUS_CMD_ADC, [0,1,2], rate=200) as sampler:
+            time.sleep(10)
+            samples=sampler.snapshot()   # samples['t'], samples['values'][:,0] ...
+
+    Args:
+        session (HidSession): opened dock session
+        cmd (HID_IOBUSCMD_TYPE): IOBUS_CMD_ADC or IOBUS_CMD_GPIO
+        channels (list): ADC channel / GPIO pin IDs
+        rate (float, optional): target sample rate, unit:Hz. Defaults to SAMPLER_DEFAULT_RATE.
+        capacity (int, optional): ring buffer size in samples. Defaults to SAMPLER_DEFAULT_CAPACITY.
+    """
+
+    def __init__(self, session:HidSession, cmd:HID_IOBUSCMD_TYPE, channels:list,
+                 rate:float=SAMPLER_DEFAULT_RATE, capacity:int=SAMPLER_DEFAULT_CAPACITY):
+        if cmd not in (HID_IOBUSCMD_TYPE.IOBUS_CMD_ADC,HID_IOBUSCMD_TYPE.IOBUS_CMD_GPIO):
+            raise ValueError("DockSampler supports IOBUS_CMD_ADC and IOBUS_CMD_GPIO only")
+        self.session=session
+        self.cmd=cmd
+        self.channels=list(channels)
+        self.rate=rate
+        self.capacity=capacity
+        self.value_size=2 if cmd==HID_IOBUSCMD_TYPE.IOBUS_CMD_ADC else 1
+        value_dtype='<u2' if self.value_size==2 else 'u1'
+        self.buffer=np.zeros(capacity,dtype=[('t','f8'),('seq','u8'),('values',value_dtype,(len(self.channels),))])
+        self.request=bytes(HidPacketEncoder().encode(HID_REPORID_TYPE.RID_BUSIO.value,cmd.value,
+                                                     HID_IOBUSACT_TYPE.IOBUS_ACT_READ.value,
+                                                     [len(self.channels)]+self.channels))
+        self.lock=threading.Lock()
+        self.thread=None
+        self.running=False
+        self.count=0        # samples written so far
+        self.read_pos=0     # iter_new() cursor, in samples
+        self.dropped=0      # missed sample slots and failed reads
+        self.overwritten=0  # samples lost by iter_new() because the ring wrapped
+        self.start_time=0.0
+
+    def start(self)->bool:
+        if self.running:
+            return(True)
+        hid_data=self.session.send_iobus_command(self.cmd,HID_IOBUSACT_TYPE.IOBUS_ACT_INIT,
+                                                 [len(self.channels)]+self.channels)
+        if hid_data is None or hid_data[HID_RSP_OFFSET]!=HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            return(False)
+        self.running=True
+        self.start_time=time.monotonic()
+        self.thread=threading.Thread(target=self.run,name="DockSampler",daemon=True)
+        self.thread.start()
+        return(True)
+
+    def stop(self):
+        self.running=False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread=None
+
+    def __enter__(self):
+        if not self.start():
+            raise IOError("sampler init failed")
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return(False)
+
+    def sample(self)->bool:
+        hid_data=self.session.transfer(self.request,hidapi_get_cmd_timeout(self.cmd,HID_IOBUSACT_TYPE.IOBUS_ACT_READ))
+        if not hid_data or hid_data[HID_RSP_OFFSET]!=HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            return(False)
+        t=time.monotonic()
+        end=HID_DATA_OFFSET+self.value_size*len(self.channels)
+        values=np.frombuffer(bytes(hid_data[HID_DATA_OFFSET:end]),dtype=self.buffer.dtype['values'].base)
+        with self.lock:
+            row=self.buffer[self.count%self.capacity]
+            row['t']=t
+            row['seq']=self.count
+            row['values']=values
+            self.count +=1
+        return(True)
+
+    def run(self):
+        period=1.0/self.rate
+        next_time=time.monotonic()
+        while self.running:
+            if not self.sample():
+                self.dropped +=1
+            next_time +=period
+            delay=next_time-time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                missed=int(-delay/period)
+                self.dropped +=missed
+                next_time +=missed*period
+
+    def ring_slice(self, start:int, count:int)->np.ndarray:
+        """Copy of samples [start, count), caller holds the lock."""
+        return(self.buffer[np.arange(start,count)%self.capacity])
+
+    def snapshot(self)->np.ndarray:
+        """Copy of the buffered samples, oldest first."""
+        with self.lock:
+            return(self.ring_slice(max(0,self.count-self.capacity),self.count))
+
+    def iter_new(self):
+        """Yield samples (as structured rows) written since the previous call."""
+        with self.lock:
+            count=self.count
+            start=self.read_pos
+            if count-start > self.capacity:
+                self.overwritten +=count-start-self.capacity
+                start=count-self.capacity
+            chunk=self.ring_slice(start,count)
+            self.read_pos=count
+        for row in chunk:
+            yield row
+
+    def stats(self)->dict:
+        elapsed=time.monotonic()-self.start_time if self.start_time else 0.0
+        return({'samples':self.count,
+                'rate':self.count/elapsed if elapsed > 0 else 0.0,
+                'target_rate':self.rate,
+                'dropped':self.dropped,
+                'overwritten':self.overwritten})
+
+if __name__ == "__main__":
+    import sys
+    vid=0x2BEF
+    pid=0x0415
+    channels=[int(c,0) for c in sys.argv[1:]] or [0]
+    with HidSession(vid, pid) as s, DockSampler(s,HID_IOBUSCMD_TYPE.IOBUS_CMD_ADC,channels) as sampler:
+        try:
+            while True:
+                time.sleep(1.0)
+                for row in sampler.iter_new():
+                    print("%.3f" % row['t'],list(row['values']))
+        except KeyboardInterrupt:
+            pass
+        print(sampler.stats())
@@ -0,0 +1,432 @@
+import time
+import random
+import threading
+import collections
+import model.qhidapi as qhidapi
+from model.qhidapi import *
+from model.fwct import DMC_DEV_TYPE
+
+SIM_DEFAULT_VID=0x2BEF
+SIM_DEFAULT_PID=0x0415
+SIM_DEFAULT_LATENCY=0.001       # unit:s, per report processing time of the simulated dock
+SIM_SPI_FLASH_SIZE=1024*1024
+SIM_SPI_SECTOR_SIZE=4096
+SIM_DEFER_TIME=0.02             # unit:s, busy time after an injected HIDAPI_DEFER
+SIM_REENUM_TIME=0.05            # unit:s, disconnect time after an injected HIDAPI_REENUM
+
+class SimComponent:
+    """One dock component: version blocks and row storage."""
+
+    def __init__(self, component_id:int, device_type:int, versions:list=None):
+        self.component_id=component_id
+        self.device_type=device_type
+        self.active_image=1
+        self.versions=versions or [(0,0),(0,0),(0,0)] # (fw_version, app_version) per IMAGE_TYPE
+        self.rows={}    # (segment_type, row) -> bytes
+        self.row_size=64
+
+class SimDock:
+    """Software dock speaking the RID_SYS/RID_FW/RID_BUSIO report protocol.
+
+    Every report is answered after `latency` seconds; reports are processed in
+    order like on the real dock, so latency bounds the command rate. Response
+    codes can be injected with inject() (scripted) or inject_rate (random):
+    HIDAPI_WAIT answers without executing, HIDAPI_DEFER executes and keeps the
+    dock busy (FW_ACT_STATUS answers WAIT) for defer_time, HIDAPI_REENUM
+    executes and then drops off the bus for reenum_time.
+
+    Args:
+        serial_number (str, optional): Defaults to "SIM0000".
+        latency (float, optional): per report latency, unit:s. Defaults to SIM_DEFAULT_LATENCY.
+        components (list, optional): SimComponent list. Defaults to one AT32F415 and one CCG4.
+        keep_rows (bool, optional): PREPARE_UPDATE honours FWUP_MODE_DIFFERENTIAL (payload [8]);
+            False erases the image rows on every prepare like firmware without it. Defaults to True.
+    """
+
+    def __init__(self, serial_number:str="SIM0000", vid:int=SIM_DEFAULT_VID, pid:int=SIM_DEFAULT_PID,
+                 latency:float=SIM_DEFAULT_LATENCY, components:list=None, keep_rows:bool=True):
+        self.serial_number=serial_number
+        self.keep_rows=keep_rows
+        self.vid=vid
+        self.pid=pid
+        self.path=("sim:%s" % serial_number).encode('ascii')
+        self.latency=latency
+        self.components=components or [SimComponent(0,DMC_DEV_TYPE.DMC_DEV_TYPE_AT32F415.value),
+                                       SimComponent(1,DMC_DEV_TYPE.DMC_DEV_TYPE_CCG4.value)]
+        self.uid=bytes(random.getrandbits(8) for i in range(12))
+        self.lock=threading.Lock()
+        self.responses=collections.deque() # (ready_time, report)
+        self.ready_time=0.0
+        self.injections=[] # [match(rid,cmd,act)->bool, rsp, count]
+        self.inject_rate={} # rsp -> probability
+        self.defer_time=SIM_DEFER_TIME
+        self.reenum_time=SIM_REENUM_TIME
+        self.busy_until=0.0
+        self.offline_until=0.0
+        self.generation=0   # bumped on re-enumeration, old handles become invalid
+        self.reenum_report=None
+        self.reports=0
+        # FW update state
+        self.fw_component=None
+        self.fw_buffer=bytearray()
+        self.fw_rbuf=b''
+        # IO bus state
+        self.spi_flash=bytearray(b'\xff'*SIM_SPI_FLASH_SIZE)
+        self.spi_buffer=bytearray()
+        self.spi_rbuf=b''
+        self.i2c={} # 7-bit address -> bytearray(65536)
+        self.adc=collections.defaultdict(int) # channel -> raw value
+        self.gpio=collections.defaultdict(int) # pin -> level
+        self.uart_rx=bytearray() # dock -> host
+        self.uart_loopback=True
+
+    def inject(self, rsp:HID_APIRESPONE_TYPE, match=None, count:int=1):
+        """Answer the next `count` reports accepted by match(rid, cmd, act) with rsp."""
+        self.injections.append([match or (lambda rid,cmd,act: True),rsp,count])
+
+    def enum_dict(self)->dict:
+        return({'path':self.path,'vendor_id':self.vid,'product_id':self.pid,
+                'serial_number':self.serial_number,'release_number':0x0100,
+                'manufacturer_string':'QSI','product_string':'Simulated Dock',
+                'usage_page':0xFF00,'usage':1,'interface_number':0,'bus_type':1})
+
+    def is_online(self)->bool:
+        return(time.monotonic() >= self.offline_until)
+
+    # -- transport side, called by SimHidDevice --
+
+    def submit(self, report:list):
+        with self.lock:
+            self.reports +=1
+            rsp=self.process(report)
+            if rsp is None:
+                return
+            now=time.monotonic()
+            self.ready_time=max(now,self.ready_time)+self.latency
+            self.responses.append((self.ready_time,rsp))
+
+    def take(self, timeout:float)->list:
+        """Pop the next response, waiting up to timeout seconds for it."""
+        deadline=time.monotonic()+timeout
+        while True:
+            with self.lock:
+                if self.responses:
+                    ready,rsp=self.responses[0]
+                    now=time.monotonic()
+                    if ready <= now:
+                        self.responses.popleft()
+                        if rsp is self.reenum_report:
+                            self.reenum_report=None
+                            self.reenumerate()
+                        return(rsp)
+                    wait=ready-now
+                else:
+                    wait=None
+            remain=deadline-time.monotonic()
+            if remain <= 0:
+                return([])
+            time.sleep(min(remain,wait if wait is not None else 0.001))
+
+    # -- protocol --
+
+    def injected(self, rid:int, cmd:int, act:int)->HID_APIRESPONE_TYPE:
+        for entry in self.injections:
+            if entry[0](rid,cmd,act):
+                entry[2] -=1
+                if entry[2] <= 0:
+                    self.injections.remove(entry)
+                return(entry[1])
+        for rsp,probability in self.inject_rate.items():
+            if random.random() < probability:
+                return(rsp)
+        return(None)
+
+    def process(self, report:list)->list:
+        report=list(report)+[0]*(HID_PACKET_SIZE_MAX-len(report))
+        rid,cmd,act=report[HID_RID_OFFSET],report[HID_CMD_OFFSET],report[HID_ACT_OFFSET]
+        payload=bytes(report[HID_DATA_OFFSET:HID_PACKET_SIZE_MAX])
+        rsp=[rid,cmd,act,HID_APIRESPONE_TYPE.HIDAPI_ACK.value]+[0]*HID_PACKET_PADLOAD_SIZE
+
+        injected=self.injected(rid,cmd,act)
+        if injected==HID_APIRESPONE_TYPE.HIDAPI_WAIT:
+            rsp[HID_RSP_OFFSET]=injected.value
+            return(rsp)
+
+        if rid==HID_REPORID_TYPE.RID_SYS.value:
+            ok=self.process_sys(cmd,payload,rsp)
+        elif rid==HID_REPORID_TYPE.RID_FW.value:
+            ok=self.process_fw(cmd,act,payload,rsp)
+        elif rid==HID_REPORID_TYPE.RID_BUSIO.value:
+            ok=self.process_iobus(cmd,act,payload,rsp)
+        else:
+            ok=False
+        if not ok:
+            rsp[HID_RSP_OFFSET]=HID_APIRESPONE_TYPE.HIDAPI_NACK.value
+        elif injected==HID_APIRESPONE_TYPE.HIDAPI_DEFER:
+            rsp[HID_RSP_OFFSET]=injected.value
+            self.busy_until=time.monotonic()+self.defer_time
+        elif injected==HID_APIRESPONE_TYPE.HIDAPI_REENUM:
+            rsp[HID_RSP_OFFSET]=injected.value
+            self.reenum_report=rsp # drop off the bus once the host has read it
+        elif injected is not None:
+            rsp[HID_RSP_OFFSET]=injected.value
+        return(rsp)
+
+    def reenumerate(self):
+        self.offline_until=time.monotonic()+self.reenum_time
+        self.generation +=1
+        self.fw_component=None
+        self.fw_buffer=bytearray()
+
+    def component(self, component_id:int)->SimComponent:
+        for component in self.components:
+            if component.component_id==component_id:
+                return(component)
+        return(None)
+
+    def process_sys(self, cmd:int, payload:bytes, rsp:list)->bool:
+        data=HID_DATA_OFFSET
+        if cmd==HID_SYSCMD_TYPE.SYS_CMD_PING.value:
+            rsp[data:data+len(payload)]=payload
+        elif cmd==HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_ID_LIST.value:
+            rsp[data]=len(self.components)
+            for index,component in enumerate(self.components):
+                rsp[data+1+2*index]=component.component_id
+                rsp[data+2+2*index]=component.device_type
+        elif cmd==HID_SYSCMD_TYPE.SYS_CMD_GET_COMPONENT_FWVER.value:
+            component=self.component(payload[0])
+            if component is None:
+                return(False)
+            rsp[data]=component.component_id
+            rsp[data+1]=component.device_type
+            rsp[data+2]=component.active_image
+            offset=7
+            for fw_version,app_version in component.versions:
+                rsp[offset:offset+8]=list(fw_version.to_bytes(4,'little')+app_version.to_bytes(4,'little'))
+                offset +=8
+        elif cmd==HID_SYSCMD_TYPE.SYS_CMD_GET_SN.value:
+            sn=self.serial_number.encode('ascii')[:HID_PACKET_PADLOAD_SIZE-1]
+            rsp[data]=len(sn)
+            rsp[data+1:data+1+len(sn)]=list(sn)
+        elif cmd==HID_SYSCMD_TYPE.SYS_CMD_GET_UID.value:
+            rsp[data:data+len(self.uid)]=list(self.uid)
+        elif cmd in (HID_SYSCMD_TYPE.SYS_CMD_RESET.value,HID_SYSCMD_TYPE.SYS_CMD_RESET_TO_ROM.value,
+                     HID_SYSCMD_TYPE.SYS_CMD_RESET_TO_BOOTLOAD.value):
+            self.fw_component=None
+        else:
+            return(False)
+        return(True)
+
+    def process_fw(self, cmd:int, act:int, payload:bytes, rsp:list)->bool:
+        if cmd!=HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value:
+            return(False)
+        if act==HID_FWACT_TYPE.FW_ACT_RESET.value:
+            self.fw_component=None
+            self.fw_buffer=bytearray()
+        elif act==HID_FWACT_TYPE.FW_ACT_INIT.value:
+            self.fw_component=self.component(payload[0])
+            self.fw_buffer=bytearray()
+            return(self.fw_component is not None)
+        elif act==HID_FWACT_TYPE.FW_ACT_PREPARE_UPDATE.value:
+            component=self.fw_component
+            if component is None or component.component_id!=payload[0]:
+                return(False)
+            component.row_size=payload[2]*64
+            if not (self.keep_rows and payload[8]==1): # FWUP_MODE_DIFFERENTIAL
+                component.rows={key:row for key,row in component.rows.items() if key[0]!=payload[1]}
+        elif act==HID_FWACT_TYPE.FW_ACT_WBUF.value:
+            if self.fw_component is None:
+                return(False)
+            self.fw_buffer +=payload
+        elif act in (HID_FWACT_TYPE.FW_ACT_WRITE.value,HID_FWACT_TYPE.FW_ACT_RBUF.value):
+            component=self.fw_component
+            if component is None:
+                return(False)
+            segment_type=payload[1]
+            row=int.from_bytes(payload[2:4],'little')
+            count=int.from_bytes(payload[4:6],'little')
+            size=component.row_size
+            if act==HID_FWACT_TYPE.FW_ACT_WRITE.value:
+                for index in range(0,count):
+                    data=bytes(self.fw_buffer[index*size:(index+1)*size])
+                    component.rows[(segment_type,row+index)]=data.ljust(size,b'\0')
+                self.fw_buffer=bytearray()
+            else:
+                self.fw_rbuf=b''.join(component.rows.get((segment_type,row+index),b'\xff'*size)
+                                      for index in range(0,count))
+        elif act==HID_FWACT_TYPE.FW_ACT_READ.value:
+            offset=int.from_bytes(payload[0:2],'little')
+            rsp[HID_DATA_OFFSET:HID_PACKET_SIZE_MAX]=list(self.fw_rbuf[offset:offset+payload[2]].ljust(HID_PACKET_PADLOAD_SIZE,b'\0'))
+        elif act==HID_FWACT_TYPE.FW_ACT_STATUS.value:
+            if time.monotonic() < self.busy_until:
+                rsp[HID_RSP_OFFSET]=HID_APIRESPONE_TYPE.HIDAPI_WAIT.value
+        elif act==HID_FWACT_TYPE.FW_ACT_UPDATE_FINISH.value:
+            self.fw_component=None
+        elif act in (HID_FWACT_TYPE.FW_ACT_START_UPDATE.value,HID_FWACT_TYPE.FW_ACT_CHECK_FWCT.value,
+                     HID_FWACT_TYPE.FW_ACT_INFO.value):
+            pass
+        else:
+            return(False)
+        return(True)
+
+    def process_iobus(self, cmd:int, act:int, payload:bytes, rsp:list)->bool:
+        data=HID_DATA_OFFSET
+        if cmd==HID_IOBUSCMD_TYPE.IOBUS_CMD_SPI_FLASH.value:
+            addr=int.from_bytes(payload[0:4],'little')
+            length=int.from_bytes(payload[4:6],'little')
+            if act==HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_WBUF.value:
+                self.spi_buffer +=payload
+            elif act==HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_BWRITE.value:
+                if payload[6]&0x01:
+                    sector=addr-addr%SIM_SPI_SECTOR_SIZE
+                    self.spi_flash[sector:sector+SIM_SPI_SECTOR_SIZE]=b'\xff'*SIM_SPI_SECTOR_SIZE
+                for index in range(0,length): # NOR programming only clears bits
+                    self.spi_flash[addr+index] &=self.spi_buffer[index]
+                self.spi_buffer=bytearray()
+            elif act==HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_BREAD.value:
+                self.spi_rbuf=bytes(self.spi_flash[addr:addr+length])
+            elif act==HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_RBUF.value:
+                offset=int.from_bytes(payload[0:2],'little')
+                rsp[data:HID_PACKET_SIZE_MAX]=list(self.spi_rbuf[offset:offset+payload[2]].ljust(HID_PACKET_PADLOAD_SIZE,b'\0'))
+            else:
+                return(False)
+        elif cmd==HID_IOBUSCMD_TYPE.IOBUS_CMD_I2C.value:
+            device=self.i2c.get(payload[0])
+            if act==HID_IOBUSACT_TYPE.IOBUS_ACT_PROBE.value:
+                rsp[data]=1 if device is not None else 0
+                return(True)
+            if device is None:
+                return(False)
+            mem_addr=int.from_bytes(payload[2:4],'little')
+            length=payload[4]
+            if act==HID_IOBUSACT_TYPE.IOBUS_ACT_MEM_READ.value:
+                rsp[data:data+length]=list(device[mem_addr:mem_addr+length])
+            elif act==HID_IOBUSACT_TYPE.IOBUS_ACT_MEM_WRITE.value:
+                device[mem_addr:mem_addr+length]=payload[5:5+length]
+            else:
+                return(False)
+        elif cmd in (HID_IOBUSCMD_TYPE.IOBUS_CMD_ADC.value,HID_IOBUSCMD_TYPE.IOBUS_CMD_GPIO.value):
+            if act==HID_IOBUSACT_TYPE.IOBUS_ACT_READ.value:
+                adc=cmd==HID_IOBUSCMD_TYPE.IOBUS_CMD_ADC.value
+                for index,channel in enumerate(payload[1:1+payload[0]]):
+                    if adc:
+                        rsp[data+2*index:data+2*index+2]=list((self.adc[channel]&0xFFFF).to_bytes(2,'little'))
+                    else:
+                        rsp[data+index]=self.gpio[channel]&0x01
+            elif act not in (HID_IOBUSACT_TYPE.IOBUS_ACT_INIT.value,HID_IOBUSACT_TYPE.IOBUS_ACT_DEINIT.value):
+                return(False)
+        elif cmd==HID_IOBUSCMD_TYPE.IOBUS_CMD_UART.value:
+            if act==HID_IOBUSACT_TYPE.IOBUS_ACT_WRITE.value:
+                if self.uart_loopback:
+                    self.uart_rx +=payload[1:1+payload[0]]
+            elif act==HID_IOBUSACT_TYPE.IOBUS_ACT_READ.value:
+                n=min(payload[0],len(self.uart_rx),HID_PACKET_PADLOAD_SIZE-1)
+                rsp[data]=n
+                rsp[data+1:data+1+n]=list(self.uart_rx[:n])
+                del self.uart_rx[:n]
+            elif act not in (HID_IOBUSACT_TYPE.IOBUS_ACT_INIT.value,HID_IOBUSACT_TYPE.IOBUS_ACT_DEINIT.value):
+                return(False)
+        else:
+            return(False)
+        return(True)
+
+class SimHidDevice:
+    """hid.device replacement bound to the docks of a SimHidModule."""
+
+    def __init__(self, module):
+        self.module=module
+        self.dock=None
+        self.generation=0
+        self.nonblocking=0
+
+    def open(self, vid:int=0, pid:int=0, serial_number:str=None):
+        for dock in self.module.docks:
+            if (dock.vid==vid and dock.pid==pid and dock.is_online() and
+                (serial_number is None or dock.serial_number==serial_number)):
+                return(self.attach(dock))
+        raise IOError("open failed")
+
+    def open_path(self, path:bytes):
+        for dock in self.module.docks:
+            if dock.path==path and dock.is_online():
+                return(self.attach(dock))
+        raise IOError("open failed")
+
+    def attach(self, dock:SimDock):
+        self.dock=dock
+        self.generation=dock.generation
+
+    def check(self):
+        if self.dock is None or self.generation!=self.dock.generation:
+            raise IOError("device disconnected")
+
+    def close(self):
+        self.dock=None
+
+    def set_nonblocking(self, value:int):
+        self.nonblocking=value
+
+    def write(self, buff)->int:
+        self.check()
+        self.dock.submit(buff)
+        return(len(buff))
+
+    def read(self, max_length:int, timeout_ms:int=0)->list:
+        self.check()
+        if timeout_ms > 0:
+            timeout=timeout_ms/1000.0
+        elif self.nonblocking:
+            timeout=0.0
+        else:
+            timeout=1.0 # hidapi would block forever
+        return(self.dock.take(timeout)[:max_length])
+
+    def get_manufacturer_string(self)->str:
+        return('QSI')
+
+    def get_product_string(self)->str:
+        return('Simulated Dock')
+
+    def get_serial_number_string(self)->str:
+        self.check()
+        return(self.dock.serial_number)
+
+class SimHidModule:
+    """Stand-in for the `hid` module used by model.qhidapi.
+
+        with SimHidModule([SimDock("SIM0001"), SimDock("SIM0002")]) as sim:
+            hidmgr_get_device_firmware_info(SIM_DEFAULT_VID, SIM_DEFAULT_PID)
+    """
+
+    def __init__(self, docks:list=None):
+        self.docks=docks if docks is not None else [SimDock()]
+        self.installed=False
+        self.saved=None
+
+    def device(self)->SimHidDevice:
+        return(SimHidDevice(self))
+
+    def enumerate(self, vendor_id:int=0, product_id:int=0)->list:
+        return([dock.enum_dict() for dock in self.docks if dock.is_online() and
+                (vendor_id==0 or dock.vid==vendor_id) and (product_id==0 or dock.pid==product_id)])
+
+    def install(self):
+        """Route qhidapi device access to the simulated docks; hidapi and libusb aren't loaded."""
+        if not self.installed:
+            self.saved=qhidapi.hid
+            qhidapi.hid=self
+            self.installed=True
+        return(self)
+
+    def uninstall(self):
+        if self.installed:
+            qhidapi.hid=self.saved
+            self.saved=None
+            self.installed=False
+
+    def __enter__(self):
+        return(self.install())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+        return(False)
@@ -0,0 +1,215 @@
+from model.qhidapi import *
+
+SPI_FLASH_SECTOR_SIZE=4096      # erase unit
+SPI_FLASH_BUFFER_SIZE=256       # device buffer, one BWRITE/BREAD
+SPI_FLASH_FILE_CHUNK=SPI_FLASH_SECTOR_SIZE*16 # file streaming unit
+SPI_FLASH_ERASED=0xFF
+SPI_FLASH_FLAG_ERASE=0x01       # BWRITE: erase the sector at address first
+
+# IOBUS_CMD_SPI_FLASH payload layout per action:
+# IOBUS_ACT_FLASH_WBUF   [0-59] Data, appended to device buffer (host -> buffer)
+# IOBUS_ACT_FLASH_BWRITE [0-3] Address [4-5] Length [6] Flags (little-endian), buffer -> flash
+#                        Length 0 with SPI_FLASH_FLAG_ERASE only erases the sector
+# IOBUS_ACT_FLASH_BREAD  [0-3] Address [4-5] Length (little-endian), flash -> buffer
+# IOBUS_ACT_FLASH_RBUF   [0-1] Buffer offset [2] Length, response [4-63] data (buffer -> host)
+
+def spi_u16(value:int)->list:
+    return([value&0xFF,(value>>8)&0xFF])
+
+def spi_u32(value:int)->list:
+    return([value&0xFF,(value>>8)&0xFF,(value>>16)&0xFF,(value>>24)&0xFF])
+
+def spi_is_erased(data)->bool:
+    return(bytes(data).count(SPI_FLASH_ERASED)==len(data))
+
+class SpiFlash:
+    """Bulk access to the SPI flash behind the dock over IOBUS_CMD_SPI_FLASH.
+
+    Data is moved one device buffer at a time with FLASH_WBUF/FLASH_RBUF reports
+    pipelined (up to `window` outstanding). write() works per sector: sectors
+    whose content already matches are skipped, all-0xFF sectors are only
+    erased and erased buffers inside a sector are not programmed.
+
+    Args:
+        session (HidSession): opened dock session
+        sector_size (int, optional): erase unit. Defaults to SPI_FLASH_SECTOR_SIZE.
+        buffer_size (int, optional): device buffer size. Defaults to SPI_FLASH_BUFFER_SIZE.
+        window (int, optional): outstanding reports. Defaults to HID_PIPELINE_WINDOW.
+    """
+
+    def __init__(self, session:HidSession, sector_size:int=SPI_FLASH_SECTOR_SIZE,
+                 buffer_size:int=SPI_FLASH_BUFFER_SIZE, window:int=HID_PIPELINE_WINDOW):
+        self.session=session
+        self.sector_size=sector_size
+        self.buffer_size=buffer_size
+        self.window=window
+        self.encoder=HidPacketEncoder()
+
+    def iobus(self, act:HID_IOBUSACT_TYPE, payload:list=None)->bool:
+        hid_data=self.session.send_iobus_command(HID_IOBUSCMD_TYPE.IOBUS_CMD_SPI_FLASH,act,payload)
+        if hid_data is None:
+            return(False)
+        return(hid_data[HID_RSP_OFFSET]==HID_APIRESPONE_TYPE.HIDAPI_ACK.value)
+
+    def pipelined(self, act:HID_IOBUSACT_TYPE, payloads)->list:
+        hid_pkts=self.encoder.encode_each(HID_REPORID_TYPE.RID_BUSIO.value,HID_IOBUSCMD_TYPE.IOBUS_CMD_SPI_FLASH.value,
+                                          act.value,payloads)
+        return(self.transfer_frames(act,hid_pkts))
+
+    def transfer_frames(self, act:HID_IOBUSACT_TYPE, hid_pkts)->list:
+        responses=self.session.transfer_pipelined(hid_pkts,self.window,
+                                                  hidapi_get_cmd_timeout(HID_IOBUSCMD_TYPE.IOBUS_CMD_SPI_FLASH,act))
+        if responses is None:
+            return(None)
+        for hid_data in responses:
+            if hid_data[HID_RSP_OFFSET] != HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+                print("HID_CMD FAIL:",hid_data[HID_RSP_OFFSET])
+                return(None)
+        return(responses)
+
+    def read_buffer(self, addr:int, length:int)->bytes:
+        """Read up to buffer_size bytes: FLASH_BREAD, then pipelined FLASH_RBUF."""
+        if not self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_BREAD,spi_u32(addr)+spi_u16(length)):
+            return(None)
+        payloads=(spi_u16(offset)+[min(HID_PACKET_PADLOAD_SIZE,length-offset)]
+                  for offset in range(0,length,HID_PACKET_PADLOAD_SIZE))
+        responses=self.pipelined(HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_RBUF,payloads)
+        if responses is None:
+            return(None)
+        data=bytearray()
+        for hid_data in responses:
+            data.extend(hid_data[HID_DATA_OFFSET:HID_PACKET_SIZE_MAX])
+        return(bytes(data[:length]))
+
+    def program_buffer(self, addr:int, data, flags:int=0)->bool:
+        """Write up to buffer_size bytes: pipelined FLASH_WBUF, then FLASH_BWRITE."""
+        frames=HidFrameBatch(HID_REPORID_TYPE.RID_BUSIO.value,HID_IOBUSCMD_TYPE.IOBUS_CMD_SPI_FLASH.value,
+                             HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_WBUF.value,data)
+        if self.transfer_frames(HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_WBUF,frames) is None:
+            return(False)
+        return(self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_BWRITE,spi_u32(addr)+spi_u16(len(data))+[flags]))
+
+    def erase_sector(self, addr:int)->bool:
+        return(self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_FLASH_BWRITE,spi_u32(addr)+spi_u16(0)+[SPI_FLASH_FLAG_ERASE]))
+
+    def read(self, addr:int, length:int)->bytes:
+        """Read length bytes from addr, None when failed."""
+        data=bytearray()
+        for pos in range(0,length,self.buffer_size):
+            block=self.read_buffer(addr+pos,min(self.buffer_size,length-pos))
+            if block is None:
+                print("[ERROR] SPI flash read fail, addr:",hex(addr+pos))
+                return(None)
+            data.extend(block)
+        return(bytes(data))
+
+    def write_sector(self, sector_addr:int, data:bytes, skip_unchanged:bool=True)->int:
+        """Write one full sector.
+
+        Returns:
+            int: 1 written, 0 skipped (unchanged), -1 failed
+        """
+        if skip_unchanged:
+            current=self.read(sector_addr,self.sector_size)
+            if current is None:
+                return(-1)
+            if current == data:
+                return(0)
+        if spi_is_erased(data):
+            return(1 if self.erase_sector(sector_addr) else -1)
+        flags=SPI_FLASH_FLAG_ERASE
+        for pos in range(0,self.sector_size,self.buffer_size):
+            block=data[pos:pos+self.buffer_size]
+            if flags==0 and spi_is_erased(block):
+                continue # already 0xFF after erase
+            if not self.program_buffer(sector_addr+pos,block,flags):
+                print("[ERROR] SPI flash write fail, addr:",hex(sector_addr+pos))
+                return(-1)
+            flags=0
+        return(1)
+
+    def write(self, addr:int, data, skip_unchanged:bool=True)->dict:
+        """Write data to addr; partial sectors are read, merged and rewritten.
+
+        Returns:
+            dict: {'written','skipped'} sector counts, None when failed
+        """
+        data=bytes(data)
+        stats={'written':0,'skipped':0}
+        end=addr+len(data)
+        sector_addr=addr-addr%self.sector_size
+        while sector_addr < end:
+            lo=max(addr,sector_addr)
+            hi=min(end,sector_addr+self.sector_size)
+            target=data[lo-addr:hi-addr]
+            if hi-lo != self.sector_size:
+                current=self.read(sector_addr,self.sector_size)
+                if current is None:
+                    return(None)
+                target=current[:lo-sector_addr]+target+current[hi-sector_addr:]
+                if target == current:
+                    stats['skipped'] +=1
+                    sector_addr +=self.sector_size
+                    continue
+                result=self.write_sector(sector_addr,target,False)
+            else:
+                result=self.write_sector(sector_addr,target,skip_unchanged)
+            if result < 0:
+                return(None)
+            stats['written' if result else 'skipped'] +=1
+            sector_addr +=self.sector_size
+        return(stats)
+
+    def read_to_file(self, addr:int, length:int, f, chunk_size:int=SPI_FLASH_FILE_CHUNK)->int:
+        """Dump flash to a writable binary stream.
+
+        Returns:
+            int: bytes written, -1 when failed
+        """
+        for pos in range(0,length,chunk_size):
+            block=self.read(addr+pos,min(chunk_size,length-pos))
+            if block is None:
+                return(-1)
+            f.write(block)
+        return(length)
+
+    def write_from_file(self, addr:int, f, skip_unchanged:bool=True, chunk_size:int=SPI_FLASH_FILE_CHUNK)->dict:
+        """Program flash from a readable binary stream, chunk by chunk (whole sectors, at least one)."""
+        chunk_size=max(self.sector_size,chunk_size-chunk_size%self.sector_size)
+        stats={'written':0,'skipped':0}
+        pos=0
+        while True:
+            block=f.read(chunk_size)
+            if not block:
+                return(stats)
+            result=self.write(addr+pos,block,skip_unchanged)
+            if result is None:
+                return(None)
+            stats['written'] +=result['written']
+            stats['skipped'] +=result['skipped']
+            pos +=len(block)
+
+def spi_flash_read(session:HidSession, addr:int, length:int)->bytes:
+    return(SpiFlash(session).read(addr,length))
+
+def spi_flash_write(session:HidSession, addr:int, data)->dict:
+    return(SpiFlash(session).write(addr,data))
+
+if __name__ == "__main__":
+    import sys
+    vid=0x2BEF
+    pid=0x0415
+    if len(sys.argv) == 5 and sys.argv[1] == "read":
+        with HidSession(vid, pid) as s, open(sys.argv[4], "wb") as f:
+            n=SpiFlash(s).read_to_file(int(sys.argv[2],0),int(sys.argv[3],0),f)
+        sys.exit(0 if n >= 0 else 1)
+    elif len(sys.argv) == 4 and sys.argv[1] == "write":
+        with HidSession(vid, pid) as s, open(sys.argv[3], "rb") as f:
+            stats=SpiFlash(s).write_from_file(int(sys.argv[2],0),f)
+        print(stats)
+        sys.exit(0 if stats is not None else 1)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.qhidspi read <addr> <length> <file>")
+        print("\t python -m model.qhidspi write <addr> <file>")
+        sys.exit(1)
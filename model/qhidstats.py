@@ -0,0 +1,224 @@
+import json
+import bisect
+import weakref
+import threading
+from model.qhidapi import *
+
+# Upper bounds of the latency histogram buckets, unit:s. The last bucket is +Inf.
+HIDSTATS_LATENCY_BUCKETS=(0.0005,0.001,0.002,0.005,0.01,0.02,0.05,0.1,0.2,0.5,1.0,2.0,5.0)
+HIDSTATS_RSP_TIMEOUT="TIMEOUT"
+HIDSTATS_RSP_IO_ERROR="IO_ERROR"
+HIDSTATS_PROMETHEUS_PREFIX="qhid"
+
+HIDSTATS_CMD_ENUM={
+    HID_REPORID_TYPE.RID_SYS.value  : HID_SYSCMD_TYPE,
+    HID_REPORID_TYPE.RID_FW.value   : HID_FWCMD_TYPE,
+    HID_REPORID_TYPE.RID_BUSIO.value: HID_IOBUSCMD_TYPE,
+}
+HIDSTATS_ACT_ENUM={
+    HID_REPORID_TYPE.RID_FW.value   : HID_FWACT_TYPE,
+    HID_REPORID_TYPE.RID_BUSIO.value: HID_IOBUSACT_TYPE,
+}
+
+def hidstats_code_name(enum_type, value:int)->str:
+    if enum_type is not None:
+        try:
+            return(enum_type(value).name)
+        except ValueError:
+            pass
+    return(str(value))
+
+def hidstats_labels(key:tuple)->dict:
+    """Readable labels of a (rid, cmd, act, component) stats key."""
+    rid,cmd,act,component=key
+    return({'rid':hidstats_code_name(HID_REPORID_TYPE,rid),
+            'cmd':hidstats_code_name(HIDSTATS_CMD_ENUM.get(rid),cmd),
+            'act':hidstats_code_name(HIDSTATS_ACT_ENUM.get(rid),act) if rid in HIDSTATS_ACT_ENUM else '',
+            'component':'' if component is None else str(component)})
+
+def hidstats_rsp_name(hid_data:list)->str:
+    if hid_data is None:
+        return(HIDSTATS_RSP_IO_ERROR)
+    if not hid_data:
+        return(HIDSTATS_RSP_TIMEOUT)
+    return(hidstats_code_name(HID_APIRESPONE_TYPE,hid_data[HID_RSP_OFFSET]))
+
+class HidCommandStats:
+    """Counters of one (rid, cmd, act, component) key."""
+
+    def __init__(self, buckets:int):
+        self.count=0
+        self.bytes_out=0
+        self.bytes_in=0
+        self.seconds=0.0
+        self.responses={}           # response name -> count
+        self.histogram=[0]*(buckets+1) # per bucket, not cumulative; last is +Inf
+
+class HidStats:
+    """Per-command HID transaction statistics, fed by HID_TRANSACTION_HOOKS.
+
+    Every report written by HidSession/AsyncHidDevice is counted per report
+    ID, command, action and FW update component, with its write-to-response
+    latency in a histogram, the response code (ACK/NACK/WAIT/DEFER/REENUM,
+    TIMEOUT, IO_ERROR) and the bytes moved. The component is taken from the
+    last FW_ACT_INIT of the session, so FW_ACT_WBUF data reports are
+    attributed to the component being updated. While disabled no hook is
+    registered and HidSession doesn't read the clock.
+
+        stats=HidStats().enable()
+        fwup_update_device(vid, pid, imageFile)
+        print(stats.to_prometheus())
+
+    Args:
+        buckets (tuple, optional): histogram upper bounds, unit:s. Defaults to HIDSTATS_LATENCY_BUCKETS.
+    """
+
+    def __init__(self, buckets:tuple=HIDSTATS_LATENCY_BUCKETS):
+        self.buckets=tuple(buckets)
+        self.lock=threading.Lock()
+        self.commands={}                            # key -> HidCommandStats
+        self.components=weakref.WeakKeyDictionary() # session -> component under FW update
+        self.hooks=[]                               # extra hook(key, hid_pkt, hid_data, seconds)
+
+    def enable(self):
+        hidapi_add_transaction_hook(self.record)
+        return(self)
+
+    def disable(self):
+        hidapi_remove_transaction_hook(self.record)
+
+    def is_enabled(self)->bool:
+        return(self.record in HID_TRANSACTION_HOOKS)
+
+    def __enter__(self):
+        return(self.enable())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+        return(False)
+
+    def add_hook(self, hook):
+        """hook(key, hid_pkt, hid_data, seconds) is called after every recorded transaction."""
+        if hook not in self.hooks:
+            self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def reset(self):
+        with self.lock:
+            self.commands={}
+
+    def component_of(self, session, hid_pkt:list)->int:
+        """Component under update for FW_CMD_FW_UPDATE reports, None otherwise."""
+        if (hid_pkt[HID_RID_OFFSET]!=HID_REPORID_TYPE.RID_FW.value or
+            hid_pkt[HID_CMD_OFFSET]!=HID_FWCMD_TYPE.FW_CMD_FW_UPDATE.value):
+            return(None)
+        if hid_pkt[HID_ACT_OFFSET]==HID_FWACT_TYPE.FW_ACT_INIT.value:
+            self.components[session]=hid_pkt[HID_DATA_OFFSET]
+        return(self.components.get(session))
+
+    def record(self, session, hid_pkt:list, hid_data:list, seconds:float):
+        """Transaction hook, see HID_TRANSACTION_HOOKS."""
+        rsp=hidstats_rsp_name(hid_data)
+        with self.lock:
+            component=self.component_of(session,hid_pkt)
+            key=(hid_pkt[HID_RID_OFFSET],hid_pkt[HID_CMD_OFFSET],hid_pkt[HID_ACT_OFFSET],component)
+            stats=self.commands.get(key)
+            if stats is None:
+                stats=self.commands[key]=HidCommandStats(len(self.buckets))
+            stats.count +=1
+            stats.bytes_out +=len(hid_pkt)
+            stats.bytes_in +=len(hid_data) if hid_data else 0
+            stats.seconds +=seconds
+            stats.responses[rsp]=stats.responses.get(rsp,0)+1
+            stats.histogram[bisect.bisect_left(self.buckets,seconds)] +=1
+        for hook in self.hooks:
+            hook(key,hid_pkt,hid_data,seconds)
+
+    def snapshot(self)->list:
+        """Copy of the counters.
+
+        Returns:
+            list: [{'labels','count','bytes_out','bytes_in','seconds','responses','histogram'}, ...],
+                histogram is [(upper bound, cumulative count), ...] ending with ('+Inf', count)
+        """
+        with self.lock:
+            items=[(key,stats.count,stats.bytes_out,stats.bytes_in,stats.seconds,dict(stats.responses),list(stats.histogram))
+                   for key,stats in self.commands.items()]
+        snapshot=[]
+        for key,count,bytes_out,bytes_in,seconds,responses,histogram in sorted(items,key=lambda item: str(item[0])):
+            cumulative=0
+            buckets=[]
+            for bound,n in zip(self.buckets+('+Inf',),histogram):
+                cumulative +=n
+                buckets.append((bound,cumulative))
+            snapshot.append({'labels':hidstats_labels(key),'count':count,'bytes_out':bytes_out,'bytes_in':bytes_in,
+                             'seconds':seconds,'responses':responses,'histogram':buckets})
+        return(snapshot)
+
+    def component_seconds(self)->list:
+        """Transaction time per FW update component, largest first (pipelined reports overlap).
+
+        Returns:
+            list: [(component id, seconds, bytes_out), ...]
+        """
+        totals={}
+        with self.lock:
+            for key,stats in self.commands.items():
+                if key[3] is not None:
+                    seconds,nbytes=totals.get(key[3],(0.0,0))
+                    totals[key[3]]=(seconds+stats.seconds,nbytes+stats.bytes_out)
+        return(sorted(((component,seconds,nbytes) for component,(seconds,nbytes) in totals.items()),
+                      key=lambda item: item[1],reverse=True))
+
+    def to_json(self, indent:int=None)->str:
+        return(json.dumps(self.snapshot(),indent=indent))
+
+    def to_prometheus(self, prefix:str=HIDSTATS_PROMETHEUS_PREFIX)->str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        def labels(base:dict, **extra)->str:
+            items=list(base.items())+list(extra.items())
+            return("{"+",".join('%s="%s"' % (name,value) for name,value in items)+"}")
+
+        snapshot=self.snapshot()
+        lines=["# HELP %s_transactions_total HID reports written." % prefix,
+               "# TYPE %s_transactions_total counter" % prefix]
+        lines+=["%s_transactions_total%s %d" % (prefix,labels(entry['labels']),entry['count']) for entry in snapshot]
+        lines+=["# HELP %s_responses_total HID reports per response code." % prefix,
+                "# TYPE %s_responses_total counter" % prefix]
+        for entry in snapshot:
+            for rsp,n in sorted(entry['responses'].items()):
+                lines.append("%s_responses_total%s %d" % (prefix,labels(entry['labels'],rsp=rsp),n))
+        lines+=["# HELP %s_bytes_total HID report bytes moved." % prefix,
+                "# TYPE %s_bytes_total counter" % prefix]
+        for entry in snapshot:
+            lines.append("%s_bytes_total%s %d" % (prefix,labels(entry['labels'],direction="out"),entry['bytes_out']))
+            lines.append("%s_bytes_total%s %d" % (prefix,labels(entry['labels'],direction="in"),entry['bytes_in']))
+        lines+=["# HELP %s_latency_seconds Write-to-response latency." % prefix,
+                "# TYPE %s_latency_seconds histogram" % prefix]
+        for entry in snapshot:
+            for bound,n in entry['histogram']:
+                lines.append("%s_latency_seconds_bucket%s %d" % (prefix,labels(entry['labels'],le=bound),n))
+            lines.append("%s_latency_seconds_sum%s %.6f" % (prefix,labels(entry['labels']),entry['seconds']))
+            lines.append("%s_latency_seconds_count%s %d" % (prefix,labels(entry['labels']),entry['count']))
+        return("\n".join(lines)+"\n")
+
+if __name__ == "__main__":
+    import sys
+    from model.qhidfwup import fwup_update_device
+    if len(sys.argv) in (2,3) and (len(sys.argv) == 2 or sys.argv[2] in ("json","prom")):
+        vid=0x2BEF
+        pid=0x0415
+        with HidStats() as stats:
+            result=fwup_update_device(vid, pid, sys.argv[1])
+        for component,seconds,nbytes in stats.component_seconds():
+            print("[INFO] component %d: %.3f s, %d bytes" % (component,seconds,nbytes))
+        if len(sys.argv) == 3:
+            print(stats.to_json(2) if sys.argv[2] == "json" else stats.to_prometheus())
+        sys.exit(0 if result is not None else 1)
+    else:
+        print("<ERROR> Wrong input.")
+        print("Help:\n\t python -m model.qhidstats <image> [json|prom]")
+        sys.exit(1)
@@ -0,0 +1,251 @@
+import time
+import threading
+from model.qhidapi import *
+
+UART_DEFAULT_BAUDRATE=115200
+UART_RX_BUFFER_SIZE=256*1024    # host ring buffer
+UART_POLL_INTERVAL_MIN=0.001    # unit:s, reader poll delay while data is flowing
+UART_POLL_INTERVAL_MAX=0.02     # unit:s, reader poll delay when the line is idle
+UART_PAYLOAD_MAX=HID_PACKET_PADLOAD_SIZE-1 # data bytes per report, [0] is the length
+
+# IOBUS_CMD_UART payload layout per action:
+# IOBUS_ACT_INIT   [0-3] Baud rate (little-endian) [4] Data bits [5] Parity (0:none 1:odd 2:even) [6] Stop bits
+# IOBUS_ACT_DEINIT -
+# IOBUS_ACT_WRITE  [0] Length N [1..N] data
+# IOBUS_ACT_READ   [0] Maximum length, response [4] Length N [5..4+N] data
+
+class UartRingBuffer:
+    """Fixed size byte FIFO, the oldest bytes are dropped on overflow."""
+
+    def __init__(self, capacity:int):
+        self.buf=bytearray(capacity)
+        self.capacity=capacity
+        self.head=0 # read position
+        self.size=0
+        self.overflow=0
+        self.consumed=0 # bytes ever removed from the head, read or dropped
+
+    def __len__(self)->int:
+        return(self.size)
+
+    def write(self, data):
+        n=len(data)
+        if n > self.capacity:
+            self.overflow +=n-self.capacity
+            data=data[n-self.capacity:]
+            n=self.capacity
+        drop=max(0,self.size+n-self.capacity)
+        if drop:
+            self.overflow +=drop
+            self.head=(self.head+drop)%self.capacity
+            self.size -=drop
+            self.consumed +=drop
+        tail=(self.head+self.size)%self.capacity
+        first=min(n,self.capacity-tail)
+        self.buf[tail:tail+first]=data[:first]
+        self.buf[0:n-first]=data[first:]
+        self.size +=n
+
+    def peek(self, n:int)->bytes:
+        n=min(n,self.size)
+        first=min(n,self.capacity-self.head)
+        return(bytes(self.buf[self.head:self.head+first])+bytes(self.buf[0:n-first]))
+
+    def read(self, n:int)->bytes:
+        data=self.peek(n)
+        self.head=(self.head+len(data))%self.capacity
+        self.size -=len(data)
+        self.consumed +=len(data)
+        return(data)
+
+    def find(self, sub:bytes, start:int=0)->int:
+        """Offset of sub at or after start, -1 if missing; searched in place in the two spans."""
+        n=len(sub)
+        start=max(0,start)
+        if start+n > self.size:
+            return(-1)
+        first=min(self.size,self.capacity-self.head) # buf[head:head+first], then buf[0:size-first]
+        if start < first:
+            pos=self.buf.find(sub,self.head+start,self.head+first)
+            if pos >= 0:
+                return(pos-self.head)
+            if n > 1 and self.size > first: # match across the wrap
+                lo=max(start,first-n+1)
+                edge=bytes(self.buf[self.head+lo:self.head+first])+bytes(self.buf[0:min(n-1,self.size-first)])
+                pos=edge.find(sub)
+                if pos >= 0:
+                    return(lo+pos)
+        if self.size > first:
+            pos=self.buf.find(sub,max(0,start-first),self.size-first)
+            if pos >= 0:
+                return(first+pos)
+        return(-1)
+
+class DockUart:
+    """UART bridge of the dock as a buffered, file-like byte stream.
+
+    A background thread polls IOBUS_ACT_READ and drains received bytes into a
+    ring buffer, backing off while the line is idle. write() coalesces
+    outgoing bytes: full payloads are sent at once, a partial tail is sent by
+    the background thread on its next poll (or by flush()). The session is
+    shared between the caller and the thread under a lock.
+
+        with HidSession(vid, pid) as s, DockUart(s, 115200) as uart:
+            uart.write(b"version\\r\\n")
+            print(uart.readline(timeout=1.0))
+
+    Args:
+        session (HidSession): opened dock session
+        baudrate (int, optional): Defaults to UART_DEFAULT_BAUDRATE.
+        rx_buffer_size (int, optional): ring buffer size. Defaults to UART_RX_BUFFER_SIZE.
+    """
+
+    def __init__(self, session:HidSession, baudrate:int=UART_DEFAULT_BAUDRATE, data_bits:int=8,
+                 parity:int=0, stop_bits:int=1, rx_buffer_size:int=UART_RX_BUFFER_SIZE):
+        self.session=session
+        self.baudrate=baudrate
+        self.data_bits=data_bits
+        self.parity=parity
+        self.stop_bits=stop_bits
+        self.rx=UartRingBuffer(rx_buffer_size)
+        self.tx=bytearray()
+        self.io_lock=threading.Lock()       # session access
+        self.rx_ready=threading.Condition() # rx ring buffer
+        self.tx_lock=threading.Lock()
+        self.thread=None
+        self.running=False
+        self.rx_bytes=0
+        self.tx_bytes=0
+        self.tx_reports=0
+
+    def iobus(self, act:HID_IOBUSACT_TYPE, payload:list=None)->list:
+        with self.io_lock:
+            hid_data=self.session.send_iobus_command(HID_IOBUSCMD_TYPE.IOBUS_CMD_UART,act,payload)
+        if hid_data is None or hid_data[HID_RSP_OFFSET]!=HID_APIRESPONE_TYPE.HIDAPI_ACK.value:
+            return(None)
+        return(hid_data)
+
+    def set_baudrate(self, baudrate:int)->bool:
+        payload=[baudrate&0xFF,(baudrate>>8)&0xFF,(baudrate>>16)&0xFF,(baudrate>>24)&0xFF,
+                 self.data_bits,self.parity,self.stop_bits]
+        if self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_INIT,payload) is None:
+            return(False)
+        self.baudrate=baudrate
+        return(True)
+
+    def open(self):
+        """Configure the UART and start the reader, raise IOError if it fails."""
+        if self.running:
+            return(self)
+        if not self.set_baudrate(self.baudrate):
+            raise IOError("UART init failed")
+        self.running=True
+        self.thread=threading.Thread(target=self.run,name="DockUart",daemon=True)
+        self.thread.start()
+        return(self)
+
+    def close(self):
+        if not self.running:
+            return
+        self.flush()
+        self.running=False
+        self.thread.join()
+        self.thread=None
+        self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_DEINIT)
+
+    def __enter__(self):
+        return(self.open())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return(False)
+
+    def poll_rx(self)->int:
+        hid_data=self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_READ,[UART_PAYLOAD_MAX])
+        if hid_data is None:
+            return(0)
+        n=min(hid_data[HID_DATA_OFFSET],UART_PAYLOAD_MAX)
+        if n:
+            with self.rx_ready:
+                self.rx.write(bytes(hid_data[HID_DATA_OFFSET+1:HID_DATA_OFFSET+1+n]))
+                self.rx_bytes +=n
+                self.rx_ready.notify_all()
+        return(n)
+
+    def send_tx(self, full_only:bool)->bool:
+        """Send pending bytes, only whole UART_PAYLOAD_MAX payloads when full_only."""
+        with self.tx_lock:
+            while self.tx and (len(self.tx) >= UART_PAYLOAD_MAX or not full_only):
+                chunk=bytes(self.tx[:UART_PAYLOAD_MAX])
+                if self.iobus(HID_IOBUSACT_TYPE.IOBUS_ACT_WRITE,[len(chunk)]+list(chunk)) is None:
+                    return(False)
+                del self.tx[:len(chunk)]
+                self.tx_bytes +=len(chunk)
+                self.tx_reports +=1
+        return(True)
+
+    def run(self):
+        interval=UART_POLL_INTERVAL_MIN
+        while self.running:
+            self.send_tx(False)
+            if self.poll_rx() == UART_PAYLOAD_MAX:
+                interval=UART_POLL_INTERVAL_MIN
+                continue # device has more queued
+            time.sleep(interval)
+            interval=min(interval*2,UART_POLL_INTERVAL_MAX)
+
+    def write(self, data)->int:
+        with self.tx_lock:
+            self.tx.extend(data)
+        if not self.send_tx(True):
+            raise IOError("UART write failed")
+        return(len(data))
+
+    def flush(self):
+        if not self.send_tx(False):
+            raise IOError("UART write failed")
+
+    def in_waiting(self)->int:
+        with self.rx_ready:
+            return(len(self.rx))
+
+    def read(self, size:int=-1, timeout:float=None)->bytes:
+        """Read up to size bytes (all buffered when size<0), wait up to timeout for the first byte."""
+        with self.rx_ready:
+            self.rx_ready.wait_for(lambda: len(self.rx) > 0 or not self.running,timeout)
+            return(self.rx.read(len(self.rx) if size < 0 else size))
+
+    def readline(self, timeout:float=None)->bytes:
+        """Read up to and including b'\\n', partial line when timeout expires."""
+        deadline=None if timeout is None else time.monotonic()+timeout
+        with self.rx_ready:
+            scanned=self.rx.consumed # stream position searched so far, survives reads and overflow
+            while True:
+                pos=self.rx.find(b'\n',scanned-self.rx.consumed)
+                if pos >= 0:
+                    return(self.rx.read(pos+1))
+                scanned=self.rx.consumed+len(self.rx)
+                remain=None if deadline is None else deadline-time.monotonic()
+                if not self.running or (remain is not None and remain <= 0):
+                    return(self.rx.read(len(self.rx)))
+                self.rx_ready.wait(remain)
+
+    def stats(self)->dict:
+        return({'rx_bytes':self.rx_bytes,'tx_bytes':self.tx_bytes,'tx_reports':self.tx_reports,
+                'rx_overflow':self.rx.overflow})
+
+if __name__ == "__main__":
+    import sys
+    vid=0x2BEF
+    pid=0x0415
+    baudrate=int(sys.argv[1]) if len(sys.argv) == 2 else UART_DEFAULT_BAUDRATE
+    with HidSession(vid, pid) as s, DockUart(s,baudrate) as uart:
+        try:
+            while True:
+                line=uart.readline(timeout=1.0)
+                if line:
+                    sys.stdout.write(line.decode('utf-8','replace'))
+                    sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+        print(uart.stats())
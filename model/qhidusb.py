@@ -0,0 +1,433 @@
+import time
+import ctypes
+import threading
+import collections
+import model.qhidapi as qhidapi
+from model.qhiddef import *
+
+HIDUSB_IN_TRANSFERS=8       # interrupt IN transfers kept submitted
+HIDUSB_OUT_TRANSFERS=8      # interrupt OUT transfers in flight before write() blocks
+HIDUSB_EVENT_TIMEOUT=0.1    # unit:s, libusb event loop wakeup, bounds close() latency
+HIDUSB_HID_CLASS=3
+HIDUSB_PATH_PREFIX=b"usb:"  # path: b"usb:<bus>:<address>:<interface>"
+HIDUSB_SYNC_WRITE_TIMEOUT=1000 # unit:ms, interrupt OUT timeout without asynchronous transfers
+# libusb functions of the asynchronous transfer path, next to the pyusb internals
+# (pinned pyusb version in requirements.txt) checked by hidusb_async_supported()
+HIDUSB_LIBUSB_ASYNC_API=('libusb_alloc_transfer','libusb_submit_transfer','libusb_cancel_transfer',
+                         'libusb_free_transfer','libusb_handle_events_timeout')
+
+# libusb_transfer_type / libusb_transfer_status
+HIDUSB_TRANSFER_TYPE_INTERRUPT=3
+HIDUSB_TRANSFER_COMPLETED=0
+HIDUSB_TRANSFER_CANCELLED=3
+HIDUSB_TRANSFER_NO_DEVICE=5
+# HID class request SET_REPORT, used when the interface has no interrupt OUT endpoint
+HIDUSB_SET_REPORT_REQUEST_TYPE=0x21
+HIDUSB_SET_REPORT=0x09
+HIDUSB_REPORT_TYPE_OUTPUT=0x02
+
+class HidusbTimeval(ctypes.Structure):
+    _fields_=[('tv_sec',ctypes.c_long),('tv_usec',ctypes.c_long)]
+
+class LibusbHidDevice:
+    """hid.device compatible dock handle on pyusb's libusb1 backend.
+
+    The HID interface is claimed directly and reports move as asynchronous
+    libusb interrupt transfers: HIDUSB_IN_TRANSFERS IN transfers stay
+    submitted all the time and are resubmitted from their completion
+    callback, write() submits an OUT transfer and returns, so up to
+    HIDUSB_OUT_TRANSFERS reports are on the bus at once. One event thread
+    runs the callbacks, so reports are queued in arrival order.
+
+    The transfer structures and library handle are pyusb libusb1 backend
+    internals (usb.backend.libusb1). When hidusb_async_supported() finds them
+    missing, reports move synchronously through dev.read()/dev.write() with
+    the endpoint timeout instead, one at a time.
+
+    Args:
+        backend: pyusb libusb1 backend
+        in_transfers (int, optional): Defaults to HIDUSB_IN_TRANSFERS.
+        out_transfers (int, optional): Defaults to HIDUSB_OUT_TRANSFERS.
+        async_transfers (bool, optional): use asynchronous transfers. Defaults to True.
+    """
+
+    def __init__(self, backend, in_transfers:int=HIDUSB_IN_TRANSFERS, out_transfers:int=HIDUSB_OUT_TRANSFERS,
+                 async_transfers:bool=True):
+        from usb.backend import libusb1
+        self.libusb1=libusb1
+        self.backend=backend
+        self.async_transfers=async_transfers
+        self.in_count=in_transfers
+        self.out_count=out_transfers
+        self.dev=None
+        self.intf=None
+        self.ep_in=None
+        self.ep_out=None
+        self.detached=False
+        self.nonblocking=0
+        self.cond=threading.Condition()
+        self.reports=collections.deque()
+        self.error=None
+        self.closing=False
+        self.submitted=0
+        self.transfers=[]       # (transfer pointer, buffer, callback) kept alive while open
+        self.out_free=collections.deque()
+        self.out_slots=None
+        self.thread=None
+
+    # -- open / close --
+
+    def open(self, vid:int=0, pid:int=0, serial_number:str=None):
+        import usb.core
+        for dev in usb.core.find(find_all=True,idVendor=vid,idProduct=pid,backend=self.backend):
+            if serial_number is not None and hidusb_get_string(dev,dev.iSerialNumber)!=serial_number:
+                continue
+            return(self.attach(dev,None))
+        raise IOError("open failed")
+
+    def open_path(self, path:bytes):
+        import usb.core
+        try:
+            bus,address,interface_number=(int(field) for field in path[len(HIDUSB_PATH_PREFIX):].split(b":"))
+        except ValueError:
+            raise IOError("invalid path: %r" % path)
+        dev=usb.core.find(bus=bus,address=address,backend=self.backend)
+        if dev is None:
+            raise IOError("open failed")
+        return(self.attach(dev,interface_number))
+
+    def attach(self, dev, interface_number:int):
+        import usb.core
+        import usb.util
+        try:
+            try:
+                cfg=dev.get_active_configuration()
+            except usb.core.USBError:
+                dev.set_configuration()
+                cfg=dev.get_active_configuration()
+            intf=hidusb_find_interface(cfg,interface_number)
+            if intf is None:
+                raise IOError("no HID interface")
+            try:
+                if dev.is_kernel_driver_active(intf.bInterfaceNumber):
+                    dev.detach_kernel_driver(intf.bInterfaceNumber)
+                    self.detached=True
+            except (NotImplementedError,usb.core.USBError):
+                pass # no kernel driver concept (Windows) or not permitted
+            usb.util.claim_interface(dev,intf.bInterfaceNumber)
+            self.dev=dev
+            self.intf=intf
+            for ep in intf:
+                if usb.util.endpoint_type(ep.bmAttributes)!=usb.util.ENDPOINT_TYPE_INTR:
+                    continue
+                if usb.util.endpoint_direction(ep.bEndpointAddress)==usb.util.ENDPOINT_IN:
+                    self.ep_in=self.ep_in or ep
+                else:
+                    self.ep_out=self.ep_out or ep
+            if self.ep_in is None:
+                raise IOError("no interrupt IN endpoint")
+            self.start()
+        except usb.core.USBError as ex:
+            self.close()
+            raise IOError(str(ex))
+        except IOError:
+            self.close()
+            raise
+
+    def start(self):
+        if not self.async_transfers:
+            return
+        libusb1=self.libusb1
+        lib=self.backend.lib
+        try:
+            self.dev._ctx.managed_open()
+            handle=self.dev._ctx.handle.handle
+        except AttributeError: # pyusb internals changed
+            self.async_transfers=False
+            return
+        lib.libusb_cancel_transfer.argtypes=[ctypes.POINTER(libusb1._libusb_transfer)]
+        lib.libusb_handle_events_timeout.argtypes=[ctypes.c_void_p,ctypes.POINTER(HidusbTimeval)]
+        for index in range(0,self.in_count):
+            self.transfers.append(self.alloc(handle,self.ep_in,self.in_complete,index))
+        if self.ep_out is not None:
+            for index in range(self.in_count,self.in_count+self.out_count):
+                self.out_free.append(index)
+                self.transfers.append(self.alloc(handle,self.ep_out,self.out_complete,index))
+        self.out_slots=threading.Semaphore(len(self.out_free))
+        self.closing=False
+        self.thread=threading.Thread(target=self.event_loop,name="hidusb-events",daemon=True)
+        self.thread.start()
+        with self.cond:
+            for index in range(0,self.in_count):
+                self.submit(self.transfers[index][0])
+
+    def alloc(self, handle, ep, complete, index:int)->tuple:
+        libusb1=self.libusb1
+        size=ep.wMaxPacketSize
+        transfer=self.backend.lib.libusb_alloc_transfer(0)
+        buf=ctypes.create_string_buffer(size)
+        callback=libusb1._libusb_transfer_cb_fn_p(lambda transfer_p: complete(index,transfer_p))
+        t=transfer.contents
+        t.dev_handle=handle
+        t.endpoint=ep.bEndpointAddress
+        t.type=HIDUSB_TRANSFER_TYPE_INTERRUPT
+        t.timeout=0
+        t.buffer=ctypes.cast(buf,ctypes.c_void_p)
+        t.length=size
+        t.callback=callback
+        t.num_iso_packets=0
+        return((transfer,buf,callback))
+
+    def submit(self, transfer):
+        """Submit one transfer, caller holds self.cond."""
+        ret=self.backend.lib.libusb_submit_transfer(transfer)
+        if ret < 0:
+            raise IOError("libusb_submit_transfer: %d" % ret)
+        self.submitted +=1
+
+    def event_loop(self):
+        tv=HidusbTimeval(0,int(HIDUSB_EVENT_TIMEOUT*1e6))
+        lib=self.backend.lib
+        while True:
+            with self.cond:
+                if self.closing and self.submitted == 0:
+                    return
+            lib.libusb_handle_events_timeout(self.backend.ctx,ctypes.byref(tv))
+
+    def fail(self, status:int):
+        """Record a transfer error, caller holds self.cond."""
+        if self.error is None and not self.closing:
+            self.error=IOError("device disconnected" if status==HIDUSB_TRANSFER_NO_DEVICE else
+                               "interrupt transfer failed: %d" % status)
+
+    def in_complete(self, index:int, transfer_p):
+        t=transfer_p.contents
+        with self.cond:
+            self.submitted -=1
+            if t.status==HIDUSB_TRANSFER_COMPLETED:
+                self.reports.append(ctypes.string_at(t.buffer,t.actual_length))
+                if not self.closing:
+                    try:
+                        self.submit(transfer_p)
+                    except IOError as ex:
+                        self.error=self.error or ex
+            elif t.status!=HIDUSB_TRANSFER_CANCELLED:
+                self.fail(t.status)
+            self.cond.notify_all()
+
+    def out_complete(self, index:int, transfer_p):
+        t=transfer_p.contents
+        with self.cond:
+            self.submitted -=1
+            if t.status!=HIDUSB_TRANSFER_COMPLETED and t.status!=HIDUSB_TRANSFER_CANCELLED:
+                self.fail(t.status)
+            self.out_free.append(index)
+            self.cond.notify_all()
+        self.out_slots.release()
+
+    def close(self):
+        import usb.util
+        if self.thread is not None:
+            lib=self.backend.lib
+            with self.cond:
+                self.closing=True
+                for transfer,buf,callback in self.transfers:
+                    lib.libusb_cancel_transfer(transfer) # not submitted: LIBUSB_ERROR_NOT_FOUND, ignored
+            self.thread.join()
+            self.thread=None
+        for transfer,buf,callback in self.transfers:
+            self.backend.lib.libusb_free_transfer(transfer)
+        self.transfers=[]
+        self.out_free.clear()
+        if self.dev is not None:
+            try:
+                if self.intf is not None:
+                    usb.util.release_interface(self.dev,self.intf.bInterfaceNumber)
+                    if self.detached:
+                        self.dev.attach_kernel_driver(self.intf.bInterfaceNumber)
+            except Exception: # device already gone
+                pass
+            usb.util.dispose_resources(self.dev)
+            self.dev=None
+        self.intf=None
+        self.ep_in=None
+        self.ep_out=None
+        self.detached=False
+
+    # -- hid.device interface --
+
+    def set_nonblocking(self, value:int):
+        self.nonblocking=value
+
+    def write(self, buff)->int:
+        if self.dev is None:
+            raise IOError("device not open")
+        data=bytes(buff)
+        if self.ep_out is None:
+            report_id=data[0] if data else 0
+            return(self.dev.ctrl_transfer(HIDUSB_SET_REPORT_REQUEST_TYPE,HIDUSB_SET_REPORT,
+                                          (HIDUSB_REPORT_TYPE_OUTPUT<<8)|report_id,
+                                          self.intf.bInterfaceNumber,data))
+        if not self.async_transfers:
+            import usb.core
+            try:
+                return(self.dev.write(self.ep_out.bEndpointAddress,data,HIDUSB_SYNC_WRITE_TIMEOUT))
+            except usb.core.USBError as ex:
+                raise IOError(str(ex))
+        self.out_slots.acquire()
+        with self.cond:
+            if self.error is not None:
+                self.out_slots.release()
+                raise self.error
+            transfer,buf,callback=self.transfers[self.out_free.popleft()]
+            n=min(len(data),len(buf))
+            ctypes.memmove(buf,data,n)
+            transfer.contents.length=n
+            self.submit(transfer)
+        return(n)
+
+    def read(self, max_length:int, timeout_ms:int=0)->list:
+        if self.dev is None:
+            raise IOError("device not open")
+        if not self.async_transfers:
+            return(self.read_sync(max_length,timeout_ms))
+        if timeout_ms > 0:
+            deadline=time.monotonic()+timeout_ms/1000.0
+        elif self.nonblocking:
+            deadline=0.0
+        else:
+            deadline=None
+        with self.cond:
+            while not self.reports:
+                if self.error is not None:
+                    raise self.error
+                if deadline is None:
+                    self.cond.wait()
+                    continue
+                remain=deadline-time.monotonic()
+                if remain <= 0:
+                    return([])
+                self.cond.wait(remain)
+            return(list(self.reports.popleft()[:max_length]))
+
+    def read_sync(self, max_length:int, timeout_ms:int)->list:
+        """Blocking dev.read(); non-blocking mode waits one endpoint polling interval (bInterval)."""
+        import usb.core
+        if timeout_ms > 0:
+            timeout=timeout_ms
+        elif self.nonblocking:
+            timeout=max(1,self.ep_in.bInterval)
+        else:
+            timeout=0 # libusb: no timeout
+        try:
+            data=self.dev.read(self.ep_in.bEndpointAddress,self.ep_in.wMaxPacketSize,timeout)
+        except usb.core.USBTimeoutError:
+            return([])
+        except usb.core.USBError as ex:
+            raise IOError(str(ex))
+        return(list(data[:max_length]))
+
+    def get_manufacturer_string(self)->str:
+        return(hidusb_get_string(self.dev,self.dev.iManufacturer))
+
+    def get_product_string(self)->str:
+        return(hidusb_get_string(self.dev,self.dev.iProduct))
+
+    def get_serial_number_string(self)->str:
+        return(hidusb_get_string(self.dev,self.dev.iSerialNumber))
+
+def hidusb_get_string(dev, index:int)->str:
+    """String descriptor, '' when missing or not readable (permissions)."""
+    import usb.core
+    import usb.util
+    if not index:
+        return('')
+    try:
+        return(usb.util.get_string(dev,index) or '')
+    except (usb.core.USBError,ValueError,NotImplementedError):
+        return('')
+
+def hidusb_async_supported(backend)->bool:
+    """True when the pyusb/libusb internals behind asynchronous transfers are present."""
+    try:
+        import usb.core
+        from usb.backend import libusb1
+    except ImportError:
+        return(False)
+    if not (hasattr(libusb1,'_libusb_transfer') and hasattr(libusb1,'_libusb_transfer_cb_fn_p')):
+        return(False)
+    if not hasattr(getattr(usb.core,'_ResourceManager',None),'managed_open'):
+        return(False)
+    lib=getattr(backend,'lib',None)
+    if lib is None or not hasattr(backend,'ctx'):
+        return(False)
+    return(all(hasattr(lib,name) for name in HIDUSB_LIBUSB_ASYNC_API))
+
+def hidusb_find_interface(cfg, interface_number:int=None):
+    for intf in cfg:
+        if intf.bInterfaceClass!=HIDUSB_HID_CLASS or intf.bAlternateSetting!=0:
+            continue
+        if interface_number is None or intf.bInterfaceNumber==interface_number:
+            return(intf)
+    return(None)
+
+class LibusbHidModule:
+    """Stand-in for the `hid` module on the libusb transport: device() and enumerate().
+
+    Args:
+        in_transfers (int, optional): queued interrupt IN transfers per device. Defaults to HIDUSB_IN_TRANSFERS.
+        out_transfers (int, optional): interrupt OUT transfers in flight per device. Defaults to HIDUSB_OUT_TRANSFERS.
+    """
+
+    def __init__(self, in_transfers:int=HIDUSB_IN_TRANSFERS, out_transfers:int=HIDUSB_OUT_TRANSFERS):
+        self.in_transfers=in_transfers
+        self.out_transfers=out_transfers
+        self.backend=qhidapi.hidapi_load_usb_backend()
+        if self.backend is None:
+            raise IOError("libusb backend not available")
+        self.async_transfers=hidusb_async_supported(self.backend)
+        if not self.async_transfers:
+            print("[WARN] pyusb internals not found, synchronous interrupt transfers")
+
+    def device(self)->LibusbHidDevice:
+        return(LibusbHidDevice(self.backend,self.in_transfers,self.out_transfers,self.async_transfers))
+
+    def enumerate(self, vendor_id:int=0, product_id:int=0)->list:
+        """hid.enumerate() compatible dicts, one per HID interface."""
+        import usb.core
+        match={}
+        if vendor_id:
+            match['idVendor']=vendor_id
+        if product_id:
+            match['idProduct']=product_id
+        devices=[]
+        for dev in usb.core.find(find_all=True,backend=self.backend,**match):
+            try:
+                cfg=dev.get_active_configuration()
+            except (usb.core.USBError,NotImplementedError):
+                try:
+                    cfg=dev.configurations()[0]
+                except (usb.core.USBError,IndexError):
+                    continue
+            hid_interfaces=[intf for intf in cfg if intf.bInterfaceClass==HIDUSB_HID_CLASS and intf.bAlternateSetting==0]
+            if not hid_interfaces:
+                continue
+            serial_number=hidusb_get_string(dev,dev.iSerialNumber)
+            manufacturer=hidusb_get_string(dev,dev.iManufacturer)
+            product=hidusb_get_string(dev,dev.iProduct)
+            for intf in hid_interfaces:
+                devices.append({'path':b"%s%d:%d:%d" % (HIDUSB_PATH_PREFIX,dev.bus,dev.address,intf.bInterfaceNumber),
+                                'vendor_id':dev.idVendor,'product_id':dev.idProduct,
+                                'serial_number':serial_number,'release_number':dev.bcdDevice,
+                                'manufacturer_string':manufacturer,'product_string':product,
+                                'usage_page':0,'usage':0,'interface_number':intf.bInterfaceNumber,'bus_type':1})
+        return(devices)
+
+HIDUSB_MODULE=None
+
+def hidusb_load()->LibusbHidModule:
+    """LibusbHidModule of the process, created on first use."""
+    global HIDUSB_MODULE
+    if HIDUSB_MODULE is None:
+        HIDUSB_MODULE=LibusbHidModule()
+    return(HIDUSB_MODULE)